@@ -0,0 +1,448 @@
+"""End-to-end load benchmark of the API, driven in-process through httpx.
+
+    python bench.py                               # all scenarios, in-memory backend
+    python bench.py --scenarios login,vets --requests 2000 --concurrency 50
+    python bench.py --json results/after.json --compare results/before.json
+    MONGO_URL=mongodb://localhost:27017 python bench.py --backend mongo
+
+Requests go through the ASGI app with its lifespan running, so middleware,
+session lookup, background tasks and the repositories are all exercised.
+The memory backend (DATA_BACKEND=memory) needs no mongod. With --backend
+mongo every run seeds fresh ids into DB_NAME (default `bench`) and leaves
+them there.
+
+Per scenario the report gives throughput, latency percentiles, status
+codes and the repository calls made (plus MongoDB commands on the mongo
+backend), both in total and per request. Background work such as chat
+summary flushes and dispatch sweeps is included in those counts.
+
+`login` runs with the password verification cache turned off, so every
+request pays for bcrypt; `login_cached` repeats logins of the same owners
+with the cache on. Both report their cache hits and misses.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import monitoring
+
+SCENARIOS = ["login", "login_cached", "vets", "appointments", "send_message", "get_messages", "emergency"]
+
+SPECIALTIES = ["General Practice", "Dogs", "Cats", "Exotic Pets", "Surgery", "Dentistry", "Dermatology", "Livestock"]
+LOCATIONS = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret"]
+
+PASSWORD = "bench-password"
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands by name for clients created after registration"""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+
+    def started(self, event):
+        self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class OpCounter:
+    """Counts and times every repository call, e.g. `messages.insert`"""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    def instrument(self, repos):
+        for repo_name, repo in vars(repos).items():
+            if repo_name == "backend":
+                continue
+            for method_name, method in inspect.getmembers(repo, inspect.iscoroutinefunction):
+                if not method_name.startswith("_"):
+                    setattr(repo, method_name, self._wrap(f"{repo_name}.{method_name}", method))
+
+    def _wrap(self, name: str, method: Callable[..., Awaitable]):
+        async def counted(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self.counts[name] += 1
+                self.seconds[name] += time.perf_counter() - started
+        return counted
+
+    def reset(self):
+        self.counts.clear()
+        self.seconds.clear()
+
+
+class Recorder:
+    """Latencies and status codes of the requests made during one scenario"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.unexpected = 0
+
+    async def call(self, client, method: str, url: str, expected=(200,), **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        self.statuses[response.status_code] += 1
+        if response.status_code not in expected:
+            self.unexpected += 1
+        return response
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(recorder: Recorder, elapsed: float, ops: OpCounter, commands: CommandCounter) -> Dict:
+    latencies = sorted(recorder.latencies)
+    requests = len(latencies)
+    db_ops = sum(ops.counts.values())
+    summary = {
+        "requests": requests,
+        "unexpected_status": recorder.unexpected,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / requests * 1000, 3) if requests else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "status_codes": {str(status): count for status, count in sorted(recorder.statuses.items())},
+        "db_ops": {
+            "total": db_ops,
+            "per_request": round(db_ops / requests, 2) if requests else 0.0,
+            "by_operation": dict(ops.counts.most_common()),
+            "ms_by_operation": {name: round(seconds * 1000, 1) for name, seconds in sorted(ops.seconds.items(), key=lambda item: -item[1])},
+        },
+    }
+    if commands.counts:
+        total = sum(commands.counts.values())
+        summary["mongo_commands"] = {
+            "total": total,
+            "per_request": round(total / requests, 2) if requests else 0.0,
+            "by_command": dict(commands.counts.most_common()),
+        }
+    return summary
+
+
+class Bench:
+    def __init__(self, server, client, args, ops: OpCounter, commands: CommandCounter):
+        self.server = server
+        self.client = client
+        self.args = args
+        self.ops = ops
+        self.commands = commands
+        self.rng = random.Random(args.seed)
+        self.run_id = f"{self.rng.getrandbits(32):08x}"
+        self.owners: List[Dict] = []
+        self.vets: List[Dict] = []
+        self.chat_id: Optional[str] = None
+
+    def headers(self, user: Dict) -> Dict:
+        return {"Authorization": f"Bearer {user['session_token']}"}
+
+    async def seed(self):
+        """Users, vet profiles, appointments and one chat with a long history, written through the repositories"""
+        repos = self.server.repos
+        hashed = await self.server.password_hasher.hash(PASSWORD)
+        now = datetime.now(timezone.utc)
+
+        async def add_user(index: int, user_type: str) -> Dict:
+            user = {
+                "user_id": f"user_bench{self.run_id}{user_type[0]}{index:06d}",
+                "email": f"bench{self.run_id}.{user_type}{index}@example.com",
+                "password": hashed,
+                "name": f"Bench {user_type} {index}",
+                "user_type": user_type,
+                "picture": None,
+                "created_at": now.isoformat()
+            }
+            await repos.users.insert(user)
+            user["session_token"] = await self.server.create_user_session(user["user_id"])
+            return user
+
+        self.owners = [await add_user(index, "pet_owner") for index in range(self.args.users)]
+        self.vets = [await add_user(index, "vet") for index in range(self.args.vets)]
+        for vet in self.vets:
+            latitude = -1.29 + self.rng.uniform(-0.2, 0.2)
+            longitude = 36.82 + self.rng.uniform(-0.2, 0.2)
+            await repos.vet_profiles.insert({
+                "user_id": vet["user_id"],
+                "license_number": f"KVB-{self.rng.randrange(100000):05d}",
+                "specialty": self.rng.choice(SPECIALTIES),
+                "location": self.rng.choice(LOCATIONS),
+                "phone": None,
+                "bio": None,
+                "experience_years": self.rng.randrange(30),
+                "latitude": latitude,
+                "longitude": longitude,
+                "available": True,
+                "rating": 0.0,
+                "created_at": now.isoformat(),
+                "geo": self.server.geo_point(latitude, longitude)
+            })
+
+        for index in range(self.args.appointments):
+            owner = self.owners[index % len(self.owners)]
+            vet = self.vets[self.rng.randrange(len(self.vets))]
+            await repos.appointments.insert({
+                "appointment_id": f"apt_bench{self.run_id}{index:07d}",
+                "pet_owner_id": owner["user_id"],
+                "vet_id": vet["user_id"],
+                "appointment_date": (now + timedelta(days=1 + index % 60)).date().isoformat(),
+                "appointment_time": "10:00",
+                "pet_name": "Rex",
+                "pet_type": "dog",
+                "reason": "Checkup",
+                "status": "pending",
+                "amount": 50.0,
+                "payment_status": "pending",
+                "created_at": (now - timedelta(seconds=self.args.appointments - index)).isoformat()
+            })
+
+        owner, vet = self.owners[0], self.vets[0]
+        self.chat_id = f"chat_bench{self.run_id}"
+        await repos.chats.insert({
+            "chat_id": self.chat_id,
+            "pet_owner_id": owner["user_id"],
+            "vet_id": vet["user_id"],
+            "last_message": None,
+            "last_message_at": None,
+            "created_at": (now - timedelta(days=1)).isoformat()
+        })
+        started = now - timedelta(seconds=self.args.history)
+        for index in range(self.args.history):
+            await repos.messages.insert({
+                "message_id": f"msg_bench{self.run_id}{index:07d}",
+                "chat_id": self.chat_id,
+                "sender_id": (owner if index % 2 else vet)["user_id"],
+                "content": f"History message {index}",
+                "created_at": (started + timedelta(seconds=index)).isoformat()
+            })
+
+    # One unit of work per scenario; `i` is the iteration number
+
+    async def scenario_login(self, recorder: Recorder, i: int):
+        owner = self.owners[i % len(self.owners)]
+        await recorder.call(self.client, "POST", "/api/auth/login", json={"email": owner["email"], "password": PASSWORD})
+
+    scenario_login_cached = scenario_login
+
+    async def scenario_vets(self, recorder: Recorder, i: int):
+        params = {"specialty": SPECIALTIES[i % len(SPECIALTIES)]} if i % 2 else {}
+        await recorder.call(self.client, "GET", "/api/vets", params=params)
+
+    async def scenario_appointments(self, recorder: Recorder, i: int):
+        user = self.owners[i % len(self.owners)] if i % 4 else self.vets[i % len(self.vets)]
+        await recorder.call(self.client, "GET", "/api/appointments", params={"limit": self.args.page_size}, headers=self.headers(user))
+
+    async def scenario_send_message(self, recorder: Recorder, i: int):
+        sender = self.owners[0] if i % 2 else self.vets[0]
+        await recorder.call(
+            self.client, "POST", "/api/messages",
+            json={"chat_id": self.chat_id, "content": f"Benchmark message {i}"},
+            headers=self.headers(sender)
+        )
+
+    async def scenario_get_messages(self, recorder: Recorder, i: int):
+        await recorder.call(
+            self.client, "GET", f"/api/messages/{self.chat_id}",
+            params={"limit": self.args.page_size}, headers=self.headers(self.owners[0])
+        )
+
+    async def scenario_emergency(self, recorder: Recorder, i: int):
+        """An owner raises an emergency and several vets race to accept it; exactly one may win"""
+        owner = self.owners[i % len(self.owners)]
+        response = await recorder.call(
+            self.client, "POST", "/api/emergency",
+            json={"location": "Nairobi", "description": "Benchmark", "pet_name": "Rex", "pet_type": "dog"},
+            headers=self.headers(owner)
+        )
+        if response.status_code != 200:
+            return
+        request_id = response.json()["request_id"]
+        accepters = [self.vets[(i + offset) % len(self.vets)] for offset in range(min(self.args.accepters, len(self.vets)))]
+        responses = await asyncio.gather(*[
+            recorder.call(self.client, "PATCH", f"/api/emergency/{request_id}/accept", expected=(200, 409), headers=self.headers(vet))
+            for vet in accepters
+        ])
+        if sum(response.status_code == 200 for response in responses) != 1:
+            recorder.unexpected += 1
+
+    async def run_scenario(self, name: str) -> Dict:
+        work = getattr(self, f"scenario_{name}")
+        cache = self.server.password_hasher.verification_cache
+        max_size = cache.max_size
+        if name == "login":
+            cache.max_size = 0
+            cache.clear()
+        try:
+            await self.drive(work, Recorder(), self.args.warmup)
+
+            self.ops.reset()
+            self.commands.counts.clear()
+            hits, misses = cache.hits, cache.misses
+            recorder = Recorder()
+            started = time.perf_counter()
+            await self.drive(work, recorder, self.args.requests)
+            summary = summarize(recorder, time.perf_counter() - started, self.ops, self.commands)
+        finally:
+            cache.max_size = max_size
+        if name.startswith("login"):
+            summary["verification_cache"] = {"hits": cache.hits - hits, "misses": cache.misses - misses}
+        return summary
+
+    async def drive(self, work: Callable[[Recorder, int], Awaitable[None]], recorder: Recorder, iterations: int):
+        """Run `iterations` units of work on `concurrency` workers"""
+        counter = iter(range(iterations))
+
+        async def worker():
+            for i in counter:
+                await work(recorder, i)
+
+        await asyncio.gather(*[worker() for _ in range(self.args.concurrency)])
+
+
+def print_report(results: Dict):
+    print(f"\nbackend={results['backend']} requests={results['config']['requests']} concurrency={results['config']['concurrency']}\n")
+    print(f"{'scenario':<14} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'db ops/req':>11} {'bad':>5}  statuses")
+    for name, summary in results["scenarios"].items():
+        latency = summary["latency_ms"]
+        print(
+            f"{name:<14} {summary['throughput_rps']:>9.1f} {latency['p50']:>9.2f} {latency['p95']:>9.2f} "
+            f"{latency['p99']:>9.2f} {summary['db_ops']['per_request']:>11.2f} {summary['unexpected_status']:>5}  "
+            f"{summary['status_codes']}"
+        )
+    for name, summary in results["scenarios"].items():
+        if "verification_cache" in summary:
+            cache = summary["verification_cache"]
+            print(f"{name}: {cache['hits']} verification cache hits, {cache['misses']} misses")
+
+
+def print_comparison(results: Dict, baseline: Dict):
+    print(f"\nchange against baseline from {baseline.get('started_at', '?')}:")
+    print(f"{'scenario':<14} {'req/s':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'db ops/req':>11}")
+
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    for name, summary in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        print(
+            f"{name:<14} {change(summary['throughput_rps'], old['throughput_rps']):>10} "
+            + " ".join(f"{change(summary['latency_ms'][key], old['latency_ms'][key]):>10}" for key in ("p50", "p95", "p99"))
+            + f" {change(summary['db_ops']['per_request'], old['db_ops']['per_request']):>11}"
+        )
+
+
+async def run(args) -> Dict:
+    # Listeners only attach to clients created after registration, so this precedes the app import
+    commands = CommandCounter()
+    monitoring.register(commands)
+    os.environ["DATA_BACKEND"] = args.backend
+    if args.bcrypt_rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "bench")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import httpx
+    import server
+
+    ops = OpCounter()
+    ops.instrument(server.repos)
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            bench = Bench(server, client, args, ops, commands)
+            seed_started = time.perf_counter()
+            await bench.seed()
+            seed_seconds = time.perf_counter() - seed_started
+
+            scenarios = {}
+            for name in args.scenarios:
+                scenarios[name] = await bench.run_scenario(name)
+                print(f"{name}: {scenarios[name]['throughput_rps']} req/s", file=sys.stderr)
+
+    return {
+        "started_at": started_at,
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("requests", "concurrency", "warmup", "seed", "users", "vets", "appointments", "history", "page_size", "accepters")
+        },
+        "bcrypt_rounds": server.password_hasher.rounds,
+        "seed_s": round(seed_seconds, 3),
+        "scenarios": scenarios,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API end to end")
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=1000, help="units of work per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=50, help="unrecorded units of work before each scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users", type=int, default=200, help="pet owners to create")
+    parser.add_argument("--vets", type=int, default=50)
+    parser.add_argument("--appointments", type=int, default=5000)
+    parser.add_argument("--history", type=int, default=10000, help="messages already in the benchmark chat")
+    parser.add_argument("--page-size", type=int, default=100, help="limit for list requests")
+    parser.add_argument("--bcrypt-rounds", type=int, help="override BCRYPT_ROUNDS; the login scenario otherwise measures the production cost")
+    parser.add_argument("--accepters", type=int, default=5, help="vets racing to accept each emergency")
+    parser.add_argument("--json", dest="json_path", help="write the full results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.users < 1 or args.vets < 1:
+        parser.error("--users and --vets must be at least 1")
+
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.json_path}")
+    return 1 if any(summary["unexpected_status"] for summary in results["scenarios"].values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
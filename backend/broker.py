@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+from hub import Hub
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    """Publishes events to the local Hub of every worker.
+
+    Handlers publish through the broker; WebSocket/SSE endpoints subscribe
+    to the Hub of the worker they are connected to.
+    """
+
+    def __init__(self, hub: Hub):
+        self.hub = hub
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, topic: str, event: Any):
+        raise NotImplementedError
+
+
+class InMemoryBroker(Broker):
+    """Single-process broker: events only reach subscribers on this worker"""
+
+    async def publish(self, topic: str, event: Any):
+        self.hub.publish(topic, event)
+
+
+class MongoBroker(Broker):
+    """Relays events between workers through a capped collection.
+
+    Every worker appends events to the collection and tails it with a
+    tailable-await cursor, so no external service or replica set is needed.
+    Events are only fanned out to the local Hub by the tailer, which keeps
+    delivery order identical on every worker.
+
+    A tailer that has to reopen its cursor resumes from `resume_overlap`
+    seconds before the newest event it delivered and skips the `_id`s it
+    has already seen, so events inserted slightly out of created_at order
+    (concurrent publishers, clock skew between workers) are neither lost
+    nor repeated. No shared counter is needed: publishing is one insert.
+    """
+
+    def __init__(
+        self,
+        hub: Hub,
+        db,
+        collection_name: str = "events",
+        size_bytes: int = 16 * 1024 * 1024,
+        poll_interval: float = 0.5,
+        resume_overlap: float = 5.0,
+        max_seen: int = 10000,
+        max_backoff: float = 30.0
+    ):
+        super().__init__(hub)
+        self.db = db
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.poll_interval = poll_interval
+        self.resume_overlap = timedelta(seconds=resume_overlap)
+        self.max_seen = max_seen
+        self.max_backoff = max_backoff
+        self._since = datetime.now(timezone.utc)
+        self._last_delivered: Optional[datetime] = None
+        # Ids delivered recently, oldest first; must cover the overlap window
+        self._seen: "OrderedDict[Any, None]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    async def start(self):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+
+        # Only deliver events published after this worker started
+        self._since = datetime.now(timezone.utc)
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, topic: str, event: Any):
+        await self.collection.insert_one({
+            "topic": topic,
+            "event": event,
+            "created_at": datetime.now(timezone.utc)
+        })
+
+    async def _tail(self):
+        failures = 0
+        while True:
+            try:
+                await self._follow()
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                failures += 1
+                logger.exception("Event broker tail failed, retrying")
+            await asyncio.sleep(min(self.poll_interval * 2 ** failures, self.max_backoff))
+
+    async def _follow(self):
+        if self._last_delivered is not None:
+            oldest = await self.collection.find_one({}, sort=[("$natural", 1)])
+            if oldest and oldest["_id"] not in self._seen and _utc(oldest["created_at"]) > self._last_delivered:
+                logger.warning("Event broker fell behind the capped collection; events may have been missed")
+
+        cursor = self.collection.find({"created_at": {"$gte": self._since}}, cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            async for doc in cursor:
+                if doc["_id"] in self._seen:
+                    continue
+                self._remember(doc["_id"])
+                created_at = _utc(doc["created_at"])
+                if self._last_delivered is None or created_at > self._last_delivered:
+                    self._last_delivered = created_at
+                    self._since = max(self._since, created_at - self.resume_overlap)
+                self.hub.publish(doc["topic"], doc["event"])
+            await asyncio.sleep(self.poll_interval)
+
+    def _remember(self, doc_id: Any):
+        self._seen[doc_id] = None
+        while len(self._seen) > self.max_seen:
+            self._seen.popitem(last=False)
+
+
+def _utc(value: datetime) -> datetime:
+    # Motor returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def create_broker(kind: str, hub: Hub, db) -> Broker:
+    if kind == "mongo":
+        return MongoBroker(hub, db)
+    if kind == "memory":
+        return InMemoryBroker(hub)
+    raise ValueError(f"Unknown event broker: {kind}")
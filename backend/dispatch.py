@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stored on emergency requests for the dispatcher; never sent to clients
+DISPATCH_FIELDS = ("dispatch_candidates", "dispatch_wave", "notified_vet_ids", "dispatch_broadcast", "dispatch_next_wave_at")
+
+
+class Dispatcher:
+    """Offers emergency requests to the nearest available vets in waves.
+
+    On creation a ranked candidate list is stored on the request and the
+    first wave is notified. Every worker runs a sweeper that claims requests
+    whose wave timed out (with a conditional update, so only one worker
+    advances each wave) and notifies the next candidates. Once candidates
+    run out, or when the request has no coordinates, it is broadcast to
+    every vet. The first vet to accept wins via `accept`.
+    """
+
+    def __init__(
+        self,
+        emergencies,
+        vet_profiles,
+        on_change: Callable[[Dict], Awaitable[None]],
+        wave_size: int = 3,
+        wave_timeout: float = 30.0,
+        radius_km: float = 25.0,
+        max_candidates: int = 15,
+        tick: float = 2.0,
+    ):
+        self.emergencies = emergencies
+        self.vet_profiles = vet_profiles
+        self.on_change = on_change
+        self.wave_size = wave_size
+        self.wave_timeout = wave_timeout
+        self.radius_km = radius_km
+        self.max_candidates = max_candidates
+        self.tick = tick
+        self._task: Optional[asyncio.Task] = None
+
+    async def rank_candidates(self, latitude: float, longitude: float, pet_type: str, exclude_user_id: str) -> List[str]:
+        """Available vets near the emergency, nearest first.
+
+        Vets whose specialty mentions the pet type are treated as if they
+        were a quarter closer.
+        """
+        vet_profiles = await self.vet_profiles.nearby(
+            latitude, longitude, self.radius_km * 1000, self.max_candidates, exclude_user_id=exclude_user_id
+        )
+
+        pet_type = pet_type.lower()
+
+        def score(profile):
+            matches = pet_type and pet_type in (profile.get("specialty") or "").lower()
+            return profile["distance"] * (0.75 if matches else 1.0)
+
+        return [profile["user_id"] for profile in sorted(vet_profiles, key=score)]
+
+    def initial_fields(self, candidates: List[str]) -> Dict:
+        """Dispatch fields for a new request, notifying the first wave"""
+        first_wave = candidates[:self.wave_size]
+        return {
+            "dispatch_candidates": candidates,
+            "dispatch_wave": 1,
+            "notified_vet_ids": first_wave,
+            "dispatch_broadcast": not candidates,
+            "dispatch_next_wave_at": self._next_wave_at() if candidates else None
+        }
+
+    async def advance(self, emergency_request: Dict) -> Optional[Dict]:
+        """Notify the next wave, or broadcast once candidates run out"""
+        wave = emergency_request.get("dispatch_wave", 1)
+        candidates = emergency_request.get("dispatch_candidates", [])
+        notified = candidates[:(wave + 1) * self.wave_size]
+        exhausted = len(notified) >= len(candidates)
+
+        updated = await self.emergencies.update_if(
+            emergency_request["request_id"],
+            # Matching on the current wave makes the claim race-free across workers
+            {"status": "active", "dispatch_wave": wave},
+            {
+                "dispatch_wave": wave + 1,
+                "notified_vet_ids": notified,
+                "dispatch_broadcast": exhausted,
+                "dispatch_next_wave_at": None if exhausted else self._next_wave_at(),
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }
+        )
+        if updated:
+            await self.on_change(updated)
+        return updated
+
+    async def accept(self, request_id: str, vet_id: str) -> Optional[Dict]:
+        """Assign the request to the vet if it is still open to them; None if they lost"""
+        return await self.emergencies.accept(request_id, vet_id, {
+            "status": "accepted",
+            "assigned_vet_id": vet_id,
+            "dispatch_next_wave_at": None,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        })
+
+    async def start(self):
+        self._task = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sweep(self):
+        while True:
+            try:
+                now = datetime.now(timezone.utc).isoformat()
+                due = await self.emergencies.due_for_next_wave(now)
+            except Exception:
+                logger.exception("Emergency dispatch sweep failed")
+                due = []
+            for emergency_request in due:
+                # One bad request or subscriber must not stop the others' waves
+                try:
+                    await self.advance(emergency_request)
+                except Exception:
+                    logger.exception(f"Advancing emergency request {emergency_request.get('request_id')} failed")
+            await asyncio.sleep(self.tick)
+
+    def _next_wave_at(self) -> str:
+        return (datetime.now(timezone.utc) + timedelta(seconds=self.wave_timeout)).isoformat()
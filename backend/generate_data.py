@@ -0,0 +1,417 @@
+"""Bulk-load a synthetic dataset shaped like production into the configured DB.
+
+    python generate_data.py --drop                 # full scale, see DEFAULT_COUNTS
+    python generate_data.py --drop --scale 0.01    # 1% of every count
+    python generate_data.py --dry-run              # generate and count only
+
+Documents use the layout server.py writes. The same --seed, --scale and
+--anchor always produce the same documents, ids included (only the bcrypt
+salt of the password hash differs): each collection draws from its own
+seeded stream. Appointments pick vets with Zipf
+weights (--skew), so a few hot vets carry a large share of the bookings,
+and each vet's appointments fill consecutive working slots around
+--anchor. About --past of each vet's bookings fall before the anchor.
+Open appointments get matching slot_reservations.
+A handful of chats (--hot-chats) hold --hot-chat-messages messages each.
+
+Every user's password is --password. Emails are owner<N>@example.com
+and vet<N>@example.com. Indexes are built after the load unless
+--no-indexes is passed.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+from bisect import bisect
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from itertools import accumulate
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from slots import DEFAULT_AVAILABILITY, day_slots
+
+DEFAULT_COUNTS = {
+    "users": 100_000,
+    "vets": 10_000,
+    "appointments": 1_000_000,
+    "chats": 20_000,
+    "messages_per_chat": 20,
+    "hot_chats": 10,
+    "hot_chat_messages": 10_000,
+    "emergencies": 20_000,
+}
+
+# Counts multiplied by --scale; the rest describe the shape of each chat
+SCALED = ["users", "vets", "appointments", "chats", "emergencies"]
+
+COLLECTIONS = [
+    "users", "vet_profiles", "appointments", "slot_reservations",
+    "chats", "messages", "emergency_requests"
+]
+
+SPECIALTIES = [
+    "General Practice", "Dogs", "Cats", "Exotic Pets", "Birds", "Surgery",
+    "Dentistry", "Dermatology", "Livestock", "Equine", "Emergency Care"
+]
+
+# City, latitude, longitude, share of vets
+CITIES = [
+    ("Nairobi", -1.2921, 36.8219, 0.45),
+    ("Mombasa", -4.0435, 39.6682, 0.15),
+    ("Kisumu", -0.0917, 34.7680, 0.10),
+    ("Nakuru", -0.3031, 36.0800, 0.10),
+    ("Eldoret", 0.5143, 35.2698, 0.08),
+    ("Thika", -1.0333, 37.0693, 0.07),
+    ("Malindi", -3.2192, 40.1169, 0.05),
+]
+
+PET_TYPES = ["dog", "cat", "bird", "rabbit", "goat", "cow", "horse"]
+PET_NAMES = ["Rex", "Bella", "Simba", "Luna", "Max", "Zuri", "Kibo", "Nala", "Bruno", "Daisy"]
+REASONS = ["Vaccination", "Annual checkup", "Skin rash", "Limping", "Not eating", "Dental cleaning", "Follow-up"]
+
+
+class Dataset:
+    """Deterministic document generators for every collection"""
+
+    def __init__(self, counts: Dict[str, int], seed: int, anchor: datetime, skew: float, past: float, password_hash: str):
+        self.counts = counts
+        self.seed = seed
+        self.anchor = anchor
+        self.skew = skew
+        self.past = past
+        self.password_hash = password_hash
+
+        ids = self.rng("ids")
+        self.owner_ids = [f"user_{ids.getrandbits(48):012x}" for _ in range(counts["users"] - counts["vets"])]
+        self.vet_ids = [f"user_{ids.getrandbits(48):012x}" for _ in range(counts["vets"])]
+        # Vet popularity: rank r (0-based) gets weight 1 / (r + 1) ** skew
+        self.vet_weights = list(accumulate(1 / (rank + 1) ** skew for rank in range(len(self.vet_ids))))
+
+    def rng(self, stream: str) -> random.Random:
+        return random.Random(f"{self.seed}:{stream}")
+
+    def pick_vet(self, rng: random.Random) -> int:
+        return bisect(self.vet_weights, rng.random() * self.vet_weights[-1])
+
+    def users(self) -> Iterator[Dict]:
+        rng = self.rng("users")
+        for user_type, user_ids in (("pet_owner", self.owner_ids), ("vet", self.vet_ids)):
+            prefix = "owner" if user_type == "pet_owner" else "vet"
+            for index, user_id in enumerate(user_ids):
+                yield {
+                    "user_id": user_id,
+                    "email": f"{prefix}{index}@example.com",
+                    "password": self.password_hash,
+                    "name": f"{rng.choice(PET_NAMES)} {prefix.title()} {index}",
+                    "user_type": user_type,
+                    "picture": None,
+                    "created_at": (self.anchor - timedelta(seconds=rng.randrange(3 * 365 * 86400))).isoformat()
+                }
+
+    def vet_profiles(self) -> Iterator[Dict]:
+        rng = self.rng("vet_profiles")
+        city_weights = list(accumulate(city[3] for city in CITIES))
+        for vet_id in self.vet_ids:
+            location, latitude, longitude, _ = CITIES[bisect(city_weights, rng.random() * city_weights[-1])]
+            # Spread across roughly 15 km around the city centre
+            latitude = round(latitude + rng.gauss(0, 0.07), 6)
+            longitude = round(longitude + rng.gauss(0, 0.07), 6)
+            yield {
+                "user_id": vet_id,
+                "license_number": f"KVB-{rng.randrange(1_000_000):06d}",
+                "specialty": rng.choice(SPECIALTIES),
+                "location": location,
+                "phone": f"+2547{rng.randrange(100_000_000):08d}",
+                "bio": None,
+                "experience_years": rng.randrange(40),
+                "latitude": latitude,
+                "longitude": longitude,
+                "available": rng.random() < 0.9,
+                "rating": round(rng.uniform(3.0, 5.0), 1),
+                "created_at": (self.anchor - timedelta(seconds=rng.randrange(3 * 365 * 86400))).isoformat(),
+                "geo": {"type": "Point", "coordinates": [longitude, latitude]}
+            }
+
+    def _appointment_vets(self) -> List[int]:
+        rng = self.rng("appointment_vets")
+        return [self.pick_vet(rng) for _ in range(self.counts["appointments"])]
+
+    def _vet_slots(self, bookings: int) -> Iterator[Tuple[date, str]]:
+        """Consecutive working slots, starting early enough that `past` of them precede the anchor"""
+        per_week = sum(len(day_slots(DEFAULT_AVAILABILITY, self.anchor.date() + timedelta(days=offset))) for offset in range(7))
+        weeks_back = math.ceil(bookings * self.past / per_week)
+        day = self.anchor.date() - timedelta(weeks=weeks_back)
+        while True:
+            for slot_time in day_slots(DEFAULT_AVAILABILITY, day):
+                yield day, slot_time
+            day += timedelta(days=1)
+
+    def appointments(self) -> Iterator[Tuple[Dict, Dict]]:
+        """(appointment, slot reservation or None) pairs"""
+        rng = self.rng("appointments")
+        vet_indexes = self._appointment_vets()
+        bookings = [0] * len(self.vet_ids)
+        for vet_index in vet_indexes:
+            bookings[vet_index] += 1
+        slots = {}
+        today = self.anchor.date()
+
+        for vet_index in vet_indexes:
+            vet_id = self.vet_ids[vet_index]
+            if vet_id not in slots:
+                slots[vet_id] = self._vet_slots(bookings[vet_index])
+            slot_date, slot_time = next(slots[vet_id])
+            starts_at = datetime.combine(slot_date, dt_time.fromisoformat(slot_time), timezone.utc)
+            created_at = min(starts_at, self.anchor) - timedelta(seconds=rng.randrange(1, 30 * 86400))
+
+            if slot_date < today:
+                status = "completed" if rng.random() < 0.85 else "cancelled"
+            else:
+                status = "confirmed" if rng.random() < 0.6 else "pending"
+            paid = status in ("completed", "confirmed")
+
+            appointment = {
+                "appointment_id": f"apt_{rng.getrandbits(48):012x}",
+                "pet_owner_id": rng.choice(self.owner_ids),
+                "vet_id": vet_id,
+                "appointment_date": slot_date.isoformat(),
+                "appointment_time": slot_time,
+                "pet_name": rng.choice(PET_NAMES),
+                "pet_type": rng.choice(PET_TYPES),
+                "reason": rng.choice(REASONS),
+                "status": status,
+                "amount": 50.0,
+                "payment_status": "paid" if paid else "pending",
+                "created_at": created_at.isoformat()
+            }
+            reservation = None
+            if status in ("pending", "confirmed"):
+                reservation = {
+                    "vet_id": vet_id,
+                    "date": appointment["appointment_date"],
+                    "time": slot_time,
+                    "appointment_id": appointment["appointment_id"],
+                    "created_at": appointment["created_at"]
+                }
+            yield appointment, reservation
+
+    def chats_and_messages(self) -> Iterator[Tuple[Dict, List[Dict]]]:
+        """Each chat with its messages, oldest first"""
+        rng = self.rng("chats")
+        pairs = set()
+        for index in range(self.counts["chats"]):
+            while True:
+                pair = (rng.choice(self.owner_ids), self.vet_ids[self.pick_vet(rng)])
+                if pair not in pairs:
+                    pairs.add(pair)
+                    break
+            if index < self.counts["hot_chats"]:
+                message_count = self.counts["hot_chat_messages"]
+            else:
+                message_count = rng.randint(0, 2 * self.counts["messages_per_chat"])
+
+            chat_id = f"chat_{rng.getrandbits(48):012x}"
+            # Hot chats go back far enough for one message every few minutes
+            span = max(message_count * 300, 86400)
+            created_at = self.anchor - timedelta(seconds=span + rng.randrange(86400))
+            message_seed = rng.getrandbits(64)
+            chat = {
+                "chat_id": chat_id,
+                "pet_owner_id": pair[0],
+                "vet_id": pair[1],
+                "last_message": None,
+                "last_message_at": None,
+                "created_at": created_at.isoformat()
+            }
+            messages = list(self._messages(chat, message_count, random.Random(message_seed), created_at, span))
+            if messages:
+                chat["last_message"] = messages[-1]["content"]
+                chat["last_message_at"] = messages[-1]["created_at"]
+            yield chat, messages
+
+    def _messages(self, chat: Dict, count: int, rng: random.Random, created_at: datetime, span: int) -> Iterator[Dict]:
+        step = span / (count + 1)
+        moment = created_at
+        for index in range(count):
+            moment += timedelta(seconds=rng.uniform(0.5, 1.5) * step)
+            yield {
+                "message_id": f"msg_{rng.getrandbits(48):012x}",
+                "chat_id": chat["chat_id"],
+                "sender_id": chat["pet_owner_id"] if rng.random() < 0.5 else chat["vet_id"],
+                "content": f"Message {index} about {rng.choice(PET_NAMES)}",
+                "created_at": moment.isoformat()
+            }
+
+    def emergency_requests(self) -> Iterator[Dict]:
+        rng = self.rng("emergency_requests")
+        for _ in range(self.counts["emergencies"]):
+            created_at = self.anchor - timedelta(seconds=rng.randrange(365 * 86400))
+            roll = rng.random()
+            # A few recent ones are still open
+            status = "active" if roll < 0.02 else "cancelled" if roll < 0.15 else "completed" if roll < 0.75 else "accepted"
+            assigned_vet_id = None if status in ("active", "cancelled") else self.vet_ids[self.pick_vet(rng)]
+            if status == "active":
+                created_at = self.anchor - timedelta(seconds=rng.randrange(3600))
+            updated_at = created_at if status == "active" else created_at + timedelta(seconds=rng.randrange(60, 7200))
+            yield {
+                "request_id": f"emr_{rng.getrandbits(48):012x}",
+                "pet_owner_id": rng.choice(self.owner_ids),
+                "location": rng.choice(CITIES)[0],
+                "description": rng.choice(REASONS),
+                "pet_name": rng.choice(PET_NAMES),
+                "pet_type": rng.choice(PET_TYPES),
+                "status": status,
+                "assigned_vet_id": assigned_vet_id,
+                "created_at": created_at.isoformat(),
+                "updated_at": updated_at.isoformat(),
+                "dispatch_candidates": [],
+                "dispatch_wave": 1,
+                "notified_vet_ids": [],
+                "dispatch_broadcast": True,
+                "dispatch_next_wave_at": None
+            }
+
+
+class Loader:
+    """Writes generated docs with unordered insert_many batches, counting them per collection"""
+
+    def __init__(self, db, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.counts: Dict[str, int] = {name: 0 for name in COLLECTIONS}
+        self._pending: Dict[str, List[Dict]] = {name: [] for name in COLLECTIONS}
+
+    async def add(self, collection_name: str, doc: Dict):
+        pending = self._pending[collection_name]
+        pending.append(doc)
+        if len(pending) >= self.batch_size:
+            await self.flush(collection_name)
+
+    async def add_many(self, collection_name: str, docs: Iterable[Dict]):
+        for doc in docs:
+            await self.add(collection_name, doc)
+
+    async def flush(self, collection_name: str):
+        pending = self._pending[collection_name]
+        if not pending:
+            return
+        self._pending[collection_name] = []
+        if self.db is not None:
+            await self.db[collection_name].insert_many(pending, ordered=False)
+        self.counts[collection_name] += len(pending)
+
+    async def flush_all(self):
+        for collection_name in COLLECTIONS:
+            await self.flush(collection_name)
+
+
+async def load(dataset: Dataset, loader: Loader, log: Callable[[str], None]):
+    async def step(label: str, fill):
+        started = time.perf_counter()
+        before = sum(loader.counts.values())
+        await fill()
+        await loader.flush_all()
+        written = sum(loader.counts.values()) - before
+        elapsed = time.perf_counter() - started
+        log(f"{label}: {written} docs in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f} docs/s)")
+
+    async def users():
+        await loader.add_many("users", dataset.users())
+        await loader.add_many("vet_profiles", dataset.vet_profiles())
+
+    async def appointments():
+        for appointment, reservation in dataset.appointments():
+            await loader.add("appointments", appointment)
+            if reservation:
+                await loader.add("slot_reservations", reservation)
+
+    async def chats():
+        for chat, messages in dataset.chats_and_messages():
+            await loader.add("chats", chat)
+            for message in messages:
+                await loader.add("messages", message)
+
+    async def emergencies():
+        await loader.add_many("emergency_requests", dataset.emergency_requests())
+
+    await step("users and vet profiles", users)
+    await step("appointments and slot reservations", appointments)
+    await step("chats and messages", chats)
+    await step("emergency requests", emergencies)
+
+
+async def _main(args) -> int:
+    from dotenv import load_dotenv
+
+    from passwords import PasswordHasher
+
+    counts = {name: max(1, round(count * args.scale)) if name in SCALED else count for name, count in DEFAULT_COUNTS.items()}
+    for name in DEFAULT_COUNTS:
+        if getattr(args, name) is not None:
+            counts[name] = getattr(args, name)
+    if counts["vets"] >= counts["users"]:
+        print("--vets must be smaller than --users (vets are counted among the users)")
+        return 2
+    counts["hot_chats"] = min(counts["hot_chats"], counts["chats"])
+
+    hasher = PasswordHasher(rounds=int(os.environ.get('BCRYPT_ROUNDS', '12')), max_workers=1)
+    password_hash = await hasher.hash(args.password)
+    hasher.shutdown()
+
+    anchor = datetime.combine(args.anchor, dt_time(), timezone.utc)
+    dataset = Dataset(counts, args.seed, anchor, args.skew, args.past, password_hash)
+    print(", ".join(f"{name}={count}" for name, count in counts.items()) + f", seed={args.seed}, anchor={args.anchor}")
+
+    if args.dry_run:
+        loader = Loader(None, args.batch_size)
+        await load(dataset, loader, print)
+        print(", ".join(f"{name}: {count}" for name, count in loader.counts.items()))
+        return 0
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from indexes import ensure_indexes
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        existing = [name for name in COLLECTIONS if await db[name].estimated_document_count()]
+        if existing and not args.drop:
+            print(f"{os.environ['DB_NAME']} already has data in {', '.join(existing)}; pass --drop to replace it")
+            return 1
+        if args.drop:
+            for name in COLLECTIONS + ["user_sessions"]:
+                await db.drop_collection(name)
+
+        loader = Loader(db, args.batch_size)
+        await load(dataset, loader, print)
+        print(", ".join(f"{name}: {count}" for name, count in loader.counts.items()))
+
+        if not args.no_indexes:
+            started = time.perf_counter()
+            await ensure_indexes(db)
+            print(f"indexes built in {time.perf_counter() - started:.1f}s")
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a synthetic production-scale dataset")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for every default count")
+    for name, count in DEFAULT_COUNTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=None, help=f"default {count}" + (" times --scale" if name in SCALED else ""))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--anchor", type=date.fromisoformat, default=datetime.now(timezone.utc).date(),
+                        help="'now' of the dataset (YYYY-MM-DD); defaults to today")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of vet popularity; 0 spreads bookings evenly")
+    parser.add_argument("--past", type=float, default=0.8, help="share of each vet's appointments before the anchor")
+    parser.add_argument("--password", default="password123")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--drop", action="store_true", help="drop the generated collections and sessions first")
+    parser.add_argument("--no-indexes", action="store_true", help="skip building indexes after the load")
+    parser.add_argument("--dry-run", action="store_true", help="generate without connecting to MongoDB")
+    raise SystemExit(asyncio.run(_main(parser.parse_args())))
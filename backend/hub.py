@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from typing import Any, Dict, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """A subscriber's bounded inbox for one topic"""
+
+    def __init__(self, hub: "Hub", topic: str, max_queue: int):
+        self.hub = hub
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    async def get(self) -> Any:
+        return await self.queue.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """In-process topic fan-out to connected clients.
+
+    Publishing never blocks: a subscriber whose inbox is full is marked as
+    overflowed and dropped, and is expected to reconnect and catch up from
+    the database.
+    """
+
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(self, topic, self.max_queue)
+        self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.topic)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.topic]
+
+    def publish(self, topic: str, event: Any) -> int:
+        """Deliver an event to every local subscriber of a topic"""
+        delivered = 0
+        for subscription in list(self._subscribers.get(topic, ())):
+            try:
+                subscription.queue.put_nowait(event)
+                delivered += 1
+            except asyncio.QueueFull:
+                logger.warning(f"Dropping slow subscriber on {topic}")
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+                # Wake the consumer so it notices the overflow
+                subscription.queue.get_nowait()
+                subscription.queue.put_nowait(None)
+        return delivered
+
+    def subscriber_count(self, topic: str) -> int:
+        return len(self._subscribers.get(topic, ()))
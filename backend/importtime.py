@@ -0,0 +1,118 @@
+"""Measure how long importing the API takes, as a worker does on cold start.
+
+    python importtime.py                      # slowest imports by cumulative time
+    python importtime.py --budget-ms 1500     # exit 1 when over budget
+    python importtime.py --runs 5 --top 30
+
+Each run imports `server` in a fresh interpreter under `python -X importtime`.
+The check also fails when a lazily loaded integration (Stripe,
+emergentintegrations, aiohttp) is imported at startup.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).parent
+
+# Loaded on first use; importing them at startup is a regression
+LAZY_MODULES = ["stripe", "emergentintegrations", "aiohttp"]
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+PROBE = (
+    "import sys, time; started = time.perf_counter(); import server; "
+    "print('import_ms=%s' % round((time.perf_counter() - started) * 1000, 1)); "
+    "print('eager=' + ','.join(m for m in {lazy!r} if m in sys.modules))"
+)
+
+
+def run_once(module: str = "server") -> Tuple[float, List[str], List[Tuple[int, int, int, str]]]:
+    """Import the app in a fresh interpreter.
+
+    Returns wall-clock import time in ms, lazily loaded modules that were
+    imported anyway, and (self_us, cumulative_us, depth, name) rows.
+    """
+    env = dict(os.environ)
+    # Motor connects lazily, so a placeholder URL is enough to import the app
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "importtime")
+    code = PROBE.format(lazy=LAZY_MODULES).replace("import server", f"import {module}")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    probe = dict(line.split("=", 1) for line in result.stdout.splitlines() if "=" in line)
+    wall_ms = float(probe["import_ms"])
+    eager = [name for name in probe["eager"].split(",") if name]
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return wall_ms, eager, rows
+
+
+def top_level(rows: List[Tuple[int, int, int, str]]) -> Dict[str, int]:
+    """Cumulative microseconds per top-level package imported directly by the app module"""
+    totals: Dict[str, int] = {}
+    for _, cumulative_us, depth, name in rows:
+        if depth == 1:
+            package = name.split(".")[0]
+            totals[package] = totals.get(package, 0) + cumulative_us
+    return totals
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Profile API import time")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to sample; the median is reported")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    samples = []
+    eager: List[str] = []
+    rows: List[Tuple[int, int, int, str]] = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        wall_ms, eager, rows = run_once(args.module)
+        samples.append(wall_ms)
+        print(f"run: import {wall_ms:.1f} ms, interpreter {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    median_ms = statistics.median(samples)
+    print(f"\nimport {args.module}: median {median_ms:.1f} ms over {args.runs} runs\n")
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cumulative_us, depth, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {'  ' * depth}{name}")
+
+    print("\nby top-level package:")
+    for package, cumulative_us in sorted(top_level(rows).items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f}  {package}")
+
+    failed = False
+    if eager:
+        print(f"\nFAIL: imported at startup but should load lazily: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None:
+        if median_ms > args.budget_ms:
+            print(f"\nFAIL: median import {median_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+            failed = True
+        else:
+            print(f"\nOK: median import {median_ms:.1f} ms within the {args.budget_ms:.0f} ms budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,269 @@
+"""Index definitions for every collection the API queries.
+
+`ensure_indexes` runs at app startup and is idempotent. Run this module
+directly to create, verify or explain indexes against the configured DB:
+
+    python indexes.py ensure
+    python indexes.py verify
+    python indexes.py explain
+    python indexes.py migrate-sessions
+    python indexes.py backfill-slots
+"""
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from pymongo import ASCENDING, GEOSPHERE, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        # Sessions are removed by Mongo once expires_at (a BSON date) passes
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "stream_tickets": [
+        IndexModel([("ticket", ASCENDING)], name="ticket_unique", unique=True),
+        # Unredeemed tickets are cleaned up like sessions; expiry itself is checked on redemption
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "vet_profiles": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("available", ASCENDING), ("specialty", ASCENDING)], name="available_specialty"),
+        # 2dsphere indexes are sparse: profiles without coordinates are skipped
+        IndexModel([("geo", GEOSPHERE), ("available", ASCENDING)], name="geo_2dsphere"),
+    ],
+    "appointments": [
+        IndexModel([("appointment_id", ASCENDING)], name="appointment_id_unique", unique=True),
+        IndexModel([("vet_id", ASCENDING), ("created_at", ASCENDING), ("appointment_id", ASCENDING)], name="vet_id_created_at"),
+        IndexModel([("pet_owner_id", ASCENDING), ("created_at", ASCENDING), ("appointment_id", ASCENDING)], name="pet_owner_id_created_at"),
+    ],
+    "slot_reservations": [
+        # One reservation per vet slot: concurrent bookings of the same slot fail with DuplicateKeyError
+        IndexModel([("vet_id", ASCENDING), ("date", ASCENDING), ("time", ASCENDING)], name="vet_id_date_time_unique", unique=True),
+        IndexModel([("appointment_id", ASCENDING)], name="appointment_id"),
+    ],
+    "emergency_requests": [
+        IndexModel([("request_id", ASCENDING)], name="request_id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING), ("request_id", ASCENDING)], name="status_created_at"),
+        IndexModel([("pet_owner_id", ASCENDING), ("created_at", ASCENDING), ("request_id", ASCENDING)], name="pet_owner_id_created_at"),
+        IndexModel([("updated_at", ASCENDING), ("request_id", ASCENDING)], name="updated_at"),
+        IndexModel([("status", ASCENDING), ("dispatch_next_wave_at", ASCENDING)], name="status_dispatch_next_wave_at"),
+    ],
+    "chats": [
+        IndexModel([("chat_id", ASCENDING)], name="chat_id_unique", unique=True),
+        IndexModel([("pet_owner_id", ASCENDING), ("vet_id", ASCENDING)], name="pet_owner_id_vet_id_unique", unique=True),
+        IndexModel([("vet_id", ASCENDING), ("created_at", ASCENDING), ("chat_id", ASCENDING)], name="vet_id_created_at"),
+        IndexModel([("pet_owner_id", ASCENDING), ("created_at", ASCENDING), ("chat_id", ASCENDING)], name="pet_owner_id_created_at"),
+    ],
+    "messages": [
+        IndexModel([("message_id", ASCENDING)], name="message_id_unique", unique=True),
+        IndexModel([("chat_id", ASCENDING), ("created_at", ASCENDING), ("message_id", ASCENDING)], name="chat_id_created_at"),
+    ],
+    "payment_transactions": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+        IndexModel([("appointment_id", ASCENDING)], name="appointment_id"),
+    ],
+    "stripe_events": [
+        IndexModel([("event_id", ASCENDING)], name="event_id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("received_at", ASCENDING)], name="status_received_at"),
+        # Keep the webhook ledger for 30 days, well past Stripe's retry window
+        IndexModel([("received_at", ASCENDING)], name="received_at_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+}
+
+# Representative queries issued by server.py, used by `explain`
+EXPLAIN_QUERIES = [
+    ("user_sessions", {"session_token": "x"}, None),
+    ("stream_tickets", {"ticket": "x"}, None),
+    ("users", {"user_id": "x"}, None),
+    ("users", {"email": "x"}, None),
+    ("users", {"user_id": {"$in": ["x", "y"]}}, None),
+    ("vet_profiles", {"user_id": "x"}, None),
+    ("vet_profiles", {"available": True}, None),
+    ("appointments", {"vet_id": "x"}, [("created_at", ASCENDING), ("appointment_id", ASCENDING)]),
+    ("appointments", {"pet_owner_id": "x"}, [("created_at", ASCENDING), ("appointment_id", ASCENDING)]),
+    ("appointments", {"appointment_id": "x"}, None),
+    ("slot_reservations", {"vet_id": "x", "date": {"$gte": "2026-01-01", "$lte": "2026-01-07"}}, None),
+    ("emergency_requests", {"status": "active"}, [("created_at", ASCENDING), ("request_id", ASCENDING)]),
+    ("emergency_requests", {"pet_owner_id": "x"}, [("created_at", ASCENDING), ("request_id", ASCENDING)]),
+    ("emergency_requests", {"updated_at": {"$gt": "x"}}, [("updated_at", ASCENDING), ("request_id", ASCENDING)]),
+    ("chats", {"pet_owner_id": "x", "vet_id": "y"}, None),
+    ("chats", {"vet_id": "x"}, [("created_at", ASCENDING), ("chat_id", ASCENDING)]),
+    ("chats", {"pet_owner_id": "x"}, [("created_at", ASCENDING), ("chat_id", ASCENDING)]),
+    ("messages", {"chat_id": "x"}, [("created_at", ASCENDING), ("message_id", ASCENDING)]),
+    ("payment_transactions", {"session_id": "x"}, None),
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create all indexes, logging (not raising) when one cannot be built.
+
+    A unique index fails to build when existing data already holds
+    duplicates; the app still starts and the failure is logged.
+    """
+    created = {}
+    for collection_name, models in INDEXES.items():
+        created[collection_name] = []
+        for model in models:
+            try:
+                name = await db[collection_name].create_indexes([model])
+                created[collection_name].extend(name)
+            except OperationFailure as e:
+                logger.error(f"Could not create index {model.document['name']} on {collection_name}: {e}")
+    return created
+
+
+async def verify_indexes(db) -> Dict[str, List[str]]:
+    """Return the expected index names missing from each collection"""
+    missing = {}
+    for collection_name, models in INDEXES.items():
+        existing = await db[collection_name].index_information()
+        absent = [model.document["name"] for model in models if model.document["name"] not in existing]
+        if absent:
+            missing[collection_name] = absent
+    return missing
+
+
+def _plan_stages(plan: Dict) -> List[str]:
+    stages = [plan.get("stage", "?")]
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def explain_queries(db) -> List[Dict]:
+    """Explain each representative query and report its winning plan"""
+    report = []
+    for collection_name, query, sort in EXPLAIN_QUERIES:
+        find = {"find": collection_name, "filter": query}
+        if sort:
+            find["sort"] = dict(sort)
+        result = await db.command({"explain": find, "verbosity": "queryPlanner"})
+        winning_plan = result["queryPlanner"]["winningPlan"]
+        stages = _plan_stages(winning_plan.get("queryPlan", winning_plan))
+        report.append({
+            "collection": collection_name,
+            "filter": query,
+            "stages": stages,
+            "uses_index": "COLLSCAN" not in stages,
+        })
+    return report
+
+
+async def index_usage(db) -> Dict[str, Dict[str, int]]:
+    """Per-index access counts since the server last started"""
+    usage = {}
+    for collection_name in INDEXES:
+        stats = await db[collection_name].aggregate([{"$indexStats": {}}]).to_list(None)
+        usage[collection_name] = {stat["name"]: stat["accesses"]["ops"] for stat in stats}
+    return usage
+
+
+async def migrate_session_dates(db) -> int:
+    """Convert ISO string expires_at values to BSON dates so the TTL index applies"""
+    result = await db.user_sessions.update_many(
+        {"expires_at": {"$type": "string"}},
+        [{"$set": {"expires_at": {"$toDate": "$expires_at"}}}]
+    )
+    return result.modified_count
+
+
+async def backfill_slot_reservations(db) -> Dict[str, int]:
+    """Reserve the slots of open appointments booked before slot reservations existed.
+
+    Appointments whose date/time can't be parsed, or whose slot is already
+    taken by another booking, are counted but left alone.
+    """
+    from slots import format_minutes, parse_date, parse_minutes
+
+    counts = {"reserved": 0, "unparseable": 0, "conflicts": 0}
+    requests = []
+    appointments = db.appointments.find(
+        {"status": {"$in": ["pending", "confirmed"]}},
+        {"_id": 0, "appointment_id": 1, "vet_id": 1, "appointment_date": 1, "appointment_time": 1, "created_at": 1}
+    )
+    async for appointment in appointments:
+        try:
+            slot_date = parse_date(appointment["appointment_date"]).isoformat()
+            slot_time = format_minutes(parse_minutes(appointment["appointment_time"]))
+        except ValueError:
+            counts["unparseable"] += 1
+            continue
+        requests.append(UpdateOne(
+            {"appointment_id": appointment["appointment_id"]},
+            {"$setOnInsert": {
+                "vet_id": appointment["vet_id"],
+                "date": slot_date,
+                "time": slot_time,
+                "created_at": appointment["created_at"]
+            }},
+            upsert=True
+        ))
+
+    if requests:
+        try:
+            result = await db.slot_reservations.bulk_write(requests, ordered=False)
+            counts["reserved"] = result.upserted_count
+        except BulkWriteError as e:
+            counts["reserved"] = e.details["nUpserted"]
+            counts["conflicts"] = len(e.details["writeErrors"])
+    return counts
+
+
+async def _main(command: str):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    try:
+        if command == "ensure":
+            for collection_name, names in (await ensure_indexes(db)).items():
+                print(f"{collection_name}: {', '.join(names)}")
+        elif command == "verify":
+            missing = await verify_indexes(db)
+            for collection_name, names in missing.items():
+                print(f"{collection_name}: missing {', '.join(names)}")
+            if not missing:
+                print("All indexes present")
+            return 1 if missing else 0
+        elif command == "explain":
+            collscans = 0
+            for entry in await explain_queries(db):
+                flag = "ok  " if entry["uses_index"] else "SCAN"
+                collscans += not entry["uses_index"]
+                print(f"{flag} {entry['collection']} {entry['filter']} -> {' <- '.join(entry['stages'])}")
+            for collection_name, counts in (await index_usage(db)).items():
+                for name, ops in counts.items():
+                    print(f"usage {collection_name}.{name}: {ops}")
+            return 1 if collscans else 0
+        elif command == "migrate-sessions":
+            print(f"Converted {await migrate_session_dates(db)} sessions")
+        elif command == "backfill-slots":
+            counts = await backfill_slot_reservations(db)
+            print(", ".join(f"{name}: {count}" for name, count in counts.items()))
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes")
+    parser.add_argument("command", choices=["ensure", "verify", "explain", "migrate-sessions", "backfill-slots"])
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.command)))
@@ -0,0 +1,473 @@
+"""In-memory repositories with the same behaviour as the MongoDB ones.
+
+Used with DATA_BACKEND=memory to benchmark or test the API without mongod.
+Data lives in dicts in this process only and is lost on restart. Every
+method completes without awaiting, so conditional updates are atomic on
+the event loop just as they are in MongoDB. Unique indexes are enforced
+with pymongo's DuplicateKeyError, docs are copied in and out like a
+driver round trip, and list queries walk sorted (created_at, id) key
+lists mirroring the compound indexes in indexes.py.
+"""
+import copy
+import math
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from pagination import decode_cursor, paginate_keys
+from repositories import EARTH_RADIUS_M, Page, Repositories
+
+
+def _copy(doc: Dict, *hidden: str) -> Dict:
+    """Detached copy of a stored doc, as a driver would return it"""
+    return {
+        key: copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+        for key, value in doc.items()
+        if key not in hidden
+    }
+
+
+def _duplicate(index_name: str, value) -> DuplicateKeyError:
+    return DuplicateKeyError(f"E11000 duplicate key error index: {index_name} dup key: {value!r}", 11000)
+
+
+def _distance(latitude: float, longitude: float, point: Dict) -> float:
+    """Great-circle distance in metres to a GeoJSON point, as spherical $geoNear computes it"""
+    point_longitude, point_latitude = point["coordinates"]
+    phi1, phi2 = math.radians(latitude), math.radians(point_latitude)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(point_longitude - longitude)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SortedKeys:
+    """Sorted (sort_value, doc_id) lists per key, like a compound index prefix"""
+
+    def __init__(self):
+        self._keys: Dict[Hashable, List[Tuple[str, str]]] = defaultdict(list)
+
+    def add(self, key: Hashable, sort_value: str, doc_id: str):
+        insort(self._keys[key], (sort_value, doc_id))
+
+    def remove(self, key: Hashable, sort_value: str, doc_id: str):
+        keys = self._keys.get(key)
+        if not keys:
+            return
+        position = bisect_left(keys, (sort_value, doc_id))
+        if position < len(keys) and keys[position] == (sort_value, doc_id):
+            del keys[position]
+
+    def get(self, key: Hashable) -> List[Tuple[str, str]]:
+        return self._keys.get(key, [])
+
+
+class MemoryUserRepository:
+    def __init__(self):
+        self._users: Dict[str, Dict] = {}
+        self._by_email: Dict[str, str] = {}
+
+    async def get(self, user_id: str) -> Optional[Dict]:
+        user = self._users.get(user_id)
+        return _copy(user) if user else None
+
+    async def get_by_email(self, email: str) -> Optional[Dict]:
+        user_id = self._by_email.get(email)
+        return _copy(self._users[user_id]) if user_id else None
+
+    async def get_summaries(self, user_ids: List[str]) -> Dict[str, Dict]:
+        summaries = {}
+        for user_id in user_ids:
+            user = self._users.get(user_id)
+            if user:
+                summaries[user_id] = {key: user[key] for key in ("user_id", "name", "picture") if key in user}
+        return summaries
+
+    async def insert(self, user: Dict):
+        self._insert(_copy(user, "_id"))
+
+    def _insert(self, user: Dict):
+        if user["user_id"] in self._users:
+            raise _duplicate("user_id_unique", user["user_id"])
+        if user["email"] in self._by_email:
+            raise _duplicate("email_unique", user["email"])
+        self._users[user["user_id"]] = user
+        self._by_email[user["email"]] = user["user_id"]
+
+    async def upsert_oauth(self, email: str, fields: Dict, new_user: Dict) -> Dict:
+        user_id = self._by_email.get(email)
+        if user_id:
+            user = self._users[user_id]
+            user.update(copy.deepcopy(fields))
+        else:
+            user = {"email": email, **copy.deepcopy(fields), **copy.deepcopy(new_user)}
+            self._insert(user)
+        return _copy(user, "password")
+
+    async def set_fields(self, user_id: str, fields: Dict):
+        user = self._users.get(user_id)
+        if user:
+            user.update(copy.deepcopy(fields))
+
+    async def replace_password(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        user = self._users.get(user_id)
+        if not user or user.get("password") != old_hash:
+            return False
+        user["password"] = new_hash
+        return True
+
+
+class MemorySessionRepository:
+    def __init__(self):
+        self._sessions: Dict[str, Dict] = {}
+        self._tickets: Dict[str, Dict] = {}
+
+    async def put(self, session: Dict):
+        self._sessions[session["session_token"]] = _copy(session, "_id")
+
+    async def get(self, session_token: str) -> Optional[Dict]:
+        session = self._sessions.get(session_token)
+        return _copy(session) if session else None
+
+    async def delete(self, session_token: str):
+        self._sessions.pop(session_token, None)
+
+    async def put_ticket(self, ticket: Dict):
+        self._tickets[ticket["ticket"]] = _copy(ticket, "_id")
+
+    async def take_ticket(self, ticket_id: str) -> Optional[Dict]:
+        return self._tickets.pop(ticket_id, None)
+
+
+class MemoryVetProfileRepository:
+    def __init__(self):
+        self._profiles: Dict[str, Dict] = {}
+
+    async def get(self, user_id: str) -> Optional[Dict]:
+        profile = self._profiles.get(user_id)
+        return _copy(profile, "geo") if profile else None
+
+    async def insert(self, profile: Dict):
+        if profile["user_id"] in self._profiles:
+            raise _duplicate("user_id_unique", profile["user_id"])
+        self._profiles[profile["user_id"]] = _copy(profile, "_id")
+
+    async def set_fields(self, user_id: str, fields: Dict) -> Optional[Dict]:
+        profile = self._profiles.get(user_id)
+        if not profile:
+            return None
+        profile.update(copy.deepcopy(fields))
+        return _copy(profile, "geo")
+
+    async def search(self, specialty: Optional[str] = None, location: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        patterns = [
+            (field, re.compile(pattern, re.IGNORECASE))
+            for field, pattern in (("specialty", specialty), ("location", location))
+            if pattern
+        ]
+        matches = []
+        for profile in self._profiles.values():
+            if profile.get("available") is not True:
+                continue
+            if all(isinstance(profile.get(field), str) and regex.search(profile[field]) for field, regex in patterns):
+                matches.append(_copy(profile, "geo"))
+                if len(matches) == limit:
+                    break
+        return matches
+
+    async def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        max_distance: float,
+        limit: int,
+        specialty: Optional[str] = None,
+        exclude_user_id: Optional[str] = None,
+        after: Optional[Tuple[float, str]] = None,
+    ) -> List[Dict]:
+        ranked = []
+        for profile in self._profiles.values():
+            if not profile.get("geo") or profile.get("available") is not True:
+                continue
+            if specialty and profile.get("specialty") != specialty:
+                continue
+            if exclude_user_id and profile["user_id"] == exclude_user_id:
+                continue
+            distance = _distance(latitude, longitude, profile["geo"])
+            if distance > max_distance:
+                continue
+            if after and (distance, profile["user_id"]) <= after:
+                continue
+            ranked.append((distance, profile["user_id"]))
+
+        ranked.sort()
+        return [
+            {**_copy(self._profiles[user_id], "geo"), "distance": distance}
+            for distance, user_id in ranked[:limit]
+        ]
+
+
+class MemoryAppointmentRepository:
+    def __init__(self):
+        self._appointments: Dict[str, Dict] = {}
+        self._by_user = SortedKeys()
+        self._reservations: Dict[str, Dict[Tuple[str, str], str]] = defaultdict(dict)
+        self._slot_of: Dict[str, Tuple[str, str, str]] = {}
+
+    async def get(self, appointment_id: str) -> Optional[Dict]:
+        appointment = self._appointments.get(appointment_id)
+        return _copy(appointment) if appointment else None
+
+    async def insert(self, appointment: Dict):
+        appointment = _copy(appointment, "_id")
+        appointment_id = appointment["appointment_id"]
+        if appointment_id in self._appointments:
+            raise _duplicate("appointment_id_unique", appointment_id)
+        self._appointments[appointment_id] = appointment
+        for user_field in ("vet_id", "pet_owner_id"):
+            self._by_user.add((user_field, appointment[user_field]), appointment["created_at"], appointment_id)
+
+    async def page_for_user(self, user_field: str, user_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        appointment_ids, next_cursor = paginate_keys(self._by_user.get((user_field, user_id)), limit, before, after)
+        return [_copy(self._appointments[appointment_id]) for appointment_id in appointment_ids], next_cursor
+
+    async def transition(self, appointment_id: str, from_statuses: List[str], status: str, user_id: str, user_fields: Iterable[str]) -> Optional[Dict]:
+        appointment = self._appointments.get(appointment_id)
+        if not appointment or appointment["status"] not in from_statuses:
+            return None
+        if not any(appointment.get(field) == user_id for field in user_fields):
+            return None
+        appointment["status"] = status
+        return _copy(appointment)
+
+    async def mark_paid(self, appointment_id: str):
+        appointment = self._appointments.get(appointment_id)
+        if appointment:
+            appointment["payment_status"] = "paid"
+            if appointment["status"] == "pending":
+                appointment["status"] = "confirmed"
+
+    async def reserve_slot(self, reservation: Dict):
+        slots = self._reservations[reservation["vet_id"]]
+        slot = (reservation["date"], reservation["time"])
+        if slot in slots:
+            raise _duplicate("vet_id_date_time_unique", (reservation["vet_id"], *slot))
+        slots[slot] = reservation["appointment_id"]
+        self._slot_of[reservation["appointment_id"]] = (reservation["vet_id"], *slot)
+
+    async def release_slot(self, appointment_id: str):
+        slot = self._slot_of.pop(appointment_id, None)
+        if slot:
+            self._reservations[slot[0]].pop(slot[1:], None)
+
+    async def taken_slots(self, vet_id: str, start_date: str, end_date: str) -> Set[Tuple[str, str]]:
+        return {slot for slot in self._reservations.get(vet_id, {}) if start_date <= slot[0] <= end_date}
+
+
+def _dispatched_to(emergency_request: Dict, vet_id: str) -> bool:
+    return emergency_request.get("dispatch_broadcast") is not False or vet_id in emergency_request.get("notified_vet_ids", [])
+
+
+class MemoryEmergencyRepository:
+    def __init__(self):
+        self._requests: Dict[str, Dict] = {}
+        self._by_owner = SortedKeys()
+        # Active requests by (created_at, request_id), and all by (updated_at, request_id)
+        self._active = SortedKeys()
+        self._by_updated_at: List[Tuple[str, str]] = []
+
+    async def get(self, request_id: str) -> Optional[Dict]:
+        emergency_request = self._requests.get(request_id)
+        return _copy(emergency_request) if emergency_request else None
+
+    async def insert(self, emergency_request: Dict):
+        emergency_request = _copy(emergency_request, "_id")
+        request_id = emergency_request["request_id"]
+        if request_id in self._requests:
+            raise _duplicate("request_id_unique", request_id)
+        self._requests[request_id] = emergency_request
+        self._by_owner.add(emergency_request["pet_owner_id"], emergency_request["created_at"], request_id)
+        if emergency_request["status"] == "active":
+            self._active.add(None, emergency_request["created_at"], request_id)
+        insort(self._by_updated_at, (emergency_request["updated_at"], request_id))
+
+    def _set(self, emergency_request: Dict, fields: Dict) -> Dict:
+        request_id = emergency_request["request_id"]
+        was_active = emergency_request["status"] == "active"
+        old_updated_at = emergency_request["updated_at"]
+        emergency_request.update(copy.deepcopy(fields))
+
+        is_active = emergency_request["status"] == "active"
+        if was_active and not is_active:
+            self._active.remove(None, emergency_request["created_at"], request_id)
+        elif is_active and not was_active:
+            self._active.add(None, emergency_request["created_at"], request_id)
+        if emergency_request["updated_at"] != old_updated_at:
+            position = bisect_left(self._by_updated_at, (old_updated_at, request_id))
+            if position < len(self._by_updated_at) and self._by_updated_at[position] == (old_updated_at, request_id):
+                del self._by_updated_at[position]
+            insort(self._by_updated_at, (emergency_request["updated_at"], request_id))
+        return _copy(emergency_request)
+
+    async def page_for_owner(self, pet_owner_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        return self._page(self._by_owner.get(pet_owner_id), limit, before, after)
+
+    async def page_dispatched_to(self, vet_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        return self._page(
+            self._active.get(None), limit, before, after,
+            lambda request_id: _dispatched_to(self._requests[request_id], vet_id)
+        )
+
+    def _page(self, keys, limit, before, after, accept: Optional[Callable[[str], bool]] = None) -> Page:
+        request_ids, next_cursor = paginate_keys(keys, limit, before, after, accept)
+        return [_copy(self._requests[request_id]) for request_id in request_ids], next_cursor
+
+    async def update_if(self, request_id: str, conditions: Dict, fields: Dict) -> Optional[Dict]:
+        emergency_request = self._requests.get(request_id)
+        if not emergency_request or any(emergency_request.get(key) != value for key, value in conditions.items()):
+            return None
+        return self._set(emergency_request, fields)
+
+    async def accept(self, request_id: str, vet_id: str, fields: Dict) -> Optional[Dict]:
+        emergency_request = self._requests.get(request_id)
+        if not emergency_request or emergency_request["status"] != "active" or not _dispatched_to(emergency_request, vet_id):
+            return None
+        return self._set(emergency_request, fields)
+
+    async def due_for_next_wave(self, now: str, limit: int = 100) -> List[Dict]:
+        due = []
+        for _, request_id in self._active.get(None):
+            next_wave_at = self._requests[request_id].get("dispatch_next_wave_at")
+            if next_wave_at is not None and next_wave_at <= now:
+                due.append(_copy(self._requests[request_id]))
+                if len(due) == limit:
+                    break
+        return due
+
+    async def changed_since(self, cursor: str, limit: int = 1000) -> List[Dict]:
+        position = bisect_right(self._by_updated_at, decode_cursor(cursor))
+        return [_copy(self._requests[request_id]) for _, request_id in self._by_updated_at[position:position + limit]]
+
+
+class MemoryChatRepository:
+    def __init__(self):
+        self._chats: Dict[str, Dict] = {}
+        self._by_pair: Dict[Tuple[str, str], str] = {}
+        self._by_user = SortedKeys()
+
+    async def get(self, chat_id: str) -> Optional[Dict]:
+        chat = self._chats.get(chat_id)
+        return _copy(chat) if chat else None
+
+    async def get_between(self, pet_owner_id: str, vet_id: str) -> Optional[Dict]:
+        chat_id = self._by_pair.get((pet_owner_id, vet_id))
+        return _copy(self._chats[chat_id]) if chat_id else None
+
+    async def insert(self, chat: Dict):
+        chat = _copy(chat, "_id")
+        pair = (chat["pet_owner_id"], chat["vet_id"])
+        if chat["chat_id"] in self._chats:
+            raise _duplicate("chat_id_unique", chat["chat_id"])
+        if pair in self._by_pair:
+            raise _duplicate("pet_owner_id_vet_id_unique", pair)
+        self._chats[chat["chat_id"]] = chat
+        self._by_pair[pair] = chat["chat_id"]
+        for user_field in ("vet_id", "pet_owner_id"):
+            self._by_user.add((user_field, chat[user_field]), chat["created_at"], chat["chat_id"])
+
+    async def page_for_user(self, user_field: str, user_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        chat_ids, next_cursor = paginate_keys(self._by_user.get((user_field, user_id)), limit, before, after)
+        return [_copy(self._chats[chat_id]) for chat_id in chat_ids], next_cursor
+
+    async def set_last_messages(self, summaries: Dict[str, Tuple[str, str]]):
+        for chat_id, (content, created_at) in summaries.items():
+            chat = self._chats.get(chat_id)
+            if chat and not (chat.get("last_message_at") is not None and chat["last_message_at"] >= created_at):
+                chat["last_message"] = content
+                chat["last_message_at"] = created_at
+
+
+class MemoryMessageRepository:
+    def __init__(self):
+        self._messages: Dict[str, Dict] = {}
+        self._by_chat = SortedKeys()
+
+    async def get(self, chat_id: str, message_id: str) -> Optional[Dict]:
+        message = self._messages.get(message_id)
+        return _copy(message) if message and message["chat_id"] == chat_id else None
+
+    async def insert(self, message: Dict):
+        message = _copy(message, "_id")
+        if message["message_id"] in self._messages:
+            raise _duplicate("message_id_unique", message["message_id"])
+        self._messages[message["message_id"]] = message
+        self._by_chat.add(message["chat_id"], message["created_at"], message["message_id"])
+
+    async def page(self, chat_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        message_ids, next_cursor = paginate_keys(self._by_chat.get(chat_id), limit, before, after)
+        return [_copy(self._messages[message_id]) for message_id in message_ids], next_cursor
+
+
+class MemoryPaymentRepository:
+    def __init__(self):
+        self._payments: Dict[str, Dict] = {}
+        self._events: Dict[str, Dict] = {}
+
+    async def get_by_session(self, session_id: str) -> Optional[Dict]:
+        payment = self._payments.get(session_id)
+        return _copy(payment) if payment else None
+
+    async def insert(self, payment_transaction: Dict):
+        if payment_transaction["session_id"] in self._payments:
+            raise _duplicate("session_id_unique", payment_transaction["session_id"])
+        self._payments[payment_transaction["session_id"]] = _copy(payment_transaction, "_id")
+
+    async def mark_paid(self, session_id: str) -> Optional[Dict]:
+        payment = self._payments.get(session_id)
+        if not payment or payment["payment_status"] == "paid":
+            return None
+        payment["payment_status"] = "paid"
+        return _copy(payment)
+
+    async def record_event(self, event: Dict):
+        if event["event_id"] in self._events:
+            raise _duplicate("event_id_unique", event["event_id"])
+        self._events[event["event_id"]] = _copy(event, "_id")
+
+    async def claim_event(self, event_id: str, claimed_at) -> Optional[Dict]:
+        event = self._events.get(event_id)
+        if not event or event["status"] != "pending":
+            return None
+        event.update({"status": "processing", "claimed_at": claimed_at, "attempts": event.get("attempts", 0) + 1})
+        return _copy(event)
+
+    async def set_event_fields(self, event_id: str, fields: Dict):
+        event = self._events.get(event_id)
+        if event:
+            event.update(copy.deepcopy(fields))
+
+    async def stale_events(self, cutoff, limit: int) -> List[str]:
+        stale = []
+        for event in self._events.values():
+            if event["status"] == "processing" and event["claimed_at"] < cutoff:
+                event["status"] = "pending"
+            if event["status"] == "pending" and event["received_at"] < cutoff and len(stale) < limit:
+                stale.append(event["event_id"])
+        return stale
+
+
+def create_memory_repositories() -> Repositories:
+    return Repositories(
+        users=MemoryUserRepository(),
+        sessions=MemorySessionRepository(),
+        vet_profiles=MemoryVetProfileRepository(),
+        appointments=MemoryAppointmentRepository(),
+        emergencies=MemoryEmergencyRepository(),
+        chats=MemoryChatRepository(),
+        messages=MemoryMessageRepository(),
+        payments=MemoryPaymentRepository(),
+        backend="memory"
+    )
@@ -0,0 +1,195 @@
+"""Per-route request and MongoDB metrics in the Prometheus text format.
+
+`MetricsMiddleware` times every HTTP request and counts it by method,
+matched route template and status code. `MongoCommandMetrics` is a pymongo
+command listener that charges each MongoDB command to the request that
+issued it. Motor runs commands on executor threads but copies contextvars
+into them, so the request's ASGI scope is visible there, and FastAPI has
+already stored the matched route in it. Commands issued outside a request
+(dispatch sweeps, chat summary flushes, webhook workers) are reported
+under route="<background>".
+
+A series, with its label text formatted once, is created on the first
+request to each route/method; after that a request only bumps counters.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from pymongo.monitoring import CommandListener
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_BUCKET_LABELS = [f'le="{bound:g}"' for bound in LATENCY_BUCKETS] + ['le="+Inf"']
+
+UNMATCHED_ROUTE = "<unmatched>"
+BACKGROUND_ROUTE = "<background>"
+
+_current_scope: ContextVar[Optional[Dict]] = ContextVar("metrics_scope", default=None)
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RouteSeries:
+    """Counters for one method and route template"""
+
+    __slots__ = ("labels", "statuses", "buckets", "seconds", "mongo")
+
+    def __init__(self, method: str, route: str):
+        self.labels = f'method="{_label_value(method)}",route="{_label_value(route)}"'
+        self.statuses: Dict[int, int] = {}
+        self.buckets = [0] * len(_BUCKET_LABELS)
+        self.seconds = 0.0
+        # command name -> [count, failures, seconds]
+        self.mongo: Dict[str, List] = {}
+
+    def observe(self, status: int, seconds: float):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.seconds += seconds
+
+
+class Metrics:
+    """Registry of route series.
+
+    Request counters are only touched on the event loop. MongoDB counters
+    are updated from driver threads, so they (and series creation) take
+    the lock.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        # route template -> method -> series
+        self._series: Dict[str, Dict[str, RouteSeries]] = {}
+
+    def series(self, scope: Optional[Dict]) -> RouteSeries:
+        if scope is None:
+            path, method = BACKGROUND_ROUTE, ""
+        else:
+            route = scope.get("route")
+            path = route.path if route is not None else UNMATCHED_ROUTE
+            method = scope.get("method", "WEBSOCKET")
+        by_method = self._series.get(path)
+        series = by_method.get(method) if by_method else None
+        if series is None:
+            with self._lock:
+                by_method = self._series.setdefault(path, {})
+                series = by_method.get(method)
+                if series is None:
+                    series = by_method[method] = RouteSeries(method, path)
+        return series
+
+    def observe_command(self, command: str, seconds: float, failed: bool):
+        series = self.series(_current_scope.get())
+        with self._lock:
+            entry = series.mongo.get(command)
+            if entry is None:
+                entry = series.mongo[command] = [0, 0, 0.0]
+            entry[0] += 1
+            entry[1] += failed
+            entry[2] += seconds
+
+    def render(self) -> str:
+        with self._lock:
+            all_series = [series for by_method in self._series.values() for series in by_method.values()]
+            mongo = [(series.labels, dict(series.mongo)) for series in all_series]
+
+        lines = [
+            "# HELP http_requests_in_flight HTTP requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_requests_total HTTP requests by route template and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for series in all_series:
+            for status, count in sorted(series.statuses.items()):
+                lines.append(f'http_requests_total{{{series.labels},status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Time from receiving a request to finishing its response.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for series in all_series:
+            if not series.statuses:
+                continue
+            cumulative = 0
+            for bucket_label, count in zip(_BUCKET_LABELS, series.buckets):
+                cumulative += count
+                lines.append(f"http_request_duration_seconds_bucket{{{series.labels},{bucket_label}}} {cumulative}")
+            lines.append(f"http_request_duration_seconds_sum{{{series.labels}}} {series.seconds}")
+            lines.append(f"http_request_duration_seconds_count{{{series.labels}}} {cumulative}")
+
+        lines += [
+            "# HELP mongodb_command_duration_seconds MongoDB commands by the route that issued them.",
+            "# TYPE mongodb_command_duration_seconds summary",
+        ]
+        failures = []
+        for labels, commands in mongo:
+            for command, (count, failed, seconds) in sorted(commands.items()):
+                command_labels = f'{labels},command="{_label_value(command)}"'
+                lines.append(f"mongodb_command_duration_seconds_count{{{command_labels}}} {count}")
+                lines.append(f"mongodb_command_duration_seconds_sum{{{command_labels}}} {seconds}")
+                failures.append(f"mongodb_command_failures_total{{{command_labels}}} {failed}")
+        lines += [
+            "# HELP mongodb_command_failures_total Failed MongoDB commands by the route that issued them.",
+            "# TYPE mongodb_command_failures_total counter",
+        ] + failures
+        return "\n".join(lines) + "\n"
+
+
+class MongoCommandMetrics(CommandListener):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metrics.observe_command(event.command_name, event.duration_micros / 1e6, False)
+
+    def failed(self, event):
+        self.metrics.observe_command(event.command_name, event.duration_micros / 1e6, True)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed to their last byte"""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            # Websocket handlers still get their MongoDB commands attributed
+            token = _current_scope.set(scope) if scope["type"] == "websocket" else None
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                if token is not None:
+                    _current_scope.reset(token)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        token = _current_scope.set(scope)
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.in_flight -= 1
+            metrics.series(scope).observe(status, elapsed)
+            _current_scope.reset(token)
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+from pymongo.errors import PyMongoError
+from pymongo.monitoring import CommandListener, ConnectionPoolListener
+
+
+class PoolStats(ConnectionPoolListener):
+    """Counts connection pool events so the health check can report pool usage.
+
+    pymongo has no public pool introspection; these CMAP callbacks run on
+    driver threads, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.created = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def _add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(open=-1)
+
+    def connection_check_out_started(self, event):
+        self._add(waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._add(waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._add(waiting=-1, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._add(in_use=-1)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "open": self.open,
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "created": self.created,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+            }
+
+
+def create_client(
+    url: str,
+    pool_stats: Optional[PoolStats] = None,
+    command_listener: Optional[CommandListener] = None,
+    max_pool_size: int = 100,
+    min_pool_size: int = 0,
+    max_idle_time_ms: Optional[int] = None,
+    wait_queue_timeout_ms: Optional[int] = None,
+    server_selection_timeout_ms: int = 5000,
+    connect_timeout_ms: int = 5000,
+    socket_timeout_ms: Optional[int] = None,
+) -> AsyncIOMotorClient:
+    """Motor client with explicit pool limits and timeouts.
+
+    Motor connects lazily, so this does no I/O; the first operation (or
+    `ping`) opens the pool.
+    """
+    return AsyncIOMotorClient(
+        url,
+        maxPoolSize=max_pool_size,
+        minPoolSize=min_pool_size,
+        maxIdleTimeMS=max_idle_time_ms,
+        waitQueueTimeoutMS=wait_queue_timeout_ms,
+        serverSelectionTimeoutMS=server_selection_timeout_ms,
+        connectTimeoutMS=connect_timeout_ms,
+        socketTimeoutMS=socket_timeout_ms,
+        event_listeners=[listener for listener in (pool_stats, command_listener) if listener],
+    )
+
+
+def read_preference(name: str):
+    """Map a URI-style mode name (e.g. "secondaryPreferred") to a pymongo read preference"""
+    modes = {
+        "primary": ReadPreference.PRIMARY,
+        "primarypreferred": ReadPreference.PRIMARY_PREFERRED,
+        "secondary": ReadPreference.SECONDARY,
+        "secondarypreferred": ReadPreference.SECONDARY_PREFERRED,
+        "nearest": ReadPreference.NEAREST,
+    }
+    try:
+        return modes[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown read preference: {name}")
+
+
+async def ping(client: AsyncIOMotorClient, timeout: Optional[float] = None) -> Dict:
+    """Round-trip a ping; returns {"ok": bool, "latency_ms": float, "error": str?}.
+
+    Without `timeout` an unreachable server fails after the client's
+    server selection timeout.
+    """
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+    except (PyMongoError, asyncio.TimeoutError) as e:
+        error = str(e) or "ping timed out"
+        return {"ok": False, "latency_ms": round((time.perf_counter() - started) * 1000, 2), "error": error}
+    return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import random
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_DATA_URL = "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+
+
+class OAuthSessionInvalid(Exception):
+    """The OAuth provider rejected the session id"""
+
+
+class OAuthUnavailable(Exception):
+    """The OAuth provider could not be reached after retrying"""
+
+
+class OAuthClient:
+    """App-lifetime client for exchanging OAuth session ids for user data.
+
+    One aiohttp session with a keep-alive connector is shared by every
+    login, so only the first call pays for DNS and the TLS handshake.
+    aiohttp is imported and the session created on first use. Connection
+    errors, timeouts and 5xx/429 responses are retried with exponential
+    backoff and full jitter; other 4xx responses fail immediately.
+    """
+
+    def __init__(
+        self,
+        session_data_url: str = DEFAULT_SESSION_DATA_URL,
+        timeout: float = 10.0,
+        connect_timeout: float = 3.0,
+        max_connections: int = 20,
+        keepalive_timeout: float = 60.0,
+        max_attempts: int = 3,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+    ):
+        self.session_data_url = session_data_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=300
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+            )
+        return self._session
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def get_session_data(self, session_id: str) -> Dict:
+        """User data (email, name, picture, session_token) for an OAuth session id"""
+        import aiohttp
+
+        session = self._get_session()
+        error: Optional[str] = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with session.get(self.session_data_url, headers={"X-Session-ID": session_id}) as resp:
+                    if resp.status == 200:
+                        return await resp.json()
+                    if resp.status < 500 and resp.status != 429:
+                        raise OAuthSessionInvalid(f"OAuth provider returned {resp.status}")
+                    error = f"OAuth provider returned {resp.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            if attempt < self.max_attempts:
+                self.retries += 1
+                logger.warning(f"OAuth session-data attempt {attempt} failed: {error}; retrying")
+                await asyncio.sleep(self._backoff(attempt))
+
+        raise OAuthUnavailable(error)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,63 @@
+"""Local stand-in for the OAuth session-data endpoint, for development and load tests.
+
+    python oauth_standin.py --port 8055 --fail-rate 0.2 --latency-ms 50
+    python oauth_standin.py --fail-first 2
+    OAUTH_SESSION_DATA_URL=http://localhost:8055/auth/v1/env/oauth/session-data uvicorn server:app
+
+Any X-Session-ID is accepted and maps to a stable fake user, except ids
+starting with "invalid", which get a 401. --fail-rate answers that share of
+requests with a 503 to exercise the client's retries; --fail-first does so
+for the first N requests.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+
+from aiohttp import web
+
+SESSION_DATA_PATH = "/auth/v1/env/oauth/session-data"
+
+# Request count, as {"received": n}
+STATS = web.AppKey("stats", dict)
+
+
+def session_data(session_id: str) -> dict:
+    user_key = hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:10]
+    return {
+        "id": user_key,
+        "email": f"oauth_{user_key}@example.com",
+        "name": f"OAuth User {user_key[:4]}",
+        "picture": None,
+        "session_token": f"session_{hashlib.sha256(('token' + session_id).encode('utf-8')).hexdigest()[:32]}"
+    }
+
+
+def create_app(fail_rate: float = 0.0, latency_ms: float = 0.0, fail_first: int = 0) -> web.Application:
+    async def handle(request: web.Request) -> web.Response:
+        stats = request.app[STATS]
+        stats["received"] += 1
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        session_id = request.headers.get("X-Session-ID")
+        if not session_id or session_id.startswith("invalid"):
+            return web.json_response({"detail": "Invalid session"}, status=401)
+        if stats["received"] <= fail_first or random.random() < fail_rate:
+            return web.json_response({"detail": "Unavailable"}, status=503)
+        return web.json_response(session_data(session_id))
+
+    app = web.Application()
+    app[STATS] = {"received": 0}
+    app.router.add_get(SESSION_DATA_PATH, handle)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in OAuth session-data server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8055)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--fail-first", type=int, default=0, help="answer the first N requests with a 503")
+    args = parser.parse_args()
+    web.run_app(create_app(args.fail_rate, args.latency_ms, args.fail_first), host=args.host, port=args.port)
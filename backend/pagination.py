@@ -0,0 +1,129 @@
+import base64
+import binascii
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(doc: Dict, id_field: str, sort_field: str = "created_at") -> str:
+    return encode_key(doc[sort_field], doc[id_field])
+
+
+def encode_key(sort_value, doc_id: str) -> str:
+    raw = f"{sort_value}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        sort_value, doc_id = raw.split("|", 1)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return sort_value, doc_id
+
+
+def keyset_filter(cursor: str, id_field: str, op: str, sort_field: str = "created_at") -> Dict:
+    """Match docs strictly after ($gt) or before ($lt) the cursor on (sort_field, id)"""
+    sort_value, doc_id = decode_cursor(cursor)
+    return {"$or": [
+        {sort_field: {op: sort_value}},
+        {sort_field: sort_value, id_field: {op: doc_id}},
+    ]}
+
+
+def set_next_cursor(response: Response, cursor: Optional[str]):
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
+def check_page_args(before: Optional[str], after: Optional[str]):
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+
+
+async def paginate(
+    collection,
+    query: Dict,
+    id_field: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """Keyset pagination over (created_at, id_field), oldest first.
+
+    With `before` the page holds the `limit` docs immediately preceding the
+    cursor (e.g. older chat history); otherwise the docs following `after`,
+    or the first page. Returns the page and, when more docs exist in the
+    same direction, the cursor to continue with (for the X-Next-Cursor
+    response header).
+    """
+    check_page_args(before, after)
+
+    cursor = before or after
+    if cursor:
+        query = {"$and": [query, keyset_filter(cursor, id_field, "$lt" if before else "$gt")]}
+
+    direction = -1 if before else 1
+    docs = await collection.find(query, {"_id": 0}).sort(
+        [("created_at", direction), (id_field, direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if before:
+        docs.reverse()
+
+    next_cursor = None
+    if has_more:
+        edge = docs[0] if before else docs[-1]
+        next_cursor = encode_cursor(edge, id_field)
+
+    return docs, next_cursor
+
+
+def paginate_keys(
+    keys: List[Tuple[str, str]],
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    accept: Optional[Callable[[str], bool]] = None,
+) -> Tuple[List[str], Optional[str]]:
+    """`paginate` over an already sorted list of (sort_value, doc_id) keys.
+
+    Returns the ids on the page and the next cursor. `accept` filters ids
+    while walking, for queries the key list doesn't fully cover.
+    """
+    check_page_args(before, after)
+
+    if before:
+        position = bisect_left(keys, decode_cursor(before)) - 1
+        step = -1
+    else:
+        position = bisect_right(keys, decode_cursor(after)) if after else 0
+        step = 1
+
+    page: List[Tuple[str, str]] = []
+    has_more = False
+    while 0 <= position < len(keys):
+        key = keys[position]
+        position += step
+        if accept is not None and not accept(key[1]):
+            continue
+        if len(page) == limit:
+            has_more = True
+            break
+        page.append(key)
+
+    if before:
+        page.reverse()
+
+    next_cursor = None
+    if has_more:
+        edge = page[0] if before else page[-1]
+        next_cursor = encode_key(*edge)
+
+    return [doc_id for _, doc_id in page], next_cursor
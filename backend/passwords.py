@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import bcrypt
+
+
+class PasswordPoolSaturated(Exception):
+    """Raised instead of queueing when too many hashes are already pending"""
+
+
+class VerificationCache:
+    """Short-lived memory of recent bcrypt verification results.
+
+    Keys are an HMAC (with a per-process random secret) of the email, the
+    password and the stored hash, so plaintext passwords are never kept and
+    a changed or rehashed password never matches an old entry. A given
+    password always verifies the same way against the same hash, so both
+    outcomes can be cached.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+    def key(self, email: str, password: str, hashed: str) -> bytes:
+        message = "\0".join((email, password, hashed)).encode('utf-8')
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def get(self, key: bytes) -> Optional[bool]:
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: bytes, verified: bool):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (verified, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool so it never blocks the event loop.
+
+    bcrypt releases the GIL while hashing, so threads give real parallelism.
+    At most `max_pending` operations may be running or queued; beyond that
+    callers get PasswordPoolSaturated and should shed load.
+    """
+
+    def __init__(
+        self,
+        rounds: int = 12,
+        max_workers: int = 4,
+        max_pending: int = 64,
+        cache_ttl: float = 60.0,
+        cache_size: int = 10000,
+        downgrade: bool = False
+    ):
+        self.rounds = rounds
+        # Also rehash hashes made with a higher cost than `rounds`
+        self.downgrade = downgrade
+        self.verification_cache = VerificationCache(ttl=cache_ttl, max_size=cache_size)
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password)
+
+    async def verify(self, password: str, hashed: str, email: Optional[str] = None) -> bool:
+        """Check a password; with `email`, repeats within the cache TTL skip bcrypt"""
+        if email is None:
+            return await self._run(self._verify, password, hashed)
+
+        key = self.verification_cache.key(email, password, hashed)
+        verified = self.verification_cache.get(key)
+        if verified is None:
+            verified = await self._run(self._verify, password, hashed)
+            self.verification_cache.set(key, verified)
+        return verified
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True when the hash was made with a lower cost than the configured one.
+
+        A lower configured cost only triggers rehashing with `downgrade`, so
+        turning BCRYPT_ROUNDS down (say, for a load test) does not rewrite
+        every stored hash on the next login.
+        """
+        try:
+            cost = int(hashed.split("$")[2])
+        except (IndexError, ValueError):
+            return False
+        return cost < self.rounds or (self.downgrade and cost != self.rounds)
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+
+    @staticmethod
+    def _verify(password: str, hashed: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordPoolSaturated()
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            "rounds": self.rounds,
+            "workers": self.max_workers,
+            "in_flight": min(self.pending, self.max_workers),
+            "queued": max(self.pending - self.max_workers, 0),
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "cache_hits": self.verification_cache.hits,
+            "cache_misses": self.verification_cache.misses,
+        }
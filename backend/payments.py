@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from emergentintegrations.payments.stripe.checkout import StripeCheckout
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutStatusCache:
+    """TTL cache of remote checkout statuses with single-flight lookups.
+
+    Concurrent lookups for the same session share one upstream call; if
+    the caller making it is cancelled, a waiting caller takes over.
+    Settled statuses are kept for `settled_ttl`, others for `ttl`; errors
+    are never cached.
+    """
+
+    def __init__(self, ttl: float = 3.0, settled_ttl: float = 300.0, max_size: int = 1000):
+        self.ttl = ttl
+        self.settled_ttl = settled_ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get(self, session_id: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(session_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        inflight = self._inflight.get(session_id)
+        if inflight is not None:
+            self.hits += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The leading caller was cancelled (e.g. its client went away); fetch ourselves
+                return await self.get(session_id, fetch)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[session_id] = future
+        try:
+            status_response = await fetch()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an exception with no other waiters isn't logged
+            future.exception()
+            raise
+        else:
+            future.set_result(status_response)
+            self._store(session_id, status_response)
+            return status_response
+        finally:
+            if not future.done():
+                # Cancelled mid-fetch; release the followers
+                future.cancel()
+            del self._inflight[session_id]
+
+    def _store(self, session_id: str, status_response: Any):
+        settled = getattr(status_response, "payment_status", None) == "paid" or getattr(status_response, "status", None) == "expired"
+        self._entries[session_id] = (time.monotonic() + (self.settled_ttl if settled else self.ttl), status_response)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class PaymentClient:
+    """App-lifetime Stripe checkout clients sharing one pooled HTTP transport.
+
+    `start` installs keep-alive HTTP clients with explicit timeouts as the
+    Stripe SDK default, so every checkout, status lookup and webhook call
+    reuses open TLS connections instead of dialing Stripe per request.
+    The Stripe SDK is only imported by `start`, which the first `checkout`
+    runs, keeping it off the worker startup path. StripeCheckout instances
+    are cached per webhook URL.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        timeout: float = 20.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 20,
+        max_retries: int = 2,
+        api_base: Optional[str] = None,
+        max_clients: int = 32,
+        status_ttl: float = 3.0,
+    ):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.api_base = api_base
+        self.max_clients = max_clients
+        self._http_client = None
+        self._session = None
+        self._checkouts: "OrderedDict[str, StripeCheckout]" = OrderedDict()
+        self.status_cache = CheckoutStatusCache(ttl=status_ttl)
+
+    def start(self):
+        import httpx
+        import requests
+        import stripe
+        from requests.adapters import HTTPAdapter
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        async_client = stripe.HTTPXClient(timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout))
+        self._http_client = stripe.RequestsClient(
+            timeout=(self.connect_timeout, self.timeout),
+            session=self._session,
+            async_fallback_client=async_client
+        )
+
+        stripe.default_http_client = self._http_client
+        stripe.max_network_retries = self.max_retries
+        if self.api_base:
+            # e.g. a local stripe-mock instance
+            stripe.api_base = self.api_base
+
+    def checkout(self, webhook_url: str = "") -> "StripeCheckout":
+        checkout = self._checkouts.get(webhook_url)
+        if checkout is None:
+            from emergentintegrations.payments.stripe.checkout import StripeCheckout
+
+            if self._http_client is None:
+                self.start()
+            checkout = StripeCheckout(api_key=self.api_key, webhook_url=webhook_url)
+            self._checkouts[webhook_url] = checkout
+            if len(self._checkouts) > self.max_clients:
+                self._checkouts.popitem(last=False)
+        else:
+            self._checkouts.move_to_end(webhook_url)
+        return checkout
+
+    async def get_checkout_status(self, session_id: str):
+        return await self.status_cache.get(
+            session_id, lambda: self.checkout().get_checkout_status(session_id)
+        )
+
+    async def close(self):
+        self._checkouts.clear()
+        if self._http_client is not None:
+            try:
+                self._session.close()
+                await self._http_client.close_async()
+            except Exception as e:
+                logger.warning(f"Error closing Stripe HTTP client: {e}")
+            self._http_client = None
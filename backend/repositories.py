@@ -0,0 +1,388 @@
+"""Data access for the API, one repository per collection.
+
+Handlers go through `Repositories` rather than the Motor database, so the
+app can run against MongoDB (`DATA_BACKEND=mongo`, the default) or the
+in-memory implementation in memory_repositories.py (`DATA_BACKEND=memory`)
+for benchmarks and tests on a machine without mongod. Both return plain
+dicts without `_id`, raise pymongo's DuplicateKeyError on unique
+violations and apply conditional updates atomically.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+from pagination import keyset_filter, paginate
+
+Page = Tuple[List[Dict], Optional[str]]
+
+# Earth radius MongoDB uses for spherical $geoNear distances
+EARTH_RADIUS_M = 6378100.0
+
+
+class UserRepository:
+    def __init__(self, db):
+        self.collection = db.users
+
+    async def get(self, user_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"user_id": user_id}, {"_id": 0})
+
+    async def get_by_email(self, email: str) -> Optional[Dict]:
+        return await self.collection.find_one({"email": email}, {"_id": 0})
+
+    async def get_summaries(self, user_ids: List[str]) -> Dict[str, Dict]:
+        """user_id -> {user_id, name, picture} with a single $in query"""
+        user_docs = await self.collection.find(
+            {"user_id": {"$in": user_ids}},
+            {"_id": 0, "user_id": 1, "name": 1, "picture": 1}
+        ).to_list(len(user_ids))
+        return {user_doc["user_id"]: user_doc for user_doc in user_docs}
+
+    async def insert(self, user: Dict):
+        await self.collection.insert_one(dict(user))
+
+    async def upsert_oauth(self, email: str, fields: Dict, new_user: Dict) -> Dict:
+        """Set `fields` on the user with this email, creating it from `new_user` if missing"""
+        return await self.collection.find_one_and_update(
+            {"email": email},
+            {"$set": fields, "$setOnInsert": new_user},
+            {"_id": 0, "password": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def set_fields(self, user_id: str, fields: Dict):
+        await self.collection.update_one({"user_id": user_id}, {"$set": fields})
+
+    async def replace_password(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        """Swap the hash only if it is still `old_hash`"""
+        result = await self.collection.update_one({"user_id": user_id, "password": old_hash}, {"$set": {"password": new_hash}})
+        return result.modified_count == 1
+
+
+class SessionRepository:
+    def __init__(self, db):
+        self.collection = db.user_sessions
+        # Short-lived, single-use stand-ins for a session token in URLs
+        self.tickets = db.stream_tickets
+
+    async def put(self, session: Dict):
+        await self.collection.replace_one({"session_token": session["session_token"]}, session, upsert=True)
+
+    async def get(self, session_token: str) -> Optional[Dict]:
+        return await self.collection.find_one({"session_token": session_token}, {"_id": 0})
+
+    async def delete(self, session_token: str):
+        await self.collection.delete_one({"session_token": session_token})
+
+    async def put_ticket(self, ticket: Dict):
+        await self.tickets.insert_one(dict(ticket))
+
+    async def take_ticket(self, ticket_id: str) -> Optional[Dict]:
+        """Remove and return a ticket, so each one is redeemed at most once"""
+        return await self.tickets.find_one_and_delete({"ticket": ticket_id}, {"_id": 0})
+
+
+class VetProfileRepository:
+    def __init__(self, db, read_db=None):
+        self.collection = db.vet_profiles
+        # Directory listings may read from secondaries
+        self.read_collection = (db if read_db is None else read_db).vet_profiles
+
+    async def get(self, user_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"user_id": user_id}, {"_id": 0, "geo": 0})
+
+    async def insert(self, profile: Dict):
+        await self.collection.insert_one(dict(profile))
+
+    async def set_fields(self, user_id: str, fields: Dict) -> Optional[Dict]:
+        return await self.collection.find_one_and_update(
+            {"user_id": user_id},
+            {"$set": fields},
+            {"_id": 0, "geo": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def search(self, specialty: Optional[str] = None, location: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Available vets whose specialty/location match the given case-insensitive regexes"""
+        query = {"available": True}
+        if specialty:
+            query["specialty"] = {"$regex": specialty, "$options": "i"}
+        if location:
+            query["location"] = {"$regex": location, "$options": "i"}
+        return await self.read_collection.find(query, {"_id": 0, "geo": 0}).to_list(limit)
+
+    async def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        max_distance: float,
+        limit: int,
+        specialty: Optional[str] = None,
+        exclude_user_id: Optional[str] = None,
+        after: Optional[Tuple[float, str]] = None,
+    ) -> List[Dict]:
+        """Available vets within `max_distance` metres ordered by (distance, user_id).
+
+        Each doc gets `distance` in metres. `after` is the (distance,
+        user_id) of the last vet on the previous page.
+        """
+        query = {"available": True}
+        if specialty:
+            query["specialty"] = specialty
+        if exclude_user_id:
+            query["user_id"] = {"$ne": exclude_user_id}
+
+        geo_near = {
+            "near": {"type": "Point", "coordinates": [longitude, latitude]},
+            "distanceField": "distance",
+            "maxDistance": max_distance,
+            "query": query,
+            "spherical": True
+        }
+        pipeline = [{"$geoNear": geo_near}]
+        if after:
+            last_distance, last_user_id = after
+            geo_near["minDistance"] = last_distance
+            # Vets at exactly the same distance (e.g. one clinic) are ordered by user_id
+            pipeline.append({"$match": {"$or": [
+                {"distance": {"$gt": last_distance}},
+                {"distance": last_distance, "user_id": {"$gt": last_user_id}}
+            ]}})
+        pipeline += [
+            {"$sort": {"distance": 1, "user_id": 1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "geo": 0}}
+        ]
+        return await self.read_collection.aggregate(pipeline).to_list(limit)
+
+
+class AppointmentRepository:
+    def __init__(self, db):
+        self.collection = db.appointments
+        self.reservations = db.slot_reservations
+
+    async def get(self, appointment_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"appointment_id": appointment_id}, {"_id": 0})
+
+    async def insert(self, appointment: Dict):
+        await self.collection.insert_one(dict(appointment))
+
+    async def page_for_user(self, user_field: str, user_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        """Appointments where `user_field` ("vet_id" or "pet_owner_id") is the user"""
+        return await paginate(self.collection, {user_field: user_id}, "appointment_id", limit, before, after)
+
+    async def transition(self, appointment_id: str, from_statuses: List[str], status: str, user_id: str, user_fields: Iterable[str]) -> Optional[Dict]:
+        """Move to `status` if currently in `from_statuses` and the user is in one of `user_fields`"""
+        participant = {"$or": [{field: user_id} for field in user_fields]}
+        return await self.collection.find_one_and_update(
+            {"appointment_id": appointment_id, "status": {"$in": from_statuses}, **participant},
+            {"$set": {"status": status}},
+            {"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def mark_paid(self, appointment_id: str):
+        """Record payment, confirming the appointment if it was still pending"""
+        await self.collection.update_one(
+            {"appointment_id": appointment_id},
+            [{"$set": {
+                "payment_status": "paid",
+                "status": {"$cond": [{"$eq": ["$status", "pending"]}, "confirmed", "$status"]}
+            }}]
+        )
+
+    async def reserve_slot(self, reservation: Dict):
+        """Raises DuplicateKeyError if the vet's slot is already reserved"""
+        await self.reservations.insert_one(dict(reservation))
+
+    async def release_slot(self, appointment_id: str):
+        await self.reservations.delete_one({"appointment_id": appointment_id})
+
+    async def taken_slots(self, vet_id: str, start_date: str, end_date: str) -> Set[Tuple[str, str]]:
+        reservations = await self.reservations.find(
+            {"vet_id": vet_id, "date": {"$gte": start_date, "$lte": end_date}},
+            {"_id": 0, "date": 1, "time": 1}
+        ).to_list(None)
+        return {(reservation["date"], reservation["time"]) for reservation in reservations}
+
+
+class EmergencyRepository:
+    def __init__(self, db):
+        self.collection = db.emergency_requests
+
+    async def get(self, request_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"request_id": request_id}, {"_id": 0})
+
+    async def insert(self, emergency_request: Dict):
+        await self.collection.insert_one(dict(emergency_request))
+
+    async def page_for_owner(self, pet_owner_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        return await paginate(self.collection, {"pet_owner_id": pet_owner_id}, "request_id", limit, before, after)
+
+    async def page_dispatched_to(self, vet_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        """Active requests offered to this vet, or broadcast to every vet"""
+        query = {
+            "status": "active",
+            "$or": [{"notified_vet_ids": vet_id}, {"dispatch_broadcast": {"$ne": False}}]
+        }
+        return await paginate(self.collection, query, "request_id", limit, before, after)
+
+    async def update_if(self, request_id: str, conditions: Dict, fields: Dict) -> Optional[Dict]:
+        """Set `fields` if the request's fields equal `conditions`; the updated request or None"""
+        return await self.collection.find_one_and_update(
+            {"request_id": request_id, **conditions},
+            {"$set": fields},
+            {"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def accept(self, request_id: str, vet_id: str, fields: Dict) -> Optional[Dict]:
+        """Apply `fields` if the request is still active and open to the vet"""
+        return await self.collection.find_one_and_update(
+            {
+                "request_id": request_id,
+                "status": "active",
+                "$or": [{"notified_vet_ids": vet_id}, {"dispatch_broadcast": {"$ne": False}}]
+            },
+            {"$set": fields},
+            {"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def due_for_next_wave(self, now: str, limit: int = 100) -> List[Dict]:
+        return await self.collection.find(
+            {"status": "active", "dispatch_next_wave_at": {"$ne": None, "$lte": now}},
+            {"_id": 0}
+        ).to_list(limit)
+
+    async def changed_since(self, cursor: str, limit: int = 1000) -> List[Dict]:
+        """Requests updated after the (updated_at, request_id) cursor, oldest first"""
+        query = keyset_filter(cursor, "request_id", "$gt", "updated_at")
+        return await self.collection.find(query, {"_id": 0}).sort(
+            [("updated_at", 1), ("request_id", 1)]
+        ).to_list(limit)
+
+
+class ChatRepository:
+    def __init__(self, db):
+        self.collection = db.chats
+
+    async def get(self, chat_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"chat_id": chat_id}, {"_id": 0})
+
+    async def get_between(self, pet_owner_id: str, vet_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"pet_owner_id": pet_owner_id, "vet_id": vet_id}, {"_id": 0})
+
+    async def insert(self, chat: Dict):
+        await self.collection.insert_one(dict(chat))
+
+    async def page_for_user(self, user_field: str, user_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        return await paginate(self.collection, {user_field: user_id}, "chat_id", limit, before, after)
+
+    async def set_last_messages(self, summaries: Dict[str, Tuple[str, str]]):
+        """Apply chat_id -> (content, created_at) where newer than the stored last_message_at"""
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"chat_id": chat_id, "last_message_at": {"$not": {"$gte": created_at}}},
+                {"$set": {"last_message": content, "last_message_at": created_at}}
+            )
+            for chat_id, (content, created_at) in summaries.items()
+        ], ordered=False)
+
+
+class MessageRepository:
+    def __init__(self, db):
+        self.collection = db.messages
+
+    async def get(self, chat_id: str, message_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"chat_id": chat_id, "message_id": message_id}, {"_id": 0})
+
+    async def insert(self, message: Dict):
+        await self.collection.insert_one(dict(message))
+
+    async def page(self, chat_id: str, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        return await paginate(self.collection, {"chat_id": chat_id}, "message_id", limit, before, after)
+
+
+class PaymentRepository:
+    """Payment transactions and the ledger of received Stripe webhook events"""
+
+    def __init__(self, db):
+        self.collection = db.payment_transactions
+        self.events = db.stripe_events
+
+    async def get_by_session(self, session_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"session_id": session_id}, {"_id": 0})
+
+    async def insert(self, payment_transaction: Dict):
+        await self.collection.insert_one(dict(payment_transaction))
+
+    async def mark_paid(self, session_id: str) -> Optional[Dict]:
+        """Flip the payment to paid; None if it already was (or doesn't exist)"""
+        return await self.collection.find_one_and_update(
+            {"session_id": session_id, "payment_status": {"$ne": "paid"}},
+            {"$set": {"payment_status": "paid"}},
+            {"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def record_event(self, event: Dict):
+        """Raises DuplicateKeyError for an event_id already in the ledger"""
+        await self.events.insert_one(dict(event))
+
+    async def claim_event(self, event_id: str, claimed_at) -> Optional[Dict]:
+        """Mark a pending event as processing and count the attempt; None if not pending"""
+        return await self.events.find_one_and_update(
+            {"event_id": event_id, "status": "pending"},
+            {"$set": {"status": "processing", "claimed_at": claimed_at}, "$inc": {"attempts": 1}},
+            {"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def set_event_fields(self, event_id: str, fields: Dict):
+        await self.events.update_one({"event_id": event_id}, {"$set": fields})
+
+    async def stale_events(self, cutoff, limit: int) -> List[str]:
+        """Release events stuck in processing since before `cutoff`, then list old pending ids"""
+        await self.events.update_many(
+            {"status": "processing", "claimed_at": {"$lt": cutoff}},
+            {"$set": {"status": "pending"}}
+        )
+        pending = await self.events.find(
+            {"status": "pending", "received_at": {"$lt": cutoff}},
+            {"_id": 0, "event_id": 1}
+        ).to_list(limit)
+        return [event["event_id"] for event in pending]
+
+
+class Repositories:
+    def __init__(self, users, sessions, vet_profiles, appointments, emergencies, chats, messages, payments, backend: str):
+        self.users = users
+        self.sessions = sessions
+        self.vet_profiles = vet_profiles
+        self.appointments = appointments
+        self.emergencies = emergencies
+        self.chats = chats
+        self.messages = messages
+        self.payments = payments
+        self.backend = backend
+
+
+def create_repositories(kind: str, db=None, read_db=None) -> Repositories:
+    if kind == "mongo":
+        return Repositories(
+            users=UserRepository(db),
+            sessions=SessionRepository(db),
+            vet_profiles=VetProfileRepository(db, read_db),
+            appointments=AppointmentRepository(db),
+            emergencies=EmergencyRepository(db),
+            chats=ChatRepository(db),
+            messages=MessageRepository(db),
+            payments=PaymentRepository(db),
+            backend=kind
+        )
+    if kind == "memory":
+        from memory_repositories import create_memory_repositories
+
+        return create_memory_repositories()
+    raise ValueError(f"Unknown data backend: {kind}")
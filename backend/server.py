@@ -1,31 +1,143 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Header
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Header, Query, WebSocket, WebSocketDisconnect, BackgroundTasks
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
 import os
+import json
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
-import bcrypt
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
+from zoneinfo import ZoneInfo
+from pymongo.errors import DuplicateKeyError
+from session_cache import SessionCache
+from indexes import ensure_indexes
+from pagination import encode_cursor, decode_cursor, set_next_cursor, NEXT_CURSOR_HEADER
+from repositories import create_repositories
+from hub import Hub, Subscription
+from broker import create_broker
+from dispatch import DISPATCH_FIELDS, Dispatcher
+from payments import PaymentClient
+from webhooks import WebhookProcessor
+from passwords import PasswordHasher, PasswordPoolSaturated
+from oauth import OAuthClient, OAuthSessionInvalid, OAuthUnavailable, DEFAULT_SESSION_DATA_URL
+from write_behind import LastMessageBuffer
+from slots import DEFAULT_AVAILABILITY, MAX_SLOT_RANGE_DAYS, conflicting_bookings, iter_slots, normalize_slot, parse_date, slot_key, validate_availability
+from mongo import PoolStats, create_client, read_preference, ping
+from metrics import Metrics, MetricsMiddleware, MongoCommandMetrics
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection; the client connects lazily and the lifespan below
+# checks it is reachable at startup and closes it on shutdown
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+mongo_pool_stats = PoolStats()
+# Per-route request and MongoDB command metrics, served at /metrics
+metrics = Metrics()
+client = create_client(
+    mongo_url,
+    pool_stats=mongo_pool_stats,
+    command_listener=MongoCommandMetrics(metrics),
+    max_pool_size=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    min_pool_size=int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+    max_idle_time_ms=int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000')),
+    wait_queue_timeout_ms=int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000')),
+    server_selection_timeout_ms=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+    connect_timeout_ms=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+    socket_timeout_ms=int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '30000'))
+)
 db = client[os.environ['DB_NAME']]
+# Public vet directory reads tolerate slight staleness, so they may go to secondaries
+list_db = client.get_database(
+    os.environ['DB_NAME'],
+    read_preference=read_preference(os.environ.get('MONGO_LIST_READ_PREFERENCE', 'secondaryPreferred'))
+)
+
+# Handlers reach the data through repositories; DATA_BACKEND=memory keeps
+# everything in this process (benchmarks, tests) and never contacts MongoDB
+repos = create_repositories(os.environ.get('DATA_BACKEND', 'mongo'), db, list_db)
+
+# Working hours and appointment slots are wall-clock times at the clinics
+clinic_tz = ZoneInfo(os.environ.get('CLINIC_TZ', 'Africa/Nairobi'))
+
+# Session -> user cache
+session_cache = SessionCache(
+    max_size=int(os.environ.get('SESSION_CACHE_MAX_SIZE', '10000')),
+    ttl=float(os.environ.get('SESSION_CACHE_TTL', '60'))
+)
+
+# bcrypt runs off the event loop on a bounded pool; logins beyond
+# PASSWORD_HASH_MAX_PENDING get 429 instead of stalling other traffic
+password_hasher = PasswordHasher(
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', '12')),
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', '4')),
+    max_pending=int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '64')),
+    cache_ttl=float(os.environ.get('PASSWORD_VERIFY_CACHE_TTL', '60')),
+    cache_size=int(os.environ.get('PASSWORD_VERIFY_CACHE_SIZE', '10000')),
+    downgrade=os.environ.get('BCRYPT_REHASH_DOWNGRADE', '').lower() in ('1', 'true', 'yes')
+)
+
+# Live event fan-out: handlers publish through the broker, which reaches the
+# local hub of every worker (EVENT_BROKER=mongo) or only this one (memory)
+event_hub = Hub()
+broker = create_broker(os.environ.get('EVENT_BROKER', 'memory'), event_hub, db)
 
 # Stripe setup
 stripe_api_key = os.environ.get('STRIPE_API_KEY')
+payment_client = PaymentClient(
+    stripe_api_key,
+    timeout=float(os.environ.get('STRIPE_TIMEOUT', '20')),
+    connect_timeout=float(os.environ.get('STRIPE_CONNECT_TIMEOUT', '5')),
+    max_connections=int(os.environ.get('STRIPE_MAX_CONNECTIONS', '20')),
+    max_retries=int(os.environ.get('STRIPE_MAX_RETRIES', '2')),
+    api_base=os.environ.get('STRIPE_API_BASE'),
+    status_ttl=float(os.environ.get('STRIPE_STATUS_CACHE_TTL', '3'))
+)
+
+# Google sign-in session exchange; OAUTH_SESSION_DATA_URL can point at oauth_standin.py
+oauth_client = OAuthClient(
+    os.environ.get('OAUTH_SESSION_DATA_URL', DEFAULT_SESSION_DATA_URL),
+    timeout=float(os.environ.get('OAUTH_TIMEOUT', '10')),
+    connect_timeout=float(os.environ.get('OAUTH_CONNECT_TIMEOUT', '3')),
+    max_connections=int(os.environ.get('OAUTH_MAX_CONNECTIONS', '20')),
+    max_attempts=int(os.environ.get('OAUTH_MAX_ATTEMPTS', '3'))
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if repos.backend == "mongo":
+        # Fail fast (within the server selection timeout) if MongoDB is unreachable
+        mongo = await ping(client)
+        if not mongo["ok"]:
+            raise RuntimeError(f"MongoDB unavailable: {mongo['error']}")
+        await ensure_indexes(db)
+    await broker.start()
+    await dispatcher.start()
+    # The Stripe SDK and its HTTP transport load on the first payment call
+    await webhook_processor.start()
+    await chat_summaries.start()
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        await chat_summaries.stop()
+        await webhook_processor.stop()
+        await dispatcher.stop()
+        await broker.stop()
+        await payment_client.close()
+        await oauth_client.close()
+        password_hasher.shutdown()
+        client.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.state.ready = False
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -72,6 +184,8 @@ class VetProfile(BaseModel):
     phone: Optional[str] = None
     bio: Optional[str] = None
     experience_years: int = 0
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     available: bool = True
     rating: float = 0.0
     created_at: datetime
@@ -83,6 +197,22 @@ class VetProfileCreate(BaseModel):
     phone: Optional[str] = None
     bio: Optional[str] = None
     experience_years: int = 0
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class VetProfileUpdate(BaseModel):
+    license_number: Optional[str] = None
+    specialty: Optional[str] = None
+    location: Optional[str] = None
+    phone: Optional[str] = None
+    bio: Optional[str] = None
+    experience_years: Optional[int] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class VetAvailability(BaseModel):
+    slot_minutes: int = 30
+    hours: Dict[str, List[List[str]]]  # weekday ("mon".."sun") -> [["09:00", "17:00"], ...]
 
 class Appointment(BaseModel):
     appointment_id: str
@@ -122,6 +252,8 @@ class EmergencyRequestCreate(BaseModel):
     description: str
     pet_name: str
     pet_type: str
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class Message(BaseModel):
     message_id: str
@@ -145,37 +277,101 @@ class Chat(BaseModel):
 
 # ==================== HELPER FUNCTIONS ====================
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordPoolSaturated:
+        raise HTTPException(status_code=429, detail="Server busy, please retry", headers={"Retry-After": "1"})
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str, email: Optional[str] = None) -> bool:
+    try:
+        return await password_hasher.verify(password, hashed, email)
+    except PasswordPoolSaturated:
+        raise HTTPException(status_code=429, detail="Server busy, please retry", headers={"Retry-After": "1"})
 
 def create_session_token() -> str:
     return f"session_{uuid.uuid4().hex}"
 
+def geo_point(latitude: float, longitude: float) -> Dict:
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+def response_doc(doc: Dict, *hidden: str) -> Dict:
+    """Copy of a just-written doc without _id (added by insert_one) or hidden fields"""
+    return {key: value for key, value in doc.items() if key != "_id" and key not in hidden}
+
+async def create_user_session(user_id: str, session_token: Optional[str] = None) -> str:
+    """Store a 7-day session; expires_at is a BSON date so the TTL index can expire it"""
+    session_token = session_token or create_session_token()
+    session = {
+        "session_token": session_token,
+        "user_id": user_id,
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=7),
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await repos.sessions.put(session)
+    return session_token
+
+async def get_users_by_ids(user_ids) -> Dict[str, Dict]:
+    """Fetch name/picture for a set of user ids with a single $in query"""
+    ids = list({user_id for user_id in user_ids if user_id})
+    if not ids:
+        return {}
+    
+    return await repos.users.get_summaries(ids)
+
+async def enrich_with_users(docs: List[Dict], fields: Dict[str, str]) -> List[Dict]:
+    """Merge user name/picture into each doc, batching all lookups into one query.
+
+    `fields` maps the id field on the doc to the prefix used for the merged
+    keys, e.g. {"vet_id": "vet"} sets `vet_name` and `vet_picture`.
+    An empty prefix sets plain `name` and `picture`.
+    """
+    users = await get_users_by_ids(doc.get(id_field) for doc in docs for id_field in fields)
+    
+    for doc in docs:
+        for id_field, prefix in fields.items():
+            user_doc = users.get(doc.get(id_field))
+            if user_doc:
+                key = f"{prefix}_" if prefix else ""
+                doc[f"{key}name"] = user_doc["name"]
+                doc[f"{key}picture"] = user_doc.get("picture")
+    
+    return docs
+
+def utc_datetime(value) -> datetime:
+    """An aware UTC datetime from an ISO string or a (possibly naive) BSON date"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def resolve_session_token(session_token: str = None, authorization: str = None) -> Optional[str]:
+    """The session token from the cookie, else from an `Authorization: Bearer` header"""
+    return session_token or (authorization.replace('Bearer ', '') if authorization else None)
+
 async def get_user_from_session(session_token: str = None, authorization: str = None) -> Optional[Dict]:
     """Get user from session token (cookie or header)"""
-    token = session_token or (authorization.replace('Bearer ', '') if authorization else None)
+    token = resolve_session_token(session_token, authorization)
     
     if not token:
         return None
     
-    session_doc = await db.user_sessions.find_one({"session_token": token}, {"_id": 0})
+    cached_user = session_cache.get(token)
+    if cached_user:
+        return cached_user
+    
+    session_doc = await repos.sessions.get(token)
     if not session_doc:
         return None
     
     # Check expiry
-    expires_at = session_doc["expires_at"]
-    if isinstance(expires_at, str):
-        expires_at = datetime.fromisoformat(expires_at)
-    if expires_at.tzinfo is None:
-        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    expires_at = utc_datetime(session_doc["expires_at"])
     if expires_at < datetime.now(timezone.utc):
-        await db.user_sessions.delete_one({"session_token": token})
+        await repos.sessions.delete(token)
         return None
     
-    user_doc = await db.users.find_one({"user_id": session_doc["user_id"]}, {"_id": 0})
+    user_doc = await repos.users.get(session_doc["user_id"])
+    if user_doc:
+        session_cache.set(token, user_doc, expires_at)
     return user_doc
 
 
@@ -184,12 +380,12 @@ async def get_user_from_session(session_token: str = None, authorization: str =
 @api_router.post("/auth/register")
 async def register(user_data: UserRegister):
     # Check if user exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    existing_user = await repos.users.get_by_email(user_data.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     user_id = f"user_{uuid.uuid4().hex[:12]}"
-    hashed_pw = hash_password(user_data.password)
+    hashed_pw = await hash_password(user_data.password)
     
     user = {
         "user_id": user_id,
@@ -201,40 +397,42 @@ async def register(user_data: UserRegister):
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.users.insert_one(user)
+    try:
+        await repos.users.insert(user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create session
-    session_token = create_session_token()
-    session = {
-        "session_token": session_token,
-        "user_id": user_id,
-        "expires_at": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.user_sessions.insert_one(session)
+    session_token = await create_user_session(user_id)
     
-    user_response = await db.users.find_one({"user_id": user_id}, {"_id": 0, "password": 0})
-    return {"user": user_response, "session_token": session_token}
+    return {"user": response_doc(user, "password"), "session_token": session_token}
+
+
+async def rehash_password(user_id: str, password: str, old_hash: str):
+    try:
+        new_hash = await password_hasher.hash(password)
+    except PasswordPoolSaturated:
+        # Try again on a later login
+        return
+    # Skip if the password changed in the meantime
+    await repos.users.replace_password(user_id, old_hash, new_hash)
 
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
-    user_doc = await db.users.find_one({"email": credentials.email})
-    if not user_doc or not verify_password(credentials.password, user_doc["password"]):
+async def login(credentials: UserLogin, background_tasks: BackgroundTasks):
+    user_doc = await repos.users.get_by_email(credentials.email)
+    # Google sign-in accounts have no password
+    if not user_doc or not user_doc.get("password") or not await verify_password(credentials.password, user_doc["password"], credentials.email):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Migrate hashes made with an outdated cost once the response is sent
+    if password_hasher.needs_rehash(user_doc["password"]):
+        background_tasks.add_task(rehash_password, user_doc["user_id"], credentials.password, user_doc["password"])
+    
     # Create session
-    session_token = create_session_token()
-    session = {
-        "session_token": session_token,
-        "user_id": user_doc["user_id"],
-        "expires_at": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.user_sessions.insert_one(session)
+    session_token = await create_user_session(user_doc["user_id"])
     
-    user_response = await db.users.find_one({"user_id": user_doc["user_id"]}, {"_id": 0, "password": 0})
-    return {"user": user_response, "session_token": session_token}
+    return {"user": response_doc(user_doc, "password"), "session_token": session_token}
 
 
 @api_router.post("/auth/google-session")
@@ -244,53 +442,31 @@ async def google_session(request: Request):
         raise HTTPException(status_code=400, detail="Session ID required")
     
     # Call  OAuth API
-    import aiohttp
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id}
-        ) as resp:
-            if resp.status != 200:
-                raise HTTPException(status_code=401, detail="Invalid session")
-            data = await resp.json()
-    
-    # Check if user exists
-    user_doc = await db.users.find_one({"email": data["email"]})
-    
-    if user_doc:
-        user_id = user_doc["user_id"]
-        # Update user info
-        await db.users.update_one(
-            {"user_id": user_id},
-            {"$set": {
-                "name": data["name"],
-                "picture": data["picture"]
-            }}
-        )
-    else:
-        # Create new user - default to pet_owner, they can switch later
-        user_id = f"user_{uuid.uuid4().hex[:12]}"
-        user = {
-            "user_id": user_id,
-            "email": data["email"],
-            "name": data["name"],
-            "picture": data["picture"],
-            "user_type": "pet_owner",
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        await db.users.insert_one(user)
-    
-    # Create session with  session token
-    session_token = data["session_token"]
-    session = {
-        "session_token": session_token,
-        "user_id": user_id,
-        "expires_at": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
+    try:
+        data = await oauth_client.get_session_data(session_id)
+    except OAuthSessionInvalid:
+        raise HTTPException(status_code=401, detail="Invalid session")
+    except OAuthUnavailable:
+        raise HTTPException(status_code=503, detail="Sign-in provider unavailable, please retry", headers={"Retry-After": "1"})
+    
+    # Update user info, or create the user - default to pet_owner, they can switch later
+    fields = {"name": data["name"], "picture": data["picture"]}
+    new_user = {
+        "user_id": f"user_{uuid.uuid4().hex[:12]}",
+        "user_type": "pet_owner",
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.user_sessions.insert_one(session)
+    try:
+        user_response = await repos.users.upsert_oauth(data["email"], fields, new_user)
+    except DuplicateKeyError:
+        # Created concurrently by another sign-in; the retry matches it
+        user_response = await repos.users.upsert_oauth(data["email"], fields, new_user)
+    user_id = user_response["user_id"]
+    session_cache.invalidate_user(user_id)
+    
+    # Create session with  session token
+    session_token = await create_user_session(user_id, data["session_token"])
     
-    user_response = await db.users.find_one({"user_id": user_id}, {"_id": 0, "password": 0})
     return {"user": user_response, "session_token": session_token}
 
 
@@ -304,10 +480,11 @@ async def get_current_user(request: Request, authorization: Optional[str] = Head
 
 
 @api_router.post("/auth/logout")
-async def logout(request: Request):
-    session_token = request.cookies.get("session_token")
+async def logout(request: Request, authorization: Optional[str] = Header(None)):
+    session_token = resolve_session_token(request.cookies.get("session_token"), authorization)
     if session_token:
-        await db.user_sessions.delete_one({"session_token": session_token})
+        session_cache.invalidate(session_token)
+        await repos.sessions.delete(session_token)
     return {"message": "Logged out successfully"}
 
 
@@ -321,7 +498,7 @@ async def create_vet_profile(profile_data: VetProfileCreate, request: Request, a
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     # Check if profile exists
-    existing_profile = await db.vet_profiles.find_one({"user_id": user["user_id"]})
+    existing_profile = await repos.vet_profiles.get(user["user_id"])
     if existing_profile:
         raise HTTPException(status_code=400, detail="Profile already exists")
     
@@ -333,17 +510,51 @@ async def create_vet_profile(profile_data: VetProfileCreate, request: Request, a
         "phone": profile_data.phone,
         "bio": profile_data.bio,
         "experience_years": profile_data.experience_years,
+        "latitude": profile_data.latitude,
+        "longitude": profile_data.longitude,
         "available": True,
         "rating": 0.0,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+    if (profile_data.latitude is None) != (profile_data.longitude is None):
+        raise HTTPException(status_code=400, detail="Provide both latitude and longitude")
+    if profile_data.latitude is not None:
+        # GeoJSON copy backing the 2dsphere index
+        profile["geo"] = geo_point(profile_data.latitude, profile_data.longitude)
     
-    await db.vet_profiles.insert_one(profile)
+    try:
+        await repos.vet_profiles.insert(profile)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Profile already exists")
     
     # Update user type to vet
-    await db.users.update_one({"user_id": user["user_id"]}, {"$set": {"user_type": "vet"}})
+    await repos.users.set_fields(user["user_id"], {"user_type": "vet"})
+    session_cache.invalidate_user(user["user_id"])
     
-    return await db.vet_profiles.find_one({"user_id": user["user_id"]}, {"_id": 0})
+    return response_doc(profile, "geo")
+
+
+@api_router.patch("/vet/profile")
+async def update_vet_profile(profile_data: VetProfileUpdate, request: Request, authorization: Optional[str] = Header(None)):
+    session_token = request.cookies.get("session_token")
+    user = await get_user_from_session(session_token, authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    # Only the fields sent are changed; explicit nulls are ignored
+    fields = {key: value for key, value in profile_data.model_dump(exclude_unset=True).items() if value is not None}
+    if ("latitude" in fields) != ("longitude" in fields):
+        raise HTTPException(status_code=400, detail="Provide both latitude and longitude")
+    if "latitude" in fields:
+        fields["geo"] = geo_point(fields["latitude"], fields["longitude"])
+    if not fields:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    
+    profile = await repos.vet_profiles.set_fields(user["user_id"], fields)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    return profile
 
 
 @api_router.get("/vet/profile/me")
@@ -353,7 +564,7 @@ async def get_my_vet_profile(request: Request, authorization: Optional[str] = He
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    profile = await db.vet_profiles.find_one({"user_id": user["user_id"]}, {"_id": 0})
+    profile = await repos.vet_profiles.get(user["user_id"])
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
@@ -362,36 +573,118 @@ async def get_my_vet_profile(request: Request, authorization: Optional[str] = He
 
 @api_router.get("/vets")
 async def get_vets(specialty: Optional[str] = None, location: Optional[str] = None):
-    query = {"available": True}
-    if specialty:
-        query["specialty"] = {"$regex": specialty, "$options": "i"}
-    if location:
-        query["location"] = {"$regex": location, "$options": "i"}
-    
-    vet_profiles = await db.vet_profiles.find(query, {"_id": 0}).to_list(100)
+    vet_profiles = await repos.vet_profiles.search(specialty, location)
     
     # Enrich with user data
-    for profile in vet_profiles:
-        user_doc = await db.users.find_one({"user_id": profile["user_id"]}, {"_id": 0, "password": 0})
-        if user_doc:
-            profile["name"] = user_doc["name"]
-            profile["picture"] = user_doc.get("picture")
+    return await enrich_with_users(vet_profiles, {"user_id": ""})
+
+
+@api_router.get("/vets/nearby")
+async def get_nearby_vets(
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(10, gt=0, le=500, description="Search radius in km"),
+    specialty: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None
+):
+    """Available vets within `radius` km, nearest first, with `distance` in metres.
+
+    Pages continue from the X-Next-Cursor header passed back as `after`.
+    """
+    last_vet = None
+    if after:
+        last_distance, last_user_id = decode_cursor(after)
+        try:
+            last_vet = (float(last_distance), last_user_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    vet_profiles = await repos.vet_profiles.nearby(lat, lng, radius * 1000, limit + 1, specialty=specialty, after=last_vet)
+    if len(vet_profiles) > limit:
+        vet_profiles = vet_profiles[:limit]
+        set_next_cursor(response, encode_cursor(vet_profiles[-1], "user_id", "distance"))
+    
+    return await enrich_with_users(vet_profiles, {"user_id": ""})
+
+
+@api_router.put("/vet/availability")
+async def set_vet_availability(availability: VetAvailability, request: Request, authorization: Optional[str] = Header(None)):
+    session_token = request.cookies.get("session_token")
+    user = await get_user_from_session(session_token, authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    try:
+        normalized = validate_availability(availability.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    profile = await repos.vet_profiles.get(user["user_id"])
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    # Existing bookings are kept even if they now fall outside the hours, but
+    # no new slot may overlap one unless it starts at the same time
+    booked = await repos.appointments.taken_slots(user["user_id"], datetime.now(clinic_tz).date().isoformat(), "9999-12-31")
+    current = profile.get("availability") or DEFAULT_AVAILABILITY
+    conflicts = conflicting_bookings(normalized, current["slot_minutes"], booked)
+    if conflicts:
+        raise HTTPException(
+            status_code=409,
+            detail=f"The new slots would overlap {len(conflicts)} booked appointment(s), first on {conflicts[0][0]} at {conflicts[0][1]}; move or cancel them first"
+        )
+    
+    profile = await repos.vet_profiles.set_fields(user["user_id"], {"availability": normalized})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@api_router.get("/vets/{vet_id}/slots")
+async def get_vet_slots(
+    vet_id: str,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to")
+):
+    """Free slots between `from` and `to` (inclusive, YYYY-MM-DD), a week by default"""
+    profile = await repos.vet_profiles.get(vet_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Vet not found")
+    
+    now = datetime.now(clinic_tz)
+    today = now.date()
+    try:
+        start = max(parse_date(from_date) if from_date else today, today)
+        end = parse_date(to_date) if to_date else start + timedelta(days=6)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if end < start:
+        return []
+    if (end - start).days >= MAX_SLOT_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_SLOT_RANGE_DAYS} days")
     
-    return vet_profiles
+    # Working slots come from the vet's hours; taken ones from a single indexed range query
+    taken = await repos.appointments.taken_slots(vet_id, start.isoformat(), end.isoformat())
+    
+    availability = profile.get("availability") or DEFAULT_AVAILABILITY
+    started = slot_key(now)
+    return [
+        {"date": slot_date, "time": slot_time}
+        for slot_date, slot_time in iter_slots(availability, start, end)
+        if (slot_date, slot_time) > started and (slot_date, slot_time) not in taken
+    ]
 
 
 @api_router.get("/vets/{vet_id}")
 async def get_vet_detail(vet_id: str):
-    profile = await db.vet_profiles.find_one({"user_id": vet_id}, {"_id": 0})
+    profile = await repos.vet_profiles.get(vet_id)
     if not profile:
         raise HTTPException(status_code=404, detail="Vet not found")
     
-    user_doc = await db.users.find_one({"user_id": vet_id}, {"_id": 0, "password": 0})
-    if user_doc:
-        profile["name"] = user_doc["name"]
-        profile["picture"] = user_doc.get("picture")
-    
-    return profile
+    profiles = await enrich_with_users([profile], {"user_id": ""})
+    return profiles[0]
 
 
 # ==================== APPOINTMENT ENDPOINTS ====================
@@ -403,13 +696,43 @@ async def create_appointment(appointment_data: AppointmentCreate, request: Reque
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    profile = await repos.vet_profiles.get(appointment_data.vet_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Vet not found")
+    
+    try:
+        slot = normalize_slot(
+            profile.get("availability") or DEFAULT_AVAILABILITY,
+            appointment_data.appointment_date,
+            appointment_data.appointment_time
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not slot:
+        raise HTTPException(status_code=400, detail="The vet is not available at that time")
+    if slot <= slot_key(datetime.now(clinic_tz)):
+        raise HTTPException(status_code=400, detail="Cannot book a slot in the past")
+    
     appointment_id = f"apt_{uuid.uuid4().hex[:12]}"
+    
+    # Reserve the slot first; the unique index makes concurrent bookings of it fail here
+    try:
+        await repos.appointments.reserve_slot({
+            "vet_id": appointment_data.vet_id,
+            "date": slot[0],
+            "time": slot[1],
+            "appointment_id": appointment_id,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        })
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="This slot is already booked")
+    
     appointment = {
         "appointment_id": appointment_id,
         "pet_owner_id": user["user_id"],
         "vet_id": appointment_data.vet_id,
-        "appointment_date": appointment_data.appointment_date,
-        "appointment_time": appointment_data.appointment_time,
+        "appointment_date": slot[0],
+        "appointment_time": slot[1],
         "pet_name": appointment_data.pet_name,
         "pet_type": appointment_data.pet_type,
         "reason": appointment_data.reason,
@@ -419,32 +742,43 @@ async def create_appointment(appointment_data: AppointmentCreate, request: Reque
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.appointments.insert_one(appointment)
-    return await db.appointments.find_one({"appointment_id": appointment_id}, {"_id": 0})
+    try:
+        await repos.appointments.insert(appointment)
+    except Exception:
+        await repos.appointments.release_slot(appointment_id)
+        raise
+    return response_doc(appointment)
 
 
 @api_router.get("/appointments")
-async def get_appointments(request: Request, authorization: Optional[str] = Header(None)):
+async def get_appointments(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
     session_token = request.cookies.get("session_token")
     user = await get_user_from_session(session_token, authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    if user["user_type"] == "vet":
-        appointments = await db.appointments.find({"vet_id": user["user_id"]}, {"_id": 0}).to_list(100)
-    else:
-        appointments = await db.appointments.find({"pet_owner_id": user["user_id"]}, {"_id": 0}).to_list(100)
+    user_field = "vet_id" if user["user_type"] == "vet" else "pet_owner_id"
+    appointments, next_cursor = await repos.appointments.page_for_user(user_field, user["user_id"], limit, before, after)
+    set_next_cursor(response, next_cursor)
     
     # Enrich with user data
-    for apt in appointments:
-        vet_doc = await db.users.find_one({"user_id": apt["vet_id"]}, {"_id": 0, "password": 0})
-        owner_doc = await db.users.find_one({"user_id": apt["pet_owner_id"]}, {"_id": 0, "password": 0})
-        if vet_doc:
-            apt["vet_name"] = vet_doc["name"]
-        if owner_doc:
-            apt["owner_name"] = owner_doc["name"]
-    
-    return appointments
+    return await enrich_with_users(appointments, {"vet_id": "vet", "pet_owner_id": "owner"})
+
+
+APPOINTMENT_STATUSES = {"pending", "confirmed", "completed", "cancelled"}
+
+# Allowed status changes; completed and cancelled are final
+APPOINTMENT_TRANSITIONS = {
+    "pending": {"confirmed", "cancelled"},
+    "confirmed": {"completed", "cancelled"}
+}
 
 
 @api_router.patch("/appointments/{appointment_id}")
@@ -454,15 +788,90 @@ async def update_appointment_status(appointment_id: str, status: str, request: R
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    await db.appointments.update_one(
-        {"appointment_id": appointment_id},
-        {"$set": {"status": status}}
-    )
-    return await db.appointments.find_one({"appointment_id": appointment_id}, {"_id": 0})
+    if status not in APPOINTMENT_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid appointment status")
+    
+    from_statuses = [current for current, targets in APPOINTMENT_TRANSITIONS.items() if status in targets]
+    # The vet drives the appointment; the pet owner may only cancel it
+    user_fields = ["vet_id", "pet_owner_id"] if status == "cancelled" else ["vet_id"]
+    
+    # Check and apply the transition in one step so concurrent updates can't skip states
+    appointment = await repos.appointments.transition(appointment_id, from_statuses, status, user["user_id"], user_fields)
+    if appointment:
+        if status == "cancelled":
+            # Free the slot for other bookings
+            await repos.appointments.release_slot(appointment_id)
+        return appointment
+    
+    current = await repos.appointments.get(appointment_id)
+    if not current or user["user_id"] not in (current["vet_id"], current["pet_owner_id"]):
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    if current["status"] in from_statuses:
+        raise HTTPException(status_code=403, detail="Only the vet can change this appointment")
+    raise HTTPException(status_code=409, detail=f"Cannot change appointment from {current['status']} to {status}")
 
 
 # ==================== EMERGENCY REQUEST ENDPOINTS ====================
 
+EMERGENCY_TOPIC = "emergency"
+
+# SSE event type sent for each emergency request status
+EMERGENCY_EVENT_TYPES = {
+    "active": "created",
+    "accepted": "accepted",
+    "completed": "completed",
+    "cancelled": "cancelled"
+}
+
+SSE_HEARTBEAT_SECONDS = 15
+
+# Lifetime of the single-use tickets that authenticate an EventSource
+STREAM_TICKET_SECONDS = 30
+
+# Changed requests fetched per query when replaying to a reconnecting SSE client
+EMERGENCY_REPLAY_PAGE_SIZE = 1000
+
+
+def emergency_event(emergency_request: Dict) -> Dict:
+    """Event for the request's current state; its id orders events by (updated_at, request_id)"""
+    return {
+        "id": encode_cursor(emergency_request, "request_id", "updated_at"),
+        "type": EMERGENCY_EVENT_TYPES.get(emergency_request["status"], emergency_request["status"]),
+        "request": emergency_request
+    }
+
+
+async def publish_emergency_event(emergency_request: Dict):
+    await enrich_with_users([emergency_request], {"pet_owner_id": "owner", "assigned_vet_id": "vet"})
+    await broker.publish(EMERGENCY_TOPIC, emergency_event(emergency_request))
+
+
+dispatcher = Dispatcher(
+    repos.emergencies,
+    repos.vet_profiles,
+    on_change=lambda emergency_request: publish_emergency_event(dict(emergency_request)),
+    wave_size=int(os.environ.get('DISPATCH_WAVE_SIZE', '3')),
+    wave_timeout=float(os.environ.get('DISPATCH_WAVE_TIMEOUT', '30')),
+    radius_km=float(os.environ.get('DISPATCH_RADIUS_KM', '25')),
+    max_candidates=int(os.environ.get('DISPATCH_MAX_CANDIDATES', '15'))
+)
+
+
+def emergency_event_visible(event: Dict, vet_id: str, vet_available: bool) -> bool:
+    """New requests go to the available vets they were dispatched to (everyone once broadcast);
+    status changes go to every vet so dashboards can drop them"""
+    if event["type"] != "created":
+        return True
+    emergency_request = event["request"]
+    dispatched = emergency_request.get("dispatch_broadcast", True) or vet_id in emergency_request.get("notified_vet_ids", [])
+    return vet_available and dispatched
+
+
+def format_sse(event: Dict) -> str:
+    data = json.dumps(response_doc(event['request'], *DISPATCH_FIELDS))
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
 @api_router.post("/emergency")
 async def create_emergency_request(emergency_data: EmergencyRequestCreate, request: Request, authorization: Optional[str] = Header(None)):
     session_token = request.cookies.get("session_token")
@@ -482,36 +891,49 @@ async def create_emergency_request(emergency_data: EmergencyRequestCreate, reque
         "assigned_vet_id": None,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+    emergency_request["updated_at"] = emergency_request["created_at"]
+    
+    # Rank nearby vets and notify the first wave; without coordinates it goes to every vet
+    candidates = []
+    if emergency_data.latitude is not None and emergency_data.longitude is not None:
+        emergency_request["latitude"] = emergency_data.latitude
+        emergency_request["longitude"] = emergency_data.longitude
+        candidates = await dispatcher.rank_candidates(
+            emergency_data.latitude, emergency_data.longitude, emergency_data.pet_type, user["user_id"]
+        )
+    emergency_request.update(dispatcher.initial_fields(candidates))
     
-    await db.emergency_requests.insert_one(emergency_request)
-    return await db.emergency_requests.find_one({"request_id": request_id}, {"_id": 0})
+    await repos.emergencies.insert(emergency_request)
+    emergency_request = response_doc(emergency_request)
+    await publish_emergency_event(dict(emergency_request))
+    return response_doc(emergency_request, *DISPATCH_FIELDS)
 
 
 @api_router.get("/emergency")
-async def get_emergency_requests(request: Request, authorization: Optional[str] = Header(None)):
+async def get_emergency_requests(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
     session_token = request.cookies.get("session_token")
     user = await get_user_from_session(session_token, authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     if user["user_type"] == "vet":
-        # Vets see all active emergency requests
-        requests = await db.emergency_requests.find({"status": "active"}, {"_id": 0}).to_list(100)
+        # Vets see active emergency requests dispatched to them
+        requests, next_cursor = await repos.emergencies.page_dispatched_to(user["user_id"], limit, before, after)
     else:
         # Pet owners see their own requests
-        requests = await db.emergency_requests.find({"pet_owner_id": user["user_id"]}, {"_id": 0}).to_list(100)
+        requests, next_cursor = await repos.emergencies.page_for_owner(user["user_id"], limit, before, after)
+    set_next_cursor(response, next_cursor)
     
     # Enrich with user data
-    for req in requests:
-        owner_doc = await db.users.find_one({"user_id": req["pet_owner_id"]}, {"_id": 0, "password": 0})
-        if owner_doc:
-            req["owner_name"] = owner_doc["name"]
-        if req.get("assigned_vet_id"):
-            vet_doc = await db.users.find_one({"user_id": req["assigned_vet_id"]}, {"_id": 0, "password": 0})
-            if vet_doc:
-                req["vet_name"] = vet_doc["name"]
-    
-    return requests
+    requests = [response_doc(emergency_request, *DISPATCH_FIELDS) for emergency_request in requests]
+    return await enrich_with_users(requests, {"pet_owner_id": "owner", "assigned_vet_id": "vet"})
 
 
 @api_router.patch("/emergency/{request_id}/accept")
@@ -521,11 +943,144 @@ async def accept_emergency_request(request_id: str, request: Request, authorizat
     if not user or user["user_type"] != "vet":
         raise HTTPException(status_code=403, detail="Only vets can accept emergency requests")
     
-    await db.emergency_requests.update_one(
-        {"request_id": request_id},
-        {"$set": {"status": "accepted", "assigned_vet_id": user["user_id"]}}
+    # Only the first vet to accept wins; everyone else gets a conflict
+    emergency_request = await dispatcher.accept(request_id, user["user_id"])
+    if not emergency_request:
+        if not await repos.emergencies.get(request_id):
+            raise HTTPException(status_code=404, detail="Emergency request not found")
+        raise HTTPException(status_code=409, detail="Emergency request is no longer available")
+    
+    await publish_emergency_event(dict(emergency_request))
+    return response_doc(emergency_request, *DISPATCH_FIELDS)
+
+
+@api_router.patch("/emergency/{request_id}/cancel")
+async def cancel_emergency_request(request_id: str, request: Request, authorization: Optional[str] = Header(None)):
+    session_token = request.cookies.get("session_token")
+    user = await get_user_from_session(session_token, authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    emergency_request = await repos.emergencies.update_if(
+        request_id,
+        {"pet_owner_id": user["user_id"], "status": "active"},
+        {"status": "cancelled", "updated_at": datetime.now(timezone.utc).isoformat()}
+    )
+    if not emergency_request:
+        raise HTTPException(status_code=404, detail="Active emergency request not found")
+    
+    await publish_emergency_event(dict(emergency_request))
+    return response_doc(emergency_request, *DISPATCH_FIELDS)
+
+
+async def get_emergency_events_since(last_event_id: str, page_size: int = EMERGENCY_REPLAY_PAGE_SIZE) -> List[Dict]:
+    """Current state of every request changed after the given event, oldest first"""
+    events = []
+    cursor = last_event_id
+    while True:
+        emergency_requests = await repos.emergencies.changed_since(cursor, page_size)
+        await enrich_with_users(emergency_requests, {"pet_owner_id": "owner", "assigned_vet_id": "vet"})
+        events.extend(emergency_event(emergency_request) for emergency_request in emergency_requests)
+        if len(emergency_requests) < page_size:
+            return events
+        cursor = events[-1]["id"]
+
+
+@api_router.post("/emergency/stream/ticket")
+async def create_emergency_stream_ticket(request: Request, authorization: Optional[str] = Header(None)):
+    """Single-use ticket for opening /emergency/stream.
+
+    EventSource cannot send headers, and a session token in the query
+    string would end up in access logs; the ticket is redeemed on first use
+    and expires after STREAM_TICKET_SECONDS.
+    """
+    session_token = request.cookies.get("session_token")
+    user = await get_user_from_session(session_token, authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if user["user_type"] != "vet":
+        raise HTTPException(status_code=403, detail="Only vets can follow emergency requests")
+    
+    ticket = f"tkt_{uuid.uuid4().hex}"
+    await repos.sessions.put_ticket({
+        "ticket": ticket,
+        "user_id": user["user_id"],
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TICKET_SECONDS)
+    })
+    return {"ticket": ticket, "expires_in": STREAM_TICKET_SECONDS}
+
+
+async def redeem_stream_ticket(ticket: str) -> Optional[Dict]:
+    ticket_doc = await repos.sessions.take_ticket(ticket)
+    if not ticket_doc or utc_datetime(ticket_doc["expires_at"]) < datetime.now(timezone.utc):
+        return None
+    return await repos.users.get(ticket_doc["user_id"])
+
+
+@api_router.get("/emergency/stream")
+async def stream_emergency_requests(
+    request: Request,
+    ticket: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """Server-Sent Events feed of emergency requests for vets.
+
+    Authenticates with a `ticket` from POST /emergency/stream/ticket, the
+    session cookie or the Authorization header. Emits `created`,
+    `accepted`, `cancelled` and `completed` events whose data is the
+    request document. Reconnecting with Last-Event-ID replays the current
+    state of every request changed since that event.
+    """
+    if ticket:
+        user = await redeem_stream_ticket(ticket)
+    else:
+        user = await get_user_from_session(request.cookies.get("session_token"), authorization)
+    if not user or user["user_type"] != "vet":
+        raise HTTPException(status_code=403, detail="Only vets can follow emergency requests")
+    
+    profile = await repos.vet_profiles.get(user["user_id"])
+    vet_available = not profile or profile.get("available", True)
+    
+    # Subscribe before replaying so nothing published in between is lost
+    subscription = event_hub.subscribe(EMERGENCY_TOPIC)
+    try:
+        replay = await get_emergency_events_since(last_event_id, EMERGENCY_REPLAY_PAGE_SIZE) if last_event_id else []
+    except Exception:
+        subscription.close()
+        raise
+    replayed = {event["id"] for event in replay}
+    
+    async def event_stream():
+        try:
+            yield "retry: 2000\n\n"
+            for event in replay:
+                if emergency_event_visible(event, user["user_id"], vet_available):
+                    yield format_sse(event)
+            
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": ping\n\n"
+                    continue
+                
+                if event is None:
+                    # Fell too far behind; the client reconnects with Last-Event-ID
+                    return
+                if event["id"] in replayed or not emergency_event_visible(event, user["user_id"], vet_available):
+                    continue
+                yield format_sse(event)
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    return await db.emergency_requests.find_one({"request_id": request_id}, {"_id": 0})
 
 
 # ==================== CHAT/MESSAGE ENDPOINTS ====================
@@ -538,13 +1093,10 @@ async def create_chat(vet_id: str, request: Request, authorization: Optional[str
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     # Check if chat already exists
-    existing_chat = await db.chats.find_one({
-        "pet_owner_id": user["user_id"],
-        "vet_id": vet_id
-    })
+    existing_chat = await repos.chats.get_between(user["user_id"], vet_id)
     
     if existing_chat:
-        return await db.chats.find_one({"chat_id": existing_chat["chat_id"]}, {"_id": 0})
+        return existing_chat
     
     chat_id = f"chat_{uuid.uuid4().hex[:12]}"
     chat = {
@@ -556,83 +1108,183 @@ async def create_chat(vet_id: str, request: Request, authorization: Optional[str
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.chats.insert_one(chat)
-    return await db.chats.find_one({"chat_id": chat_id}, {"_id": 0})
+    try:
+        await repos.chats.insert(chat)
+    except DuplicateKeyError:
+        # Created concurrently by another request
+        return await repos.chats.get_between(user["user_id"], vet_id)
+    return response_doc(chat)
 
 
 @api_router.get("/chats")
-async def get_chats(request: Request, authorization: Optional[str] = Header(None)):
+async def get_chats(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
     session_token = request.cookies.get("session_token")
     user = await get_user_from_session(session_token, authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    if user["user_type"] == "vet":
-        chats = await db.chats.find({"vet_id": user["user_id"]}, {"_id": 0}).to_list(100)
-    else:
-        chats = await db.chats.find({"pet_owner_id": user["user_id"]}, {"_id": 0}).to_list(100)
+    user_field = "vet_id" if user["user_type"] == "vet" else "pet_owner_id"
+    chats, next_cursor = await repos.chats.page_for_user(user_field, user["user_id"], limit, before, after)
+    set_next_cursor(response, next_cursor)
+    chat_summaries.overlay(chats)
     
     # Enrich with user data
-    for chat in chats:
-        vet_doc = await db.users.find_one({"user_id": chat["vet_id"]}, {"_id": 0, "password": 0})
-        owner_doc = await db.users.find_one({"user_id": chat["pet_owner_id"]}, {"_id": 0, "password": 0})
-        if vet_doc:
-            chat["vet_name"] = vet_doc["name"]
-            chat["vet_picture"] = vet_doc.get("picture")
-        if owner_doc:
-            chat["owner_name"] = owner_doc["name"]
-            chat["owner_picture"] = owner_doc.get("picture")
-    
-    return chats
+    return await enrich_with_users(chats, {"vet_id": "vet", "pet_owner_id": "owner"})
 
 
-@api_router.post("/messages")
-async def send_message(message_data: MessageCreate, request: Request, authorization: Optional[str] = Header(None)):
-    session_token = request.cookies.get("session_token")
-    user = await get_user_from_session(session_token, authorization)
-    if not user:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
+def chat_topic(chat_id: str) -> str:
+    return f"chat:{chat_id}"
+
+
+# Chat last_message summaries are coalesced per chat and written in batches
+chat_summaries = LastMessageBuffer(
+    repos.chats,
+    interval=float(os.environ.get('CHAT_SUMMARY_FLUSH_INTERVAL', '1')),
+    max_batch=int(os.environ.get('CHAT_SUMMARY_MAX_BATCH', '500'))
+)
+
+
+async def post_message(chat_id: str, user: Dict, content: str) -> Dict:
+    """Store a message, update the chat summary and push it to live subscribers"""
     message_id = f"msg_{uuid.uuid4().hex[:12]}"
     message = {
         "message_id": message_id,
-        "chat_id": message_data.chat_id,
+        "chat_id": chat_id,
         "sender_id": user["user_id"],
-        "content": message_data.content,
+        "content": content,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.messages.insert_one(message)
+    await repos.messages.insert(message)
     
-    # Update chat last message
-    await db.chats.update_one(
-        {"chat_id": message_data.chat_id},
-        {"$set": {
-            "last_message": message_data.content,
-            "last_message_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
+    # Update chat last message (buffered)
+    chat_summaries.record(chat_id, content, message["created_at"])
     
-    return await db.messages.find_one({"message_id": message_id}, {"_id": 0})
+    message = response_doc(message)
+    await broker.publish(chat_topic(chat_id), {**message, "sender_name": user["name"], "sender_picture": user.get("picture")})
+    return message
+
+
+@api_router.post("/messages")
+async def send_message(message_data: MessageCreate, request: Request, authorization: Optional[str] = Header(None)):
+    session_token = request.cookies.get("session_token")
+    user = await get_user_from_session(session_token, authorization)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    return await post_message(message_data.chat_id, user, message_data.content)
 
 
 @api_router.get("/messages/{chat_id}")
-async def get_messages(chat_id: str, request: Request, authorization: Optional[str] = Header(None)):
+async def get_messages(
+    chat_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
     session_token = request.cookies.get("session_token")
     user = await get_user_from_session(session_token, authorization)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    messages = await db.messages.find({"chat_id": chat_id}, {"_id": 0}).sort("created_at", 1).to_list(1000)
+    messages, next_cursor = await repos.messages.page(chat_id, limit, before, after)
+    set_next_cursor(response, next_cursor)
     
     # Enrich with sender data
-    for msg in messages:
-        sender_doc = await db.users.find_one({"user_id": msg["sender_id"]}, {"_id": 0, "password": 0})
-        if sender_doc:
-            msg["sender_name"] = sender_doc["name"]
-            msg["sender_picture"] = sender_doc.get("picture")
+    return await enrich_with_users(messages, {"sender_id": "sender"})
+
+
+# Messages fetched per query when replaying missed messages to a reconnecting WebSocket
+REPLAY_PAGE_SIZE = 1000
+
+async def iter_messages_since(chat_id: str, last_message_id: str, page_size: int = REPLAY_PAGE_SIZE):
+    """Pages of the messages in a chat that follow the given message, oldest first, up to the newest"""
+    last_message = await repos.messages.get(chat_id, last_message_id)
+    if not last_message:
+        return
     
-    return messages
+    cursor = encode_cursor(last_message, "message_id")
+    while cursor:
+        messages, cursor = await repos.messages.page(chat_id, page_size, after=cursor)
+        yield await enrich_with_users(messages, {"sender_id": "sender"})
+
+
+async def forward_chat_events(websocket: WebSocket, subscription: Subscription, replayed: set):
+    try:
+        while True:
+            message = await subscription.get()
+            if message is None:
+                # Fell too far behind; the client reconnects with its last_message_id
+                await websocket.close(code=1013)
+                return
+            if message["message_id"] in replayed:
+                continue
+            await websocket.send_json({"type": "message", "message": message})
+    except (WebSocketDisconnect, RuntimeError):
+        # Client went away; the receive loop handles cleanup
+        pass
+
+
+@api_router.websocket("/ws/chats/{chat_id}")
+async def chat_websocket(websocket: WebSocket, chat_id: str, token: Optional[str] = None, last_message_id: Optional[str] = None):
+    """Live chat delivery.
+
+    Authenticates with the `token` query parameter or the session cookie.
+    New messages are pushed as {"type": "message", "message": {...}};
+    with `last_message_id` anything sent since that message is replayed
+    first. Clients may also send {"content": "..."} to post a message.
+    """
+    await websocket.accept()
+    
+    user = await get_user_from_session(token or websocket.cookies.get("session_token"))
+    if not user:
+        await websocket.close(code=4401)
+        return
+    
+    chat = await repos.chats.get(chat_id)
+    if not chat or user["user_id"] not in (chat["pet_owner_id"], chat["vet_id"]):
+        await websocket.close(code=4403)
+        return
+    
+    # Subscribe before replaying so nothing published in between is lost
+    subscription = event_hub.subscribe(chat_topic(chat_id))
+    forwarder = None
+    try:
+        replayed = set()
+        if last_message_id:
+            async for messages in iter_messages_since(chat_id, last_message_id, REPLAY_PAGE_SIZE):
+                for message in messages:
+                    replayed.add(message["message_id"])
+                    await websocket.send_json({"type": "message", "message": message})
+        
+        forwarder = asyncio.create_task(forward_chat_events(websocket, subscription, replayed))
+        
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except ValueError:
+                data = None
+            content = data.get("content") if isinstance(data, dict) else None
+            if not content:
+                await websocket.send_json({"type": "error", "detail": "content required"})
+                continue
+            await post_message(chat_id, user, content)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if forwarder:
+            forwarder.cancel()
+        subscription.close()
 
 
 # ==================== PAYMENT ENDPOINTS ====================
@@ -645,19 +1297,21 @@ async def create_checkout_session(appointment_id: str, origin_url: str, request:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     # Get appointment
-    appointment = await db.appointments.find_one({"appointment_id": appointment_id}, {"_id": 0})
+    appointment = await repos.appointments.get(appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     # Initialize Stripe
     host_url = origin_url
     webhook_url = f"{host_url}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+    stripe_checkout = payment_client.checkout(webhook_url)
     
     # Create checkout session
     success_url = f"{origin_url}/payment/success?session_id={{CHECKOUT_SESSION_ID}}"
     cancel_url = f"{origin_url}/appointments"
     
+    from emergentintegrations.payments.stripe.checkout import CheckoutSessionRequest
+
     checkout_request = CheckoutSessionRequest(
         amount=appointment["amount"],
         currency="usd",
@@ -683,70 +1337,78 @@ async def create_checkout_session(appointment_id: str, origin_url: str, request:
         "payment_status": "pending",
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.payment_transactions.insert_one(payment_transaction)
+    await repos.payments.insert(payment_transaction)
     
     return {"url": session_response.url, "session_id": session_response.session_id}
 
 
 @api_router.get("/payments/status/{session_id}")
 async def get_payment_status(session_id: str):
-    # Initialize Stripe
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url="")
-    
-    # Get checkout status
-    status_response = await stripe_checkout.get_checkout_status(session_id)
-    
-    # Check if already processed
-    payment = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
+    # Already processed: answer locally without calling Stripe
+    payment = await repos.payments.get_by_session(session_id)
     if payment and payment["payment_status"] == "paid":
-        return status_response
+        return {
+            "status": "complete",
+            "payment_status": payment["payment_status"],
+            "amount_total": round(payment["amount"] * 100),
+            "currency": payment["currency"],
+            "metadata": {"appointment_id": payment["appointment_id"], "user_id": payment["user_id"]}
+        }
     
-    # Update payment transaction
+    # Get checkout status (cached briefly and shared by concurrent polls)
+    status_response = await payment_client.get_checkout_status(session_id)
+    
+    # Update payment transaction and appointment (no-op if the webhook got there first)
     if status_response.payment_status == "paid" and payment:
-        await db.payment_transactions.update_one(
-            {"session_id": session_id},
-            {"$set": {"payment_status": "paid"}}
-        )
-        
-        # Update appointment payment status
-        await db.appointments.update_one(
-            {"appointment_id": payment["appointment_id"]},
-            {"$set": {"payment_status": "paid", "status": "confirmed"}}
-        )
+        await mark_session_paid(session_id)
     
     return status_response
 
 
+async def mark_session_paid(session_id: str) -> bool:
+    """Flip a payment to paid exactly once and confirm its appointment; False if already paid"""
+    payment = await repos.payments.mark_paid(session_id)
+    if not payment:
+        return False
+    
+    # Only a pending appointment is confirmed by payment
+    await repos.appointments.mark_paid(payment["appointment_id"])
+    return True
+
+
+async def process_stripe_event(event: Dict):
+    if event["payment_status"] == "paid":
+        await mark_session_paid(event["session_id"])
+
+
+webhook_processor = WebhookProcessor(
+    repos.payments,
+    process_stripe_event,
+    workers=int(os.environ.get('WEBHOOK_WORKERS', '2'))
+)
+
+
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
     body = await request.body()
     signature = request.headers.get("Stripe-Signature")
     
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url="")
+    stripe_checkout = payment_client.checkout()
     
     try:
         webhook_response = await stripe_checkout.handle_webhook(body, signature)
-        
-        # Handle payment success
-        if webhook_response.payment_status == "paid":
-            session_id = webhook_response.session_id
-            payment = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
-            
-            if payment and payment["payment_status"] != "paid":
-                await db.payment_transactions.update_one(
-                    {"session_id": session_id},
-                    {"$set": {"payment_status": "paid"}}
-                )
-                
-                await db.appointments.update_one(
-                    {"appointment_id": payment["appointment_id"]},
-                    {"$set": {"payment_status": "paid", "status": "confirmed"}}
-                )
-        
-        return {"status": "success"}
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
+    
+    # Acknowledge at once; duplicates of an already-received event are dropped
+    await webhook_processor.receive({
+        "event_id": webhook_response.event_id,
+        "event_type": webhook_response.event_type,
+        "session_id": webhook_response.session_id,
+        "payment_status": webhook_response.payment_status
+    })
+    return {"status": "success"}
 
 
 # ==================== BASIC ROUTES ====================
@@ -756,6 +1418,35 @@ async def root():
     return {"message": "RafikiPets API"}
 
 
+@api_router.get("/health")
+async def health():
+    """Readiness probe: 503 until startup finishes or while MongoDB is unreachable.
+
+    The body also reports the in-process caches and the bcrypt pool for dashboards.
+    """
+    ready = app.state.ready
+    content = {
+        "backend": repos.backend,
+        "session_cache": session_cache.stats(),
+        # bcrypt pool saturation and queue depth behind login 429s
+        "password_hasher": password_hasher.stats()
+    }
+    if repos.backend == "mongo":
+        mongo = await ping(client, timeout=float(os.environ.get('HEALTH_PING_TIMEOUT', '2')))
+        ready = ready and mongo["ok"]
+        content["mongo"] = {**mongo, "pool": mongo_pool_stats.snapshot()}
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ok" if ready else "unavailable", **content}
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -765,8 +1456,8 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# Outermost, so the timings include the CORS handling
+app.add_middleware(MetricsMiddleware, metrics=metrics)
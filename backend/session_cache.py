@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+
+
+class SessionCache:
+    """Bounded, TTL-evicting session token -> user cache.
+
+    Entries live for at most `ttl` seconds and never past the session's own
+    `expires_at`. The cache is per-process, so a logout handled by another
+    worker is only seen here once the entry's TTL runs out.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Entries dropped to stay within max_size
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[Dict]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        user_doc, expires_at, cached_until = entry
+        if cached_until < time.monotonic() or expires_at < datetime.now(timezone.utc):
+            self.invalidate(token)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return dict(user_doc)
+
+    def set(self, token: str, user_doc: Dict, expires_at: datetime):
+        if self.max_size <= 0:
+            return
+
+        self.invalidate(token)
+        self._entries[token] = (dict(user_doc), expires_at, time.monotonic() + self.ttl)
+        self._tokens_by_user.setdefault(user_doc["user_id"], set()).add(token)
+
+        while len(self._entries) > self.max_size:
+            oldest_token = next(iter(self._entries))
+            self.invalidate(oldest_token)
+            self.evictions += 1
+
+    def invalidate(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+
+        user_id = entry[0]["user_id"]
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+    def invalidate_user(self, user_id: str):
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self.invalidate(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,109 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# Used for vets who haven't set working hours
+DEFAULT_AVAILABILITY = {
+    "slot_minutes": 30,
+    "hours": {day: [["09:00", "17:00"]] for day in WEEKDAYS[:5]}
+}
+
+MAX_SLOT_RANGE_DAYS = 31
+
+
+def parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+def parse_minutes(value: str) -> int:
+    """Minutes since midnight for an HH:MM (or HH:MM:SS) time"""
+    try:
+        parsed = datetime.strptime(value[:5], "%H:%M")
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    return parsed.hour * 60 + parsed.minute
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def slot_key(moment: datetime) -> Tuple[str, str]:
+    """(YYYY-MM-DD, HH:MM) of a datetime in the clinic's time zone; slots comparing <= it have started"""
+    return moment.date().isoformat(), format_minutes(moment.hour * 60 + moment.minute)
+
+
+def validate_availability(availability: Dict) -> Dict:
+    """Normalized copy of an availability document; raises ValueError if malformed"""
+    slot_minutes = availability.get("slot_minutes")
+    if not isinstance(slot_minutes, int) or not 5 <= slot_minutes <= 240:
+        raise ValueError("slot_minutes must be between 5 and 240")
+
+    hours = {}
+    for day, ranges in (availability.get("hours") or {}).items():
+        if day not in WEEKDAYS:
+            raise ValueError(f"Unknown weekday {day!r}, expected one of {', '.join(WEEKDAYS)}")
+        if any(not isinstance(item, (list, tuple)) or len(item) != 2 for item in ranges):
+            raise ValueError(f"Working hours on {day} must be [start, end] pairs")
+        parsed = sorted((parse_minutes(start), parse_minutes(end)) for start, end in ranges)
+        for (start, end), following in zip(parsed, parsed[1:] + [None]):
+            if start >= end:
+                raise ValueError(f"Empty working hours on {day}")
+            if following and following[0] < end:
+                raise ValueError(f"Overlapping working hours on {day}")
+        hours[day] = [[format_minutes(start), format_minutes(end)] for start, end in parsed]
+    return {"slot_minutes": slot_minutes, "hours": hours}
+
+
+def day_slots(availability: Dict, day: date) -> List[str]:
+    """Start times of every slot that fits inside the vet's hours on `day`"""
+    slot_minutes = availability["slot_minutes"]
+    starts = []
+    for start, end in availability["hours"].get(WEEKDAYS[day.weekday()], []):
+        minute, end_minute = parse_minutes(start), parse_minutes(end)
+        while minute + slot_minutes <= end_minute:
+            starts.append(format_minutes(minute))
+            minute += slot_minutes
+    return starts
+
+
+def iter_slots(availability: Dict, start: date, end: date) -> Iterator[Tuple[str, str]]:
+    """(date, time) for every working slot from `start` to `end` inclusive"""
+    day = start
+    while day <= end:
+        for time in day_slots(availability, day):
+            yield day.isoformat(), time
+        day += timedelta(days=1)
+
+
+def normalize_slot(availability: Dict, date_value: str, time_value: str) -> Optional[Tuple[str, str]]:
+    """Canonical (YYYY-MM-DD, HH:MM) if it is a working slot of the vet, else None"""
+    day = parse_date(date_value)
+    time = format_minutes(parse_minutes(time_value))
+    if time not in day_slots(availability, day):
+        return None
+    return day.isoformat(), time
+
+
+def conflicting_bookings(availability: Dict, booked_minutes: int, booked: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Booked (date, time) slots that a different slot of `availability` would overlap.
+
+    Reservations only block their exact start, so after a change of slot
+    length or hours a new slot starting elsewhere could be double-booked
+    over them. Bookings are taken to last `booked_minutes`.
+    """
+    slot_minutes = availability["slot_minutes"]
+    conflicts = []
+    for date_value, time_value in sorted(booked):
+        start = parse_minutes(time_value)
+        end = start + booked_minutes
+        for slot_time in day_slots(availability, parse_date(date_value)):
+            slot_start = parse_minutes(slot_time)
+            if slot_start != start and slot_start < end and start < slot_start + slot_minutes:
+                conflicts.append((date_value, time_value))
+                break
+    return conflicts
@@ -0,0 +1,122 @@
+"""Local stand-in for the Stripe Checkout Sessions API, for development and load tests.
+
+    python stripe_standin.py --port 12111 --latency-ms 80
+    STRIPE_API_BASE=http://localhost:12111 STRIPE_API_KEY=sk_test_standin uvicorn server:app
+
+Sessions are created and retrieved as Stripe does and kept in memory. They
+stay unpaid until POST /v1/checkout/sessions/{id}/pay, which Stripe does
+not have, marks one paid. Requests without a bearer key get a 401.
+"""
+import argparse
+import asyncio
+import re
+import uuid
+
+from aiohttp import web
+
+SESSIONS_PATH = "/v1/checkout/sessions"
+
+SESSIONS = web.AppKey("sessions", dict)
+# Client (host, port) pairs seen, to check connection reuse
+PEERS = web.AppKey("peers", set)
+
+# Form keys such as line_items[0][price_data][unit_amount]
+FORM_KEY = re.compile(r"[^\[\]]+")
+
+
+def stripe_error(status: int, message: str, error_type: str = "invalid_request_error") -> web.Response:
+    return web.json_response({"error": {"type": error_type, "message": message}}, status=status)
+
+
+def parse_form(form) -> dict:
+    """Nested dicts (lists for numeric keys) from Stripe's bracketed form encoding"""
+    parsed: dict = {}
+    for key, value in form.items():
+        parts = FORM_KEY.findall(key)
+        node = parsed
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+
+    def listify(node):
+        if not isinstance(node, dict):
+            return node
+        if node and all(key.isdigit() for key in node):
+            return [listify(node[key]) for key in sorted(node, key=int)]
+        return {key: listify(value) for key, value in node.items()}
+
+    return listify(parsed)
+
+
+def checkout_session(params: dict) -> dict:
+    line_items = params.get("line_items", [])
+    amount_total = params.get("amount_total") or sum(
+        int(item.get("price_data", {}).get("unit_amount", 0)) * int(item.get("quantity", 1))
+        for item in line_items
+    )
+    currency = params.get("currency") or next(
+        (item["price_data"]["currency"] for item in line_items if "currency" in item.get("price_data", {})), "usd"
+    )
+    session_id = f"cs_test_{uuid.uuid4().hex}"
+    return {
+        "id": session_id,
+        "object": "checkout.session",
+        "url": f"https://checkout.stripe.invalid/pay/{session_id}",
+        "mode": params.get("mode", "payment"),
+        "status": "open",
+        "payment_status": "unpaid",
+        "amount_total": int(amount_total),
+        "currency": currency,
+        "metadata": params.get("metadata", {}),
+        "success_url": params.get("success_url"),
+        "cancel_url": params.get("cancel_url"),
+    }
+
+
+def create_app(latency_ms: float = 0.0) -> web.Application:
+    sessions = {}
+    peers = set()
+
+    @web.middleware
+    async def stripe_api(request: web.Request, handler):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        peers.add(request.transport.get_extra_info("peername"))
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return stripe_error(401, "You did not provide an API key.", "authentication_error")
+        return await handler(request)
+
+    async def create_session(request: web.Request) -> web.Response:
+        session = checkout_session(parse_form(await request.post()))
+        sessions[session["id"]] = session
+        return web.json_response(session)
+
+    async def retrieve_session(request: web.Request) -> web.Response:
+        session = sessions.get(request.match_info["session_id"])
+        if session is None:
+            return stripe_error(404, f"No such checkout.session: '{request.match_info['session_id']}'")
+        return web.json_response(session)
+
+    async def pay_session(request: web.Request) -> web.Response:
+        session = sessions.get(request.match_info["session_id"])
+        if session is None:
+            return stripe_error(404, f"No such checkout.session: '{request.match_info['session_id']}'")
+        session.update(status="complete", payment_status="paid")
+        return web.json_response(session)
+
+    app = web.Application(middlewares=[stripe_api])
+    app[SESSIONS] = sessions
+    app[PEERS] = peers
+    app.router.add_post(SESSIONS_PATH, create_session)
+    app.router.add_get(SESSIONS_PATH + "/{session_id}", retrieve_session)
+    app.router.add_post(SESSIONS_PATH + "/{session_id}/pay", pay_session)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in Stripe Checkout Sessions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency_ms), host=args.host, port=args.port)
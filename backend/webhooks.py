@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookProcessor:
+    """Records Stripe webhook events in a ledger and applies them in the background.
+
+    `receive` records the event in the `stripe_events` ledger, whose
+    unique index on event_id drops Stripe's retries, and queues it so the
+    webhook can be acknowledged at once. Workers claim each event with a
+    conditional update before running the handler. A sweeper re-queues
+    events left pending by a full queue, a failed attempt or a crashed
+    worker.
+    """
+
+    def __init__(
+        self,
+        payments,
+        handler: Callable[[Dict], Awaitable[None]],
+        workers: int = 2,
+        max_queue: int = 1000,
+        max_attempts: int = 5,
+        sweep_interval: float = 30.0,
+        stale_after: float = 60.0,
+    ):
+        self.payments = payments
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self.stale_after = stale_after
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._tasks: List[asyncio.Task] = []
+
+    async def receive(self, event: Dict) -> bool:
+        """Record and queue an event; False if it was already received"""
+        try:
+            await self.payments.record_event({
+                **event,
+                "status": "pending",
+                "attempts": 0,
+                "received_at": datetime.now(timezone.utc)
+            })
+        except DuplicateKeyError:
+            return False
+
+        self._enqueue(event["event_id"])
+        return True
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def _enqueue(self, event_id: str):
+        try:
+            self.queue.put_nowait(event_id)
+        except asyncio.QueueFull:
+            logger.warning(f"Webhook queue full; {event_id} left for the sweeper")
+
+    async def _work(self):
+        while True:
+            event_id = await self.queue.get()
+            try:
+                await self.process(event_id)
+            except Exception:
+                # The event stays pending or claimed, so the sweeper retries it
+                logger.exception(f"Webhook event {event_id} could not be processed")
+
+    async def process(self, event_id: str) -> Optional[Dict]:
+        event = await self.payments.claim_event(event_id, datetime.now(timezone.utc))
+        if not event:
+            # Already processed, or claimed by another worker
+            return None
+
+        try:
+            await self.handler(event)
+        except Exception as e:
+            status = "failed" if event["attempts"] >= self.max_attempts else "pending"
+            logger.error(f"Webhook event {event_id} failed (attempt {event['attempts']}): {e}")
+            await self.payments.set_event_fields(event_id, {"status": status, "error": str(e)})
+            return None
+
+        await self.payments.set_event_fields(event_id, {"status": "processed", "processed_at": datetime.now(timezone.utc)})
+        return event
+
+    async def _sweep(self):
+        while True:
+            try:
+                await self.requeue_stale()
+            except Exception:
+                logger.exception("Webhook sweep failed")
+            await asyncio.sleep(self.sweep_interval)
+
+    async def requeue_stale(self) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after)
+        # Also releases events whose worker died mid-event
+        pending = await self.payments.stale_events(cutoff, self.queue.maxsize)
+        for event_id in pending:
+            self._enqueue(event_id)
+        return len(pending)
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LastMessageBuffer:
+    """Write-behind buffer for the last_message summary on chats.
+
+    Each message only records (content, created_at) in memory; a background
+    task writes the latest entry per chat with one unordered bulk_write every
+    `interval` seconds, or sooner once `max_batch` chats are waiting. A busy
+    chat therefore costs one summary write per interval rather than one per
+    message. Updates only apply when newer than the stored last_message_at,
+    so workers flushing out of order never move a summary backwards. `stop`
+    flushes whatever is still pending.
+    """
+
+    def __init__(self, chats, interval: float = 1.0, max_batch: int = 500):
+        self.chats = chats
+        self.interval = interval
+        self.max_batch = max_batch
+        self.flushes = 0
+        self.written = 0
+        self.coalesced = 0
+        self._pending: Dict[str, Tuple[str, str]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, chat_id: str, content: str, created_at: str):
+        current = self._pending.get(chat_id)
+        if current is not None:
+            self.coalesced += 1
+            if current[1] > created_at:
+                return
+        self._pending[chat_id] = (content, created_at)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def overlay(self, chats: List[Dict]) -> List[Dict]:
+        """Apply summaries still waiting in this worker's buffer to chat docs"""
+        for chat in chats:
+            pending = self._pending.get(chat["chat_id"])
+            if pending is not None and (chat.get("last_message_at") or "") < pending[1]:
+                chat["last_message"], chat["last_message_at"] = pending
+        return chats
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        try:
+            await self.chats.set_last_messages(batch)
+        except BaseException:
+            # Put the batch back (also when cancelled mid-write) unless newer
+            # messages arrived meanwhile; the guarded update makes a repeat harmless
+            for chat_id, (content, created_at) in batch.items():
+                current = self._pending.get(chat_id)
+                if current is None or current[1] < created_at:
+                    self._pending[chat_id] = (content, created_at)
+            raise
+        self.flushes += 1
+        self.written += len(batch)
+        return len(batch)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                logger.exception("Chat summary flusher had failed")
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception(f"Dropped {len(self._pending)} chat summaries on shutdown")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Chat summary flush failed")
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "written": self.written,
+            "coalesced": self.coalesced,
+        }
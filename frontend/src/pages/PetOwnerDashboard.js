@@ -39,6 +39,7 @@ export default function PetOwnerDashboard({ user }) {
     try {
       await fetch(`${API}/auth/logout`, {
         method: 'POST',
+        headers: { 'Authorization': `Bearer ${localStorage.getItem('session_token')}` },
         credentials: 'include'
       });
       localStorage.removeItem('session_token');
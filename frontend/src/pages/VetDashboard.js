@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { Calendar, MessageCircle, AlertCircle, LogOut } from 'lucide-react';
+import { Calendar, MessageCircle, AlertCircle, LogOut, MapPin } from 'lucide-react';
 import { toast } from 'sonner';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
@@ -11,23 +11,87 @@ export default function VetDashboard({ user }) {
   const [appointments, setAppointments] = useState([]);
   const [emergencyRequests, setEmergencyRequests] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [profile, setProfile] = useState(null);
 
   useEffect(() => {
     fetchData();
   }, []);
 
+  useEffect(() => {
+    // Live emergency feed. EventSource cannot send the bearer token, so each
+    // connection uses a single-use ticket; the browser's own reconnect reuses
+    // the spent ticket and is refused, so reopen with a fresh one and refetch
+    // whatever changed while disconnected.
+    let source = null;
+    let retryTimer = null;
+    let stopped = false;
+
+    const removeRequest = (event) => {
+      const req = JSON.parse(event.data);
+      setEmergencyRequests((prev) => prev.filter((r) => r.request_id !== req.request_id));
+    };
+
+    const connect = async () => {
+      try {
+        const token = localStorage.getItem('session_token');
+        const response = await fetch(`${API}/emergency/stream/ticket`, {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${token}` },
+          credentials: 'include'
+        });
+        if (!response.ok) throw new Error('Could not open the emergency feed');
+        const { ticket } = await response.json();
+        if (stopped) return;
+
+        source = new EventSource(`${API}/emergency/stream?ticket=${encodeURIComponent(ticket)}`, { withCredentials: true });
+        source.addEventListener('created', (event) => {
+          const req = JSON.parse(event.data);
+          setEmergencyRequests((prev) =>
+            prev.some((r) => r.request_id === req.request_id) ? prev : [...prev, req]
+          );
+        });
+        source.addEventListener('accepted', removeRequest);
+        source.addEventListener('cancelled', removeRequest);
+        source.addEventListener('completed', removeRequest);
+        source.onerror = () => {
+          source.close();
+          scheduleReconnect();
+        };
+      } catch (error) {
+        scheduleReconnect();
+      }
+    };
+
+    const scheduleReconnect = () => {
+      if (stopped) return;
+      retryTimer = setTimeout(() => {
+        fetchData();
+        connect();
+      }, 2000);
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, []);
+
   const fetchData = async () => {
     try {
       const token = localStorage.getItem('session_token');
       const headers = { 'Authorization': `Bearer ${token}` };
 
-      const [aptsRes, emergencyRes] = await Promise.all([
+      const [aptsRes, emergencyRes, profileRes] = await Promise.all([
         fetch(`${API}/appointments`, { headers, credentials: 'include' }),
-        fetch(`${API}/emergency`, { headers, credentials: 'include' })
+        fetch(`${API}/emergency`, { headers, credentials: 'include' }),
+        fetch(`${API}/vet/profile/me`, { headers, credentials: 'include' })
       ]);
 
       if (aptsRes.ok) setAppointments(await aptsRes.json());
       if (emergencyRes.ok) setEmergencyRequests(await emergencyRes.json());
+      if (profileRes.ok) setProfile(await profileRes.json());
     } catch (error) {
       console.error('Error fetching data:', error);
     } finally {
@@ -53,10 +117,46 @@ export default function VetDashboard({ user }) {
     }
   };
 
+  // Vets without coordinates are left out of nearby searches and only see broadcast emergencies
+  const handleSetLocation = () => {
+    if (!navigator.geolocation) {
+      toast.error('Location is not available in this browser');
+      return;
+    }
+    navigator.geolocation.getCurrentPosition(
+      async (position) => {
+        try {
+          const token = localStorage.getItem('session_token');
+          const response = await fetch(`${API}/vet/profile`, {
+            method: 'PATCH',
+            headers: {
+              'Content-Type': 'application/json',
+              'Authorization': `Bearer ${token}`
+            },
+            credentials: 'include',
+            body: JSON.stringify({
+              latitude: position.coords.latitude,
+              longitude: position.coords.longitude
+            })
+          });
+          if (!response.ok) {
+            throw new Error('Failed to save location');
+          }
+          setProfile(await response.json());
+          toast.success('Clinic location saved');
+        } catch (error) {
+          toast.error(error.message);
+        }
+      },
+      () => toast.error('Could not get your location')
+    );
+  };
+
   const handleLogout = async () => {
     try {
       await fetch(`${API}/auth/logout`, {
         method: 'POST',
+        headers: { 'Authorization': `Bearer ${localStorage.getItem('session_token')}` },
         credentials: 'include'
       });
       localStorage.removeItem('session_token');
@@ -107,6 +207,24 @@ export default function VetDashboard({ user }) {
           <p className="text-[#787A91]">Manage your appointments and emergency requests</p>
         </div>
 
+        {profile && profile.latitude == null && (
+          <div className="bg-white rounded-3xl p-6 shadow-soft mb-8 flex items-center justify-between gap-4" data-testid="location-missing">
+            <div className="flex items-center gap-3">
+              <MapPin className="w-6 h-6 text-clay" />
+              <p className="text-sm text-deepblue">
+                Add your clinic location so nearby pet owners and emergencies can find you.
+              </p>
+            </div>
+            <button
+              onClick={handleSetLocation}
+              className="bg-sage text-white rounded-full px-5 py-2 font-bold text-sm whitespace-nowrap"
+              data-testid="btn-set-location"
+            >
+              Use my current location
+            </button>
+          </div>
+        )}
+
         {/* Stats */}
         <div className="grid md:grid-cols-3 gap-6 mb-12">
           <div className="bg-white rounded-3xl p-6 shadow-soft">
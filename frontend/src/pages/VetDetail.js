@@ -18,11 +18,22 @@ export default function VetDetail() {
     pet_type: '',
     reason: ''
   });
+  const [freeTimes, setFreeTimes] = useState([]);
 
   useEffect(() => {
     fetchVet();
   }, [vetId]);
 
+  useEffect(() => {
+    // Offer the vet's free slots for the chosen day
+    const date = bookingData.appointment_date;
+    if (!date) return;
+    fetch(`${API}/vets/${vetId}/slots?from=${date}&to=${date}`)
+      .then((response) => (response.ok ? response.json() : []))
+      .then((slots) => setFreeTimes(slots.map((slot) => slot.time)))
+      .catch(() => setFreeTimes([]));
+  }, [vetId, bookingData.appointment_date]);
+
   const fetchVet = async () => {
     try {
       const token = localStorage.getItem('session_token');
@@ -52,6 +63,9 @@ export default function VetDetail() {
       if (response.ok) {
         toast.success('Appointment booked!');
         navigate('/appointments');
+      } else {
+        const error = await response.json().catch(() => ({}));
+        toast.error(error.detail || 'Booking failed');
       }
     } catch (error) {
       toast.error('Booking failed');
@@ -133,10 +147,14 @@ export default function VetDetail() {
                   data-testid="input-time"
                   type="time"
                   required
+                  list="free-times"
                   value={bookingData.appointment_time}
                   onChange={(e) => setBookingData({...bookingData, appointment_time: e.target.value})}
                   className="px-4 py-3 rounded-xl border border-deepblue/10 focus:border-clay outline-none"
                 />
+                <datalist id="free-times">
+                  {freeTimes.map((time) => <option key={time} value={time} />)}
+                </datalist>
               </div>
               <input
                 data-testid="input-pet-name"
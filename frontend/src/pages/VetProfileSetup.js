@@ -16,12 +16,42 @@ export default function VetProfileSetup() {
     location: '',
     phone: '',
     bio: '',
-    experience_years: 0
+    experience_years: 0,
+    latitude: '',
+    longitude: ''
   });
   const [loading, setLoading] = useState(false);
+  const [locating, setLocating] = useState(false);
+
+  // Coordinates let the clinic appear in nearby searches and emergency dispatch
+  const useMyLocation = () => {
+    if (!navigator.geolocation) {
+      toast.error('Location is not available in this browser');
+      return;
+    }
+    setLocating(true);
+    navigator.geolocation.getCurrentPosition(
+      (position) => {
+        setFormData((current) => ({
+          ...current,
+          latitude: position.coords.latitude.toFixed(6),
+          longitude: position.coords.longitude.toFixed(6)
+        }));
+        setLocating(false);
+      },
+      () => {
+        toast.error('Could not get your location');
+        setLocating(false);
+      }
+    );
+  };
 
   const handleSubmit = async (e) => {
     e.preventDefault();
+    if ((formData.latitude === '') !== (formData.longitude === '')) {
+      toast.error('Enter both latitude and longitude, or neither');
+      return;
+    }
     setLoading(true);
 
     try {
@@ -33,7 +63,11 @@ export default function VetProfileSetup() {
           'Authorization': `Bearer ${token}`
         },
         credentials: 'include',
-        body: JSON.stringify(formData)
+        body: JSON.stringify({
+          ...formData,
+          latitude: formData.latitude === '' ? null : parseFloat(formData.latitude),
+          longitude: formData.longitude === '' ? null : parseFloat(formData.longitude)
+        })
       });
 
       if (!response.ok) {
@@ -126,6 +160,50 @@ export default function VetProfileSetup() {
               </div>
             </div>
 
+            <div>
+              <div className="flex items-center justify-between mb-2">
+                <label className="block text-sm font-medium text-deepblue">
+                  Clinic Coordinates
+                </label>
+                <button
+                  data-testid="btn-use-location"
+                  type="button"
+                  onClick={useMyLocation}
+                  disabled={locating}
+                  className="text-sm font-medium text-clay hover:underline disabled:opacity-50"
+                >
+                  {locating ? 'Locating...' : 'Use my current location'}
+                </button>
+              </div>
+              <div className="grid md:grid-cols-2 gap-6">
+                <input
+                  data-testid="input-latitude"
+                  type="number"
+                  step="any"
+                  min="-90"
+                  max="90"
+                  value={formData.latitude}
+                  onChange={(e) => setFormData({ ...formData, latitude: e.target.value })}
+                  className="w-full px-4 py-3 rounded-xl border border-deepblue/10 bg-[#F9F9F9] focus:bg-white focus:border-clay outline-none transition-colors"
+                  placeholder="Latitude, e.g. -0.5389"
+                />
+                <input
+                  data-testid="input-longitude"
+                  type="number"
+                  step="any"
+                  min="-180"
+                  max="180"
+                  value={formData.longitude}
+                  onChange={(e) => setFormData({ ...formData, longitude: e.target.value })}
+                  className="w-full px-4 py-3 rounded-xl border border-deepblue/10 bg-[#F9F9F9] focus:bg-white focus:border-clay outline-none transition-colors"
+                  placeholder="Longitude, e.g. 37.4596"
+                />
+              </div>
+              <p className="text-xs text-[#787A91] mt-2">
+                Needed to show up in nearby searches and receive emergency requests first
+              </p>
+            </div>
+
             <div>
               <label className="block text-sm font-medium text-deepblue mb-2">
                 Years of Experience
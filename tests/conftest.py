@@ -0,0 +1,36 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend is a flat set of modules run from its own directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# server reads its configuration on import: keep all data in memory and make
+# bcrypt cheap. Motor connects lazily, so the placeholder URL is never dialed.
+os.environ["DATA_BACKEND"] = "memory"
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The app with its lifespan running, shared by every API test.
+
+    Asyncio primitives in server.py bind to the first event loop that uses
+    them, so there is one client (and loop) for the whole session; tests
+    keep apart by registering their own users.
+    """
+    from fastapi.testclient import TestClient
+
+    import server
+
+    with TestClient(server.app) as client:
+        yield client
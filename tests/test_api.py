@@ -0,0 +1,252 @@
+"""End-to-end API tests against the in-memory repositories (see conftest.py)"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from pagination import NEXT_CURSOR_HEADER
+
+
+def register(client, user_type="pet_owner", password="secret-pw"):
+    """(auth headers, user) for a newly registered account"""
+    email = f"{user_type}_{uuid.uuid4().hex[:8]}@example.com"
+    response = client.post("/api/auth/register", json={
+        "email": email, "password": password, "name": email.split("@")[0], "user_type": user_type
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return {"Authorization": f"Bearer {body['session_token']}"}, body["user"]
+
+
+def create_vet(client, **profile):
+    headers, user = register(client, "vet")
+    response = client.post("/api/vet/profile", headers=headers, json={
+        "license_number": "KVB-1", "specialty": "Dogs", "location": "Nairobi", **profile
+    })
+    assert response.status_code == 200, response.text
+    return headers, user
+
+
+def next_weekday(days_ahead=2) -> str:
+    """A Monday-Friday date at least `days_ahead` days away, inside the default working hours"""
+    day = date.today() + timedelta(days=days_ahead)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day.isoformat()
+
+
+def book(client, headers, vet_id, day, time="10:00"):
+    return client.post("/api/appointments", headers=headers, json={
+        "vet_id": vet_id, "appointment_date": day, "appointment_time": time,
+        "pet_name": "Rex", "pet_type": "dog", "reason": "Checkup"
+    })
+
+
+def test_register_and_login(client):
+    headers, user = register(client, password="right-pw")
+    assert "password" not in user
+    assert client.get("/api/auth/me", headers=headers).json()["user_id"] == user["user_id"]
+
+    duplicate = client.post("/api/auth/register", json={
+        "email": user["email"], "password": "x", "name": "x", "user_type": "pet_owner"
+    })
+    assert duplicate.status_code == 400
+
+    wrong = client.post("/api/auth/login", json={"email": user["email"], "password": "wrong-pw"})
+    assert wrong.status_code == 401
+
+    login = client.post("/api/auth/login", json={"email": user["email"], "password": "right-pw"})
+    assert login.status_code == 200
+    token = login.json()["session_token"]
+    me = client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert me.json()["user_id"] == user["user_id"]
+
+    assert client.get("/api/auth/me").status_code == 401
+
+
+def test_nearby_vets_are_sorted_and_paginated(client):
+    # A region no other test places vets in
+    latitude, longitude = 10.0, 10.0
+    vet_ids = [create_vet(client, latitude=latitude + 0.01 * i, longitude=longitude)[1]["user_id"] for i in range(4)]
+    far = create_vet(client, latitude=latitude + 1.0, longitude=longitude)[1]["user_id"]
+
+    params = {"lat": latitude, "lng": longitude, "radius": 10, "limit": 3}
+    first = client.get("/api/vets/nearby", params=params)
+    assert first.status_code == 200
+    assert [vet["user_id"] for vet in first.json()] == vet_ids[:3]
+    distances = [vet["distance"] for vet in first.json()]
+    assert distances == sorted(distances)
+
+    second = client.get("/api/vets/nearby", params={**params, "after": first.headers[NEXT_CURSOR_HEADER]})
+    assert [vet["user_id"] for vet in second.json()] == vet_ids[3:]
+    assert NEXT_CURSOR_HEADER not in second.headers
+    assert far not in [vet["user_id"] for vet in first.json() + second.json()]
+
+
+def test_slot_booking(client):
+    owner, _ = register(client)
+    other_owner, _ = register(client)
+    _, vet = create_vet(client)
+    day = next_weekday()
+
+    slots = client.get(f"/api/vets/{vet['user_id']}/slots", params={"from": day, "to": day}).json()
+    assert {"date": day, "time": "10:00"} in slots
+
+    assert book(client, owner, vet["user_id"], day).status_code == 200
+    # The slot is taken, whoever asks
+    assert book(client, other_owner, vet["user_id"], day).status_code == 409
+    assert book(client, other_owner, vet["user_id"], day, "10:15").status_code == 400
+    assert book(client, other_owner, vet["user_id"], "2020-01-06").status_code == 400
+
+    slots = client.get(f"/api/vets/{vet['user_id']}/slots", params={"from": day, "to": day}).json()
+    assert {"date": day, "time": "10:00"} not in slots
+
+
+def test_concurrent_bookings_of_one_slot(client):
+    owners = [register(client)[0] for _ in range(5)]
+    _, vet = create_vet(client)
+    day = next_weekday()
+
+    with ThreadPoolExecutor(len(owners)) as pool:
+        statuses = sorted(pool.map(lambda headers: book(client, headers, vet["user_id"], day).status_code, owners))
+    assert statuses == [200, 409, 409, 409, 409]
+
+
+def test_appointment_state_machine(client):
+    owner, _ = register(client)
+    stranger, _ = register(client)
+    vet_headers, vet = create_vet(client)
+    day = next_weekday()
+    appointment_id = book(client, owner, vet["user_id"], day).json()["appointment_id"]
+
+    def set_status(headers, status):
+        return client.patch(f"/api/appointments/{appointment_id}", headers=headers, params={"status": status})
+
+    assert set_status(owner, "confirmed").status_code == 403
+    assert set_status(stranger, "confirmed").status_code == 404
+    assert set_status(vet_headers, "bogus").status_code == 400
+    assert set_status(vet_headers, "completed").status_code == 409
+
+    confirmed = set_status(vet_headers, "confirmed")
+    assert confirmed.status_code == 200 and confirmed.json()["status"] == "confirmed"
+    assert set_status(vet_headers, "pending").status_code == 409
+    assert set_status(vet_headers, "completed").json()["status"] == "completed"
+    # Completed is final
+    assert set_status(owner, "cancelled").status_code == 409
+
+    # Cancelling frees the slot for another booking
+    other = book(client, owner, vet["user_id"], day, "11:00").json()["appointment_id"]
+    cancel = client.patch(f"/api/appointments/{other}", headers=owner, params={"status": "cancelled"})
+    assert cancel.status_code == 200
+    assert book(client, stranger, vet["user_id"], day, "11:00").status_code == 200
+
+
+def test_emergency_accept_race(client):
+    owner, _ = register(client)
+    vets = [create_vet(client) for _ in range(5)]
+
+    # Without coordinates the request is broadcast to every vet
+    created = client.post("/api/emergency", headers=owner, json={
+        "location": "Westlands", "description": "Bleeding paw", "pet_name": "Rex", "pet_type": "dog"
+    })
+    assert created.status_code == 200
+    request_id = created.json()["request_id"]
+    assert not any(key.startswith("dispatch_") or key == "notified_vet_ids" for key in created.json())
+
+    def accept(vet):
+        return client.patch(f"/api/emergency/{request_id}/accept", headers=vet[0])
+
+    with ThreadPoolExecutor(len(vets)) as pool:
+        responses = list(pool.map(accept, vets))
+
+    assert sorted(response.status_code for response in responses) == [200, 409, 409, 409, 409]
+    winner = next(vet for vet, response in zip(vets, responses) if response.status_code == 200)
+    owner_view = client.get("/api/emergency", headers=owner).json()
+    assert [(request["request_id"], request["assigned_vet_id"]) for request in owner_view] == [(request_id, winner[1]["user_id"])]
+
+    assert client.patch(f"/api/emergency/{request_id}/accept", headers=owner).status_code == 403
+    assert client.patch("/api/emergency/emr_missing/accept", headers=vets[0][0]).status_code == 404
+
+
+def test_message_cursor_pagination(client):
+    owner, _ = register(client)
+    _, vet = create_vet(client)
+    chat_id = client.post("/api/chats", headers=owner, params={"vet_id": vet["user_id"]}).json()["chat_id"]
+    sent = [
+        client.post("/api/messages", headers=owner, json={"chat_id": chat_id, "content": f"message {i}"}).json()["message_id"]
+        for i in range(7)
+    ]
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"after": cursor} if cursor else {})}
+        response = client.get(f"/api/messages/{chat_id}", headers=owner, params=params)
+        assert response.status_code == 200
+        pages.append([message["message_id"] for message in response.json()])
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+    assert pages == [sent[0:3], sent[3:6], sent[6:7]]
+
+    # Walking back through older history from a page ending at message 5
+    page = client.get(f"/api/messages/{chat_id}", headers=owner, params={"limit": 6})
+    before = client.get(f"/api/messages/{chat_id}", headers=owner, params={"limit": 3, "before": page.headers[NEXT_CURSOR_HEADER]})
+    assert [message["message_id"] for message in before.json()] == sent[2:5]
+    older = client.get(f"/api/messages/{chat_id}", headers=owner, params={"limit": 3, "before": before.headers[NEXT_CURSOR_HEADER]})
+    assert [message["message_id"] for message in older.json()] == sent[0:2]
+    assert NEXT_CURSOR_HEADER not in older.headers
+
+    cursor = page.headers[NEXT_CURSOR_HEADER]
+    both = client.get(f"/api/messages/{chat_id}", headers=owner, params={"before": cursor, "after": cursor})
+    assert both.status_code == 400
+
+
+def test_vet_profile_update_sets_coordinates(client):
+    headers, vet = create_vet(client)
+    params = {"lat": -20.0, "lng": -20.0, "radius": 5}
+    assert client.get("/api/vets/nearby", params=params).json() == []
+
+    assert client.patch("/api/vet/profile", headers=headers, json={"latitude": -20.0}).status_code == 400
+    assert client.patch("/api/vet/profile", headers=headers, json={"latitude": 91, "longitude": 0}).status_code == 422
+    assert client.patch("/api/vet/profile", headers=headers, json={}).status_code == 400
+
+    updated = client.patch("/api/vet/profile", headers=headers, json={"latitude": -20.0, "longitude": -20.0, "bio": "Mobile clinic"})
+    assert updated.status_code == 200
+    assert updated.json()["bio"] == "Mobile clinic" and "geo" not in updated.json()
+    assert [found["user_id"] for found in client.get("/api/vets/nearby", params=params).json()] == [vet["user_id"]]
+
+    owner, _ = register(client)
+    assert client.patch("/api/vet/profile", headers=owner, json={"bio": "x"}).status_code == 404
+
+
+def test_started_slots_use_clinic_time(client, monkeypatch):
+    import server
+
+    # Far enough from UTC that comparing against UTC would show started slots
+    monkeypatch.setattr(server, "clinic_tz", ZoneInfo("Etc/GMT-14"))
+    now = datetime.now(server.clinic_tz)
+    vet_headers, vet = create_vet(client)
+    hours = {day: [["00:00", "23:59"]] for day in ("mon", "tue", "wed", "thu", "fri", "sat", "sun")}
+    assert client.put("/api/vet/availability", headers=vet_headers, json={"slot_minutes": 60, "hours": hours}).status_code == 200
+
+    today = now.date().isoformat()
+    slots = client.get(f"/api/vets/{vet['user_id']}/slots", params={"from": today, "to": today}).json()
+    assert all(slot["time"] > now.strftime("%H:%M") for slot in slots)
+
+    if now.hour >= 1:
+        owner, _ = register(client)
+        response = book(client, owner, vet["user_id"], today, f"{now.hour - 1:02d}:00")
+        assert response.status_code == 400 and "past" in response.json()["detail"]
+
+
+def test_malformed_working_hours_are_rejected(client):
+    vet_headers, _ = create_vet(client)
+
+    def set_hours(ranges):
+        return client.put("/api/vet/availability", headers=vet_headers, json={"slot_minutes": 30, "hours": {"tue": ranges}})
+
+    for ranges in ([["09:00", "12:00", "17:00"]], [["09:00"]]):
+        response = set_hours(ranges)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Working hours on tue must be [start, end] pairs"
+    assert "Overlapping" in set_hours([["09:00", "12:00"], ["11:00", "13:00"]]).json()["detail"]
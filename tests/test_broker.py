@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from itertools import count
+
+import pytest
+
+import broker as broker_module
+from broker import MongoBroker
+from hub import Hub
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeCursor:
+    """A tailable cursor over the matching documents present when it was opened"""
+
+    def __init__(self, docs):
+        self._docs = list(docs)
+        self.alive = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._docs:
+            # Dies instead of awaiting more data, so _follow returns
+            self.alive = False
+            raise StopAsyncIteration
+        return self._docs.pop(0)
+
+
+class FakeCollection:
+    """Insertion (natural) order, naive UTC dates on read like Motor"""
+
+    def __init__(self):
+        self.docs = []
+        self.ids = count(1)
+        self.failures = 0
+
+    async def insert_one(self, doc):
+        self.docs.append({"_id": next(self.ids), **doc, "created_at": doc["created_at"].replace(tzinfo=None)})
+
+    async def find_one(self, query, sort=None):
+        return dict(self.docs[0]) if self.docs else None
+
+    def find(self, query, cursor_type=None):
+        if self.failures:
+            self.failures -= 1
+            raise ValueError("unexpected reply")
+        since = query["created_at"]["$gte"].replace(tzinfo=None)
+        return FakeCursor(dict(doc) for doc in self.docs if doc["created_at"] >= since)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+    async def create_collection(self, name, **options):
+        self[name]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Seconds since EPOCH returned by datetime.now inside broker.py"""
+    now = [0.0]
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return EPOCH + timedelta(seconds=now[0])
+
+    monkeypatch.setattr(broker_module, "datetime", FakeDatetime)
+    return now
+
+
+def drain(subscription):
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+@pytest.mark.anyio
+async def test_start_skips_events_published_earlier(clock):
+    hub, db = Hub(), FakeDatabase()
+    subscription = hub.subscribe("topic")
+    broker = MongoBroker(hub, db, poll_interval=0)
+
+    await broker.publish("topic", "before")
+    clock[0] = 1
+    await broker.start()
+    await broker.stop()
+    await broker.publish("topic", "after")
+    await broker._follow()
+
+    assert drain(subscription) == ["after"]
+
+
+@pytest.mark.anyio
+async def test_interleaved_publishers_are_delivered_once_in_insert_order(clock, caplog):
+    hub, db = Hub(), FakeDatabase()
+    subscription = hub.subscribe("topic")
+    tailer = MongoBroker(hub, db, poll_interval=0)
+    first, second = MongoBroker(Hub(), db), MongoBroker(Hub(), db)
+
+    clock[0] = 10
+    await first.publish("topic", "a")
+    await tailer._follow()
+    # second stamped its event before first's next one but inserted it later,
+    # so it lands behind a newer created_at once the cursor has reopened
+    clock[0] = 12
+    await first.publish("topic", "c")
+    await tailer._follow()
+    clock[0] = 11
+    await second.publish("topic", "b")
+    clock[0] = 13
+    await first.publish("topic", "d")
+    with caplog.at_level(logging.WARNING, logger="broker"):
+        await tailer._follow()
+        await tailer._follow()
+
+    assert drain(subscription) == ["a", "c", "b", "d"]
+    assert "fell behind" not in caplog.text
+
+
+@pytest.mark.anyio
+async def test_resumes_after_the_capped_collection_wrapped(clock, caplog):
+    hub, db = Hub(), FakeDatabase()
+    subscription = hub.subscribe("topic")
+    broker = MongoBroker(hub, db, poll_interval=0)
+
+    clock[0] = 1
+    await broker.publish("topic", 1)
+    await broker.publish("topic", 2)
+    await broker._follow()
+
+    # The capped collection wraps around past everything delivered so far
+    db["events"].docs.clear()
+    clock[0] = 60
+    await broker.publish("topic", 3)
+    await broker.publish("topic", 4)
+    with caplog.at_level(logging.WARNING, logger="broker"):
+        await broker._follow()
+
+    assert drain(subscription) == [1, 2, 3, 4]
+    assert "fell behind" in caplog.text
+
+
+@pytest.mark.anyio
+async def test_tailer_survives_unexpected_errors():
+    hub, db = Hub(), FakeDatabase()
+    subscription = hub.subscribe("topic")
+    broker = MongoBroker(hub, db, poll_interval=0.001)
+    db["events"].failures = 2
+
+    await broker.start()
+    try:
+        await broker.publish("topic", "event")
+        for _ in range(200):
+            if not subscription.queue.empty():
+                break
+            await asyncio.sleep(0.005)
+    finally:
+        await broker.stop()
+
+    assert drain(subscription) == ["event"]
+    assert db["events"].failures == 0
@@ -0,0 +1,147 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dispatch import Dispatcher
+from memory_repositories import create_memory_repositories
+
+
+@pytest.mark.anyio
+async def test_sweeper_survives_callback_errors():
+    repos = create_memory_repositories()
+    await repos.emergencies.insert({
+        "request_id": "emr_1",
+        "pet_owner_id": "user_1",
+        "status": "active",
+        "dispatch_candidates": ["vet_a", "vet_b", "vet_c"],
+        "dispatch_wave": 1,
+        "notified_vet_ids": ["vet_a"],
+        "dispatch_broadcast": False,
+        "dispatch_next_wave_at": "2000-01-01T00:00:00+00:00",
+        "created_at": "2000-01-01T00:00:00+00:00",
+        "updated_at": "2000-01-01T00:00:00+00:00",
+    })
+    changes = []
+
+    async def on_change(emergency_request):
+        changes.append(emergency_request["dispatch_wave"])
+        raise RuntimeError("subscriber failed")
+
+    dispatcher = Dispatcher(repos.emergencies, repos.vet_profiles, on_change, wave_size=1, wave_timeout=0, tick=0.01)
+    await dispatcher.start()
+    try:
+        for _ in range(100):
+            if len(changes) >= 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task = dispatcher._task
+        await dispatcher.stop()
+
+    # The first failing callback did not end the sweeper
+    assert changes[:2] == [2, 3]
+    assert task.cancelled()
+
+
+async def add_vet(repos, user_id, latitude, longitude, specialty="General Practice", available=True):
+    await repos.vet_profiles.insert({
+        "user_id": user_id,
+        "specialty": specialty,
+        "available": available,
+        "latitude": latitude,
+        "longitude": longitude,
+        "geo": {"type": "Point", "coordinates": [longitude, latitude]},
+    })
+
+
+async def dispatch(repos, dispatcher, candidates):
+    emergency_request = {
+        "request_id": "emr_1",
+        "pet_owner_id": "user_owner",
+        "status": "active",
+        "created_at": "2000-01-01T00:00:00+00:00",
+        "updated_at": "2000-01-01T00:00:00+00:00",
+        **dispatcher.initial_fields(candidates),
+    }
+    await repos.emergencies.insert(emergency_request)
+    return await repos.emergencies.get("emr_1")
+
+
+def make_dispatcher(repos, changes=None, **options):
+    async def on_change(emergency_request):
+        if changes is not None:
+            changes.append(emergency_request)
+
+    return Dispatcher(repos.emergencies, repos.vet_profiles, on_change, **options)
+
+
+@pytest.mark.anyio
+async def test_candidates_are_ranked_by_distance():
+    repos = create_memory_repositories()
+    # Roughly 1.1 km per 0.01 degree of latitude
+    await add_vet(repos, "vet_far", 0.05, 0.0)
+    await add_vet(repos, "vet_near", 0.01, 0.0)
+    await add_vet(repos, "vet_mid", 0.03, 0.0)
+    await add_vet(repos, "vet_cats", 0.035, 0.0, specialty="Cats")
+    await add_vet(repos, "vet_away", 0.02, 0.0, available=False)
+    await add_vet(repos, "vet_out_of_range", 1.0, 0.0)
+    await add_vet(repos, "user_owner", 0.0, 0.0)
+    dispatcher = make_dispatcher(repos, radius_km=10)
+
+    assert await dispatcher.rank_candidates(0.0, 0.0, "dog", "user_owner") == ["vet_near", "vet_mid", "vet_cats", "vet_far"]
+    # A specialty matching the pet counts as a quarter closer
+    assert await dispatcher.rank_candidates(0.0, 0.0, "cat", "user_owner") == ["vet_near", "vet_cats", "vet_mid", "vet_far"]
+
+
+@pytest.mark.anyio
+async def test_waves_advance_on_timeout_then_broadcast():
+    repos = create_memory_repositories()
+    changes = []
+    dispatcher = make_dispatcher(repos, changes, wave_size=2, wave_timeout=30)
+    emergency_request = await dispatch(repos, dispatcher, ["vet_a", "vet_b", "vet_c", "vet_d", "vet_e"])
+
+    assert emergency_request["notified_vet_ids"] == ["vet_a", "vet_b"]
+    assert not emergency_request["dispatch_broadcast"]
+    # Not due until the wave timeout has passed
+    assert await repos.emergencies.due_for_next_wave(datetime.now(timezone.utc).isoformat()) == []
+    later = (datetime.now(timezone.utc) + timedelta(seconds=31)).isoformat()
+    assert [due["request_id"] for due in await repos.emergencies.due_for_next_wave(later)] == ["emr_1"]
+
+    second = await dispatcher.advance(emergency_request)
+    assert second["dispatch_wave"] == 2
+    assert second["notified_vet_ids"] == ["vet_a", "vet_b", "vet_c", "vet_d"]
+    assert not second["dispatch_broadcast"] and second["dispatch_next_wave_at"]
+    # Another worker advancing the same wave loses the claim
+    assert await dispatcher.advance(emergency_request) is None
+
+    third = await dispatcher.advance(second)
+    assert third["notified_vet_ids"] == ["vet_a", "vet_b", "vet_c", "vet_d", "vet_e"]
+    assert third["dispatch_broadcast"] and third["dispatch_next_wave_at"] is None
+    assert [change["dispatch_wave"] for change in changes] == [2, 3]
+
+
+@pytest.mark.anyio
+async def test_requests_without_candidates_are_broadcast():
+    repos = create_memory_repositories()
+    dispatcher = make_dispatcher(repos)
+    emergency_request = await dispatch(repos, dispatcher, [])
+
+    assert emergency_request["dispatch_broadcast"] and emergency_request["dispatch_next_wave_at"] is None
+    assert await dispatcher.accept("emr_1", "vet_anyone")
+
+
+@pytest.mark.anyio
+async def test_only_notified_vets_accept_before_the_broadcast():
+    repos = create_memory_repositories()
+    dispatcher = make_dispatcher(repos, wave_size=1)
+    emergency_request = await dispatch(repos, dispatcher, ["vet_a", "vet_b"])
+
+    assert await dispatcher.accept("emr_1", "vet_b") is None
+    assert await dispatcher.accept("emr_1", "vet_outsider") is None
+
+    second = await dispatcher.advance(emergency_request)
+    assert second["dispatch_broadcast"]
+    accepted = await dispatcher.accept("emr_1", "vet_outsider")
+    assert accepted["status"] == "accepted" and accepted["assigned_vet_id"] == "vet_outsider"
+    assert await dispatcher.accept("emr_1", "vet_a") is None
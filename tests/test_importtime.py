@@ -0,0 +1,19 @@
+import os
+import statistics
+
+import importtime
+
+# Cold-start budget for `import server`; generous enough for a loaded CI box
+IMPORT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', '1500'))
+
+
+def test_server_import_stays_within_budget():
+    samples = []
+    for _ in range(3):
+        wall_ms, eager, _ = importtime.run_once()
+        # Integrations in LAZY_MODULES load on first use, never at startup
+        assert eager == [], f"imported at startup: {', '.join(eager)}"
+        samples.append(wall_ms)
+
+    median_ms = statistics.median(samples)
+    assert median_ms <= IMPORT_BUDGET_MS, f"median import {median_ms:.1f} ms exceeds {IMPORT_BUDGET_MS:.0f} ms"
@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from metrics import Metrics, MetricsMiddleware, MongoCommandMetrics
+
+from .test_api import create_vet
+
+
+def samples(text: str, name: str) -> dict:
+    """label text -> value for every sample of one metric"""
+    found = {}
+    for line in text.splitlines():
+        if line.startswith(name + "{"):
+            labels, value = line[len(name) + 1:].rsplit("} ", 1)
+            found[labels] = float(value)
+    return found
+
+
+def test_requests_are_labelled_by_route_template(client):
+    _, vet = create_vet(client)
+    assert client.get(f"/api/vets/{vet['user_id']}").status_code == 200
+    assert client.get("/api/vets/user_missing").status_code == 404
+    client.get("/api/no/such/path")
+
+    text = client.get("/metrics").text
+    requests = samples(text, "http_requests_total")
+    assert requests['method="GET",route="/api/vets/{vet_id}",status="200"'] >= 1
+    assert requests['method="GET",route="/api/vets/{vet_id}",status="404"'] >= 1
+    assert any('route="<unmatched>"' in labels for labels in requests)
+    assert vet["user_id"] not in text and "user_missing" not in text
+
+
+def test_latency_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    series = metrics.series({"method": "GET", "route": SimpleNamespace(path="/api/things")})
+    for seconds in (0.003, 0.004, 0.03, 3.0, 60.0):
+        series.observe(200, seconds)
+
+    text = metrics.render()
+    buckets = samples(text, "http_request_duration_seconds_bucket")
+    prefix = 'method="GET",route="/api/things",'
+    assert [buckets[prefix + f'le="{bound}"'] for bound in ("0.005", "0.01", "0.05", "2.5", "5", "10", "+Inf")] == [2, 2, 3, 3, 4, 4, 5]
+    assert samples(text, "http_request_duration_seconds_count")['method="GET",route="/api/things"'] == 5
+    assert samples(text, "http_request_duration_seconds_sum")['method="GET",route="/api/things"'] == pytest.approx(63.037)
+
+
+@pytest.mark.anyio
+async def test_mongo_commands_are_charged_to_the_request_that_ran_them():
+    metrics = Metrics()
+    listener = MongoCommandMetrics(metrics)
+
+    def command(name, micros, failed=False):
+        event = SimpleNamespace(command_name=name, duration_micros=micros)
+        (listener.failed if failed else listener.succeeded)(event)
+
+    async def app(scope, receive, send):
+        scope["route"] = SimpleNamespace(path="/api/things/{thing_id}")
+        # Motor runs commands on executor threads with the request's context
+        await asyncio.to_thread(command, "find", 2000)
+        await asyncio.to_thread(command, "update", 1000, True)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    middleware = MetricsMiddleware(app, metrics)
+    await middleware({"type": "http", "method": "PATCH", "path": "/api/things/thing_1"}, None, send)
+    # Outside any request, e.g. a dispatch sweep
+    await asyncio.to_thread(command, "find", 5000)
+
+    text = metrics.render()
+    counts = samples(text, "mongodb_command_duration_seconds_count")
+    seconds = samples(text, "mongodb_command_duration_seconds_sum")
+    request_labels = 'method="PATCH",route="/api/things/{thing_id}"'
+    assert counts[f'{request_labels},command="find"'] == 1
+    assert seconds[f'{request_labels},command="find"'] == pytest.approx(0.002)
+    assert samples(text, "mongodb_command_failures_total")[f'{request_labels},command="update"'] == 1
+    assert counts['method="",route="<background>",command="find"'] == 1
+    assert samples(text, "http_requests_total")[f'{request_labels},status="200"'] == 1
+    assert "thing_1" not in text
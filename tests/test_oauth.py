@@ -0,0 +1,45 @@
+import pytest
+from aiohttp.test_utils import TestServer
+
+from oauth import OAuthClient, OAuthSessionInvalid, OAuthUnavailable
+from oauth_standin import STATS, SESSION_DATA_PATH, create_app, session_data
+
+
+async def exchange(app, session_id, **options):
+    """Session data for the id from a stand-in running `app`, and the client used"""
+    server = TestServer(app)
+    await server.start_server()
+    client = OAuthClient(str(server.make_url(SESSION_DATA_PATH)), max_attempts=3, backoff_base=0.001, **options)
+    try:
+        return await client.get_session_data(session_id), client
+    finally:
+        await client.close()
+        await server.close()
+
+
+@pytest.mark.anyio
+async def test_retries_5xx_then_succeeds():
+    app = create_app(fail_first=2)
+    data, client = await exchange(app, "sess_1")
+
+    assert data == session_data("sess_1")
+    assert client.retries == 2
+    assert app[STATS]["received"] == 3
+
+
+@pytest.mark.anyio
+async def test_rejected_session_is_not_retried():
+    app = create_app()
+    with pytest.raises(OAuthSessionInvalid):
+        await exchange(app, "invalid_1")
+
+    assert app[STATS]["received"] == 1
+
+
+@pytest.mark.anyio
+async def test_unavailable_after_retries_run_out():
+    app = create_app(fail_rate=1.0)
+    with pytest.raises(OAuthUnavailable, match="503"):
+        await exchange(app, "sess_1")
+
+    assert app[STATS]["received"] == 3
@@ -0,0 +1,82 @@
+import pytest
+
+from passwords import PasswordHasher
+
+from .test_api import register
+
+
+def cost(hashed: str) -> int:
+    return int(hashed.split("$")[2])
+
+
+def login(client, email, password="secret-pw"):
+    return client.post("/api/auth/login", json={"email": email, "password": password})
+
+
+def test_full_hashing_pool_answers_429(client, monkeypatch):
+    import server
+
+    _, user = register(client)
+    rejected = server.password_hasher.rejected
+    monkeypatch.setattr(server.password_hasher, "max_pending", 0)
+
+    response = login(client, user["email"])
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    signup = client.post("/api/auth/register", json={
+        "email": "busy@example.com", "password": "x", "name": "Busy", "user_type": "pet_owner"
+    })
+    assert signup.status_code == 429
+    assert client.get("/api/health").json()["password_hasher"]["rejected"] == rejected + 2
+
+
+def test_login_rehashes_after_the_cost_is_raised(client, monkeypatch):
+    import server
+
+    _, user = register(client)
+    stored = server.repos.users._users[user["user_id"]]["password"]
+    monkeypatch.setattr(server.password_hasher, "rounds", cost(stored) + 1)
+
+    assert login(client, user["email"]).status_code == 200
+    rehashed = server.repos.users._users[user["user_id"]]["password"]
+    assert cost(rehashed) == cost(stored) + 1
+    # The new hash still verifies the same password
+    assert login(client, user["email"]).status_code == 200
+    assert login(client, user["email"], "wrong-pw").status_code == 401
+
+
+def test_lowering_the_cost_only_rehashes_with_downgrade(client, monkeypatch):
+    import server
+
+    _, user = register(client)
+    configured = server.password_hasher.rounds
+    # bcrypt's minimum is 4, so raise the stored cost first rather than going below it
+    monkeypatch.setattr(server.password_hasher, "rounds", configured + 1)
+    assert login(client, user["email"]).status_code == 200
+    stored = server.repos.users._users[user["user_id"]]["password"]
+    assert cost(stored) == configured + 1
+
+    monkeypatch.setattr(server.password_hasher, "rounds", configured)
+    server.password_hasher.verification_cache.clear()
+    assert login(client, user["email"]).status_code == 200
+    assert server.repos.users._users[user["user_id"]]["password"] == stored
+
+    monkeypatch.setattr(server.password_hasher, "downgrade", True)
+    server.password_hasher.verification_cache.clear()
+    assert login(client, user["email"]).status_code == 200
+    assert cost(server.repos.users._users[user["user_id"]]["password"]) == configured
+
+
+@pytest.mark.parametrize("rounds, downgrade, hashed, expected", [
+    (12, False, "$2b$10$abc", True),
+    (12, False, "$2b$12$abc", False),
+    (12, False, "$2b$14$abc", False),
+    (12, True, "$2b$14$abc", True),
+    (12, True, "not-a-bcrypt-hash", False),
+])
+def test_needs_rehash(rounds, downgrade, hashed, expected):
+    hasher = PasswordHasher(rounds=rounds, downgrade=downgrade)
+    try:
+        assert hasher.needs_rehash(hashed) is expected
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,139 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+import stripe
+from aiohttp.test_utils import TestServer
+
+import payments
+from payments import CheckoutStatusCache, PaymentClient
+from stripe_standin import PEERS, SESSIONS, create_app
+
+API_KEY = "sk_test_standin"
+
+
+@pytest.fixture
+def stripe_globals():
+    """PaymentClient.start configures the Stripe SDK globally; put it back afterwards"""
+    saved = (stripe.api_base, stripe.default_http_client, stripe.max_network_retries)
+    yield
+    stripe.api_base, stripe.default_http_client, stripe.max_network_retries = saved
+
+
+@pytest.fixture
+async def standin():
+    server = TestServer(create_app())
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+def test_stripe_is_imported_on_first_use():
+    code = (
+        "import sys, payments\n"
+        "client = payments.PaymentClient('sk_test')\n"
+        "assert 'stripe' not in sys.modules\n"
+        "client.start()\n"
+        "assert 'stripe' in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=Path(payments.__file__).parent, check=True)
+
+
+@pytest.mark.anyio
+async def test_async_calls_use_the_httpx_fallback(standin, stripe_globals):
+    client = PaymentClient(API_KEY, api_base=str(standin.make_url("")).rstrip("/"), max_retries=0)
+    client.start()
+    try:
+        assert stripe.default_http_client is client._http_client
+        assert isinstance(client._http_client, stripe.RequestsClient)
+
+        created = await asyncio.to_thread(
+            stripe.checkout.Session.create,
+            api_key=API_KEY,
+            mode="payment",
+            success_url="http://localhost/success",
+            metadata={"appointment_id": "apt_1"},
+            line_items=[{"price_data": {"currency": "usd", "unit_amount": 5000, "product_data": {"name": "Visit"}}, "quantity": 1}],
+        )
+        # RequestsClient has no async transport of its own; this goes through HTTPXClient
+        retrieved = await stripe.checkout.Session.retrieve_async(created.id, api_key=API_KEY)
+        assert retrieved.metadata["appointment_id"] == "apt_1"
+        assert retrieved.amount_total == 5000
+    finally:
+        await client.close()
+
+
+@pytest.mark.anyio
+async def test_sync_calls_reuse_pooled_connections(standin, stripe_globals):
+    client = PaymentClient(API_KEY, api_base=str(standin.make_url("")).rstrip("/"), max_retries=0)
+    client.start()
+    try:
+        for _ in range(3):
+            await asyncio.to_thread(stripe.checkout.Session.create, api_key=API_KEY, mode="payment")
+    finally:
+        await client.close()
+
+    assert len(standin.app[SESSIONS]) == 3
+    assert len(standin.app[PEERS]) == 1
+
+
+def test_checkout_clients_are_cached_per_webhook_url(stripe_globals):
+    pytest.importorskip("emergentintegrations.payments.stripe.checkout")
+    client = PaymentClient(API_KEY, max_clients=2)
+
+    first = client.checkout("https://api.example.com/webhook/a")
+    assert client.checkout("https://api.example.com/webhook/a") is first
+    assert client.checkout("https://api.example.com/webhook/b") is not first
+
+    # The least recently used client is dropped past max_clients
+    client.checkout("https://api.example.com/webhook/c")
+    assert client.checkout("https://api.example.com/webhook/a") is not first
+
+
+@pytest.mark.anyio
+async def test_status_lookup_survives_cancelled_leader():
+    cache = CheckoutStatusCache()
+    leader_started = asyncio.Event()
+    calls = []
+
+    async def fetch():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            leader_started.set()
+            await asyncio.sleep(60)
+        return "open"
+
+    leader = asyncio.create_task(cache.get("cs_1", fetch))
+    await leader_started.wait()
+    follower = asyncio.create_task(cache.get("cs_1", fetch))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    # The follower takes over the fetch instead of waiting forever
+    assert await asyncio.wait_for(follower, 1) == "open"
+    assert len(calls) == 2
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+@pytest.mark.anyio
+async def test_status_lookup_follower_can_be_cancelled():
+    cache = CheckoutStatusCache()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return "paid"
+
+    leader = asyncio.create_task(cache.get("cs_1", fetch))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(cache.get("cs_1", fetch))
+    await asyncio.sleep(0)
+
+    follower.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await follower
+    release.set()
+    assert await leader == "paid"
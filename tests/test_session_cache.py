@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+import session_cache
+from session_cache import SessionCache
+
+LATER = datetime.now(timezone.utc) + timedelta(days=1)
+
+
+def user(user_id: str) -> dict:
+    return {"user_id": user_id, "name": user_id}
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(session_cache.time, "monotonic", lambda: clock[0])
+    cache = SessionCache(ttl=60)
+    cache.set("tok_1", user("user_1"), LATER)
+
+    clock[0] += 59
+    assert cache.get("tok_1") == user("user_1")
+    clock[0] += 2
+    assert cache.get("tok_1") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_entries_never_outlive_the_session():
+    cache = SessionCache(ttl=60)
+    cache.set("tok_1", user("user_1"), datetime.now(timezone.utc) - timedelta(seconds=1))
+    assert cache.get("tok_1") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SessionCache(max_size=2)
+    cache.set("tok_1", user("user_1"), LATER)
+    cache.set("tok_2", user("user_2"), LATER)
+    # Reading tok_1 makes tok_2 the least recently used
+    assert cache.get("tok_1")
+    cache.set("tok_3", user("user_3"), LATER)
+
+    assert cache.get("tok_2") is None
+    assert cache.get("tok_1") and cache.get("tok_3")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_user_drops_all_their_tokens():
+    cache = SessionCache()
+    cache.set("tok_1", user("user_1"), LATER)
+    cache.set("tok_2", user("user_1"), LATER)
+    cache.set("tok_3", user("user_2"), LATER)
+
+    cache.invalidate_user("user_1")
+    assert cache.get("tok_1") is None and cache.get("tok_2") is None
+    assert cache.get("tok_3")
+
+
+def test_bearer_logout_ends_the_session(client):
+    import server
+
+    email = "logout_bearer@example.com"
+    registered = client.post("/api/auth/register", json={
+        "email": email, "password": "secret-pw", "name": "Logout", "user_type": "pet_owner"
+    }).json()
+    token = registered["session_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    assert server.session_cache.get(token)
+
+    assert client.post("/api/auth/logout", headers=headers).status_code == 200
+    assert server.session_cache.get(token) is None
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
@@ -0,0 +1,139 @@
+"""The emergency SSE feed, driven by calling the endpoint and reading its generator"""
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from .test_api import create_vet, register
+
+
+class FakeRequest:
+    cookies = {}
+
+    async def is_disconnected(self):
+        return False
+
+
+async def open_stream(headers=None, last_event_id=None, ticket=None):
+    import server
+
+    response = await server.stream_emergency_requests(
+        FakeRequest(), ticket=ticket, authorization=headers["Authorization"] if headers else None, last_event_id=last_event_id
+    )
+    stream = response.body_iterator
+    assert await anext(stream) == "retry: 2000\n\n"
+    return stream
+
+
+async def next_event(stream):
+    frame = await asyncio.wait_for(anext(stream), 1)
+    fields = dict(line.split(": ", 1) for line in frame.strip().split("\n"))
+    return fields["event"], json.loads(fields["data"])
+
+
+def emergency(request_id, owner_id, updated_at, **fields):
+    return {
+        "request_id": request_id,
+        "pet_owner_id": owner_id,
+        "location": "Westlands",
+        "description": "Limping",
+        "pet_name": "Rex",
+        "pet_type": "dog",
+        "status": "active",
+        "assigned_vet_id": None,
+        "dispatch_broadcast": True,
+        "notified_vet_ids": [],
+        "created_at": updated_at,
+        "updated_at": updated_at,
+        **fields,
+    }
+
+
+@pytest.mark.anyio
+async def test_new_requests_only_reach_notified_vets_until_broadcast(client):
+    import server
+
+    _, owner = register(client)
+    notified_headers, notified = create_vet(client)
+    other_headers, _ = create_vet(client)
+    notified_stream = await open_stream(notified_headers)
+    other_stream = await open_stream(other_headers)
+    try:
+        targeted = emergency("emr_sse_targeted", owner["user_id"], "2100-01-01T00:00:00+00:00",
+                             dispatch_broadcast=False, notified_vet_ids=[notified["user_id"]])
+        broadcast = emergency("emr_sse_broadcast", owner["user_id"], "2100-01-01T00:00:01+00:00")
+        await server.publish_emergency_event(dict(targeted))
+        await server.publish_emergency_event(dict(broadcast))
+        # Status changes go to everyone, so dashboards can drop the request
+        await server.publish_emergency_event({**targeted, "status": "accepted", "updated_at": "2100-01-01T00:00:02+00:00"})
+
+        received = [await next_event(notified_stream) for _ in range(3)]
+        assert [(kind, data["request_id"]) for kind, data in received] == [
+            ("created", "emr_sse_targeted"), ("created", "emr_sse_broadcast"), ("accepted", "emr_sse_targeted")
+        ]
+        assert not any(key.startswith("dispatch_") or key == "notified_vet_ids" for _, data in received for key in data)
+
+        received = [await next_event(other_stream) for _ in range(2)]
+        assert [(kind, data["request_id"]) for kind, data in received] == [
+            ("created", "emr_sse_broadcast"), ("accepted", "emr_sse_targeted")
+        ]
+    finally:
+        await notified_stream.aclose()
+        await other_stream.aclose()
+
+
+@pytest.mark.anyio
+async def test_last_event_id_replays_every_change_since(client, monkeypatch):
+    import server
+
+    # Several replay pages for a handful of requests
+    monkeypatch.setattr(server, "EMERGENCY_REPLAY_PAGE_SIZE", 2)
+    _, owner = register(client)
+    vet_headers, _ = create_vet(client)
+    # Later than anything else the session writes, so the replay holds only these
+    request_ids = [f"emr_sse_replay{i}" for i in range(6)]
+    for i, request_id in enumerate(request_ids):
+        await server.repos.emergencies.insert(emergency(request_id, owner["user_id"], f"2200-01-01T00:00:0{i}+00:00"))
+    first = server.emergency_event(await server.repos.emergencies.get(request_ids[0]))
+
+    stream = await open_stream(vet_headers, last_event_id=first["id"])
+    try:
+        replayed = [await next_event(stream) for _ in request_ids[1:]]
+        assert [data["request_id"] for _, data in replayed] == request_ids[1:]
+        assert {data["owner_name"] for _, data in replayed} == {owner["name"]}
+    finally:
+        await stream.aclose()
+
+
+@pytest.mark.anyio
+async def test_only_vets_may_follow_the_stream(client):
+    owner_headers, _ = register(client)
+    with pytest.raises(HTTPException) as rejected:
+        await open_stream(owner_headers)
+    assert rejected.value.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_stream_tickets_are_single_use(client, monkeypatch):
+    import server
+
+    vet_headers, _ = create_vet(client)
+    owner_headers, _ = register(client)
+    assert client.post("/api/emergency/stream/ticket", headers=owner_headers).status_code == 403
+    assert client.post("/api/emergency/stream/ticket").status_code == 401
+
+    ticket = client.post("/api/emergency/stream/ticket", headers=vet_headers).json()["ticket"]
+    stream = await open_stream(ticket=ticket)
+    await stream.aclose()
+    with pytest.raises(HTTPException):
+        await open_stream(ticket=ticket)
+
+    # A session token is not a ticket
+    with pytest.raises(HTTPException):
+        await open_stream(ticket=vet_headers["Authorization"].removeprefix("Bearer "))
+
+    monkeypatch.setattr(server, "STREAM_TICKET_SECONDS", -1)
+    expired = client.post("/api/emergency/stream/ticket", headers=vet_headers).json()["ticket"]
+    with pytest.raises(HTTPException):
+        await open_stream(ticket=expired)
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from memory_repositories import MemoryPaymentRepository
+from webhooks import WebhookProcessor
+
+
+class FlakyPaymentRepository(MemoryPaymentRepository):
+    """Fails the first status write with an error that is not a PyMongoError"""
+
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    async def set_event_fields(self, event_id, fields):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("ledger write failed")
+        await super().set_event_fields(event_id, fields)
+
+
+@pytest.mark.anyio
+async def test_worker_survives_errors_and_sweeper_retries():
+    payments = FlakyPaymentRepository()
+    handled = []
+
+    async def handler(event):
+        handled.append(event["event_id"])
+
+    processor = WebhookProcessor(payments, handler, workers=1, sweep_interval=0.01, stale_after=0)
+    await processor.start()
+    try:
+        assert await processor.receive({"event_id": "evt_1"})
+        assert await processor.receive({"event_id": "evt_2"})
+        for _ in range(200):
+            if all(event["status"] == "processed" for event in payments._events.values()):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await processor.stop()
+
+    assert {event["status"] for event in payments._events.values()} == {"processed"}
+    # evt_1's handler ran again after its claim went stale
+    assert handled.count("evt_1") == 2
+    assert handled.count("evt_2") == 1
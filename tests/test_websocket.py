@@ -0,0 +1,61 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from .test_api import create_vet, register
+
+
+def open_chat(client):
+    owner, _ = register(client)
+    vet, vet_user = create_vet(client)
+    chat_id = client.post("/api/chats", headers=owner, params={"vet_id": vet_user["user_id"]}).json()["chat_id"]
+    return owner, vet, chat_id
+
+
+def token(headers) -> str:
+    return headers["Authorization"].removeprefix("Bearer ")
+
+
+def send(client, headers, chat_id, content) -> str:
+    return client.post("/api/messages", headers=headers, json={"chat_id": chat_id, "content": content}).json()["message_id"]
+
+
+def test_unauthenticated_and_outside_users_are_rejected(client):
+    _, _, chat_id = open_chat(client)
+    stranger, _ = register(client)
+
+    for query, code in (("", 4401), ("?token=bogus", 4401), (f"?token={token(stranger)}", 4403)):
+        with client.websocket_connect(f"/api/ws/chats/{chat_id}{query}") as websocket:
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+        assert closed.value.code == code
+
+
+def test_messages_fan_out_to_both_participants(client):
+    owner, vet, chat_id = open_chat(client)
+
+    with client.websocket_connect(f"/api/ws/chats/{chat_id}?token={token(owner)}") as owner_socket, \
+            client.websocket_connect(f"/api/ws/chats/{chat_id}?token={token(vet)}") as vet_socket:
+        owner_socket.send_json({"content": "hello over the socket"})
+        from_socket = [socket.receive_json() for socket in (owner_socket, vet_socket)]
+        message_id = send(client, vet, chat_id, "hello over http")
+        from_http = [socket.receive_json() for socket in (owner_socket, vet_socket)]
+
+    assert [event["message"]["content"] for event in from_socket] == ["hello over the socket"] * 2
+    assert [event["message"]["message_id"] for event in from_http] == [message_id] * 2
+    assert from_http[0]["message"]["sender_id"] != from_socket[0]["message"]["sender_id"]
+
+
+def test_reconnect_replays_every_missed_message(client, monkeypatch):
+    import server
+
+    # Several replay pages for a handful of messages
+    monkeypatch.setattr(server, "REPLAY_PAGE_SIZE", 2)
+    owner, vet, chat_id = open_chat(client)
+    sent = [send(client, owner, chat_id, f"message {i}") for i in range(7)]
+
+    with client.websocket_connect(f"/api/ws/chats/{chat_id}?token={token(vet)}&last_message_id={sent[1]}") as websocket:
+        replayed = [websocket.receive_json()["message"]["message_id"] for _ in sent[2:]]
+        live = send(client, owner, chat_id, "after the replay")
+        assert websocket.receive_json()["message"]["message_id"] == live
+
+    assert replayed == sent[2:]
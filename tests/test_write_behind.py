@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from memory_repositories import MemoryChatRepository
+from write_behind import LastMessageBuffer
+
+
+class FlakyChatRepository(MemoryChatRepository):
+    """Fails the first `failures` summary writes with an error that is not a PyMongoError"""
+
+    def __init__(self, failures: int = 1):
+        super().__init__()
+        self.failures = failures
+        self.writes = []
+
+    async def set_last_messages(self, summaries):
+        self.writes.append(dict(summaries))
+        if self.failures:
+            self.failures -= 1
+            raise ValueError("summary write failed")
+        await super().set_last_messages(summaries)
+
+
+async def add_chat(chats, chat_id: str, last_message_at=None):
+    await chats.insert({
+        "chat_id": chat_id,
+        "pet_owner_id": f"owner_{chat_id}",
+        "vet_id": "vet_1",
+        "last_message": "stored" if last_message_at else None,
+        "last_message_at": last_message_at,
+        "created_at": "2024-01-01T00:00:00+00:00",
+    })
+
+
+@pytest.mark.anyio
+async def test_messages_coalesce_into_one_write_per_chat():
+    chats = FlakyChatRepository(failures=0)
+    await add_chat(chats, "chat_1")
+    buffer = LastMessageBuffer(chats)
+
+    buffer.record("chat_1", "first", "2024-01-01T10:00:00")
+    buffer.record("chat_1", "third", "2024-01-01T10:00:02")
+    # Out of order: older than what is already pending
+    buffer.record("chat_1", "second", "2024-01-01T10:00:01")
+
+    assert buffer.overlay([{"chat_id": "chat_1", "last_message_at": None}])[0]["last_message"] == "third"
+    assert await buffer.flush() == 1
+    assert chats.writes == [{"chat_1": ("third", "2024-01-01T10:00:02")}]
+    assert buffer.stats()["coalesced"] == 2
+
+
+@pytest.mark.anyio
+async def test_older_summaries_never_overwrite_newer_ones():
+    chats = FlakyChatRepository(failures=0)
+    await add_chat(chats, "chat_1", last_message_at="2024-01-01T12:00:00")
+    buffer = LastMessageBuffer(chats)
+
+    # Another worker already stored a newer message
+    buffer.record("chat_1", "late", "2024-01-01T11:00:00")
+    await buffer.flush()
+
+    chat = await chats.get("chat_1")
+    assert (chat["last_message"], chat["last_message_at"]) == ("stored", "2024-01-01T12:00:00")
+
+
+@pytest.mark.anyio
+async def test_stop_flushes_pending_summaries():
+    chats = FlakyChatRepository(failures=0)
+    await add_chat(chats, "chat_1")
+    buffer = LastMessageBuffer(chats, interval=60)
+    await buffer.start()
+
+    buffer.record("chat_1", "bye", "2024-01-01T10:00:00")
+    await buffer.stop()
+
+    assert (await chats.get("chat_1"))["last_message"] == "bye"
+    assert buffer.stats()["pending"] == 0
+
+
+@pytest.mark.anyio
+async def test_flusher_survives_a_failed_write():
+    chats = FlakyChatRepository(failures=1)
+    await add_chat(chats, "chat_1")
+    await add_chat(chats, "chat_2")
+    buffer = LastMessageBuffer(chats, interval=0.01)
+    await buffer.start()
+    try:
+        buffer.record("chat_1", "kept", "2024-01-01T10:00:00")
+        buffer.record("chat_2", "old", "2024-01-01T10:00:00")
+        for _ in range(100):
+            if chats.writes:
+                break
+            await asyncio.sleep(0.005)
+        # Arrived while the failed batch was out; the newer entry wins the merge
+        buffer.record("chat_2", "new", "2024-01-01T10:00:05")
+        for _ in range(200):
+            if (await chats.get("chat_1"))["last_message"] == "kept":
+                break
+            await asyncio.sleep(0.005)
+        task = buffer._task
+    finally:
+        await buffer.stop()
+
+    assert task.cancelled()
+    assert (await chats.get("chat_1"))["last_message"] == "kept"
+    assert (await chats.get("chat_2"))["last_message"] == "new"